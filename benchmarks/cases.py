@@ -0,0 +1,74 @@
+﻿from __future__ import annotations
+
+from collections import Counter
+
+from benchmarks.dataset import BASE_DATE, Dataset
+from benchmarks.runner import BenchCase
+from services.billing_service import BillingService
+from services.export_import_service import ExportImportService
+from services.forecast_service import ForecastService
+from services.manual_service import ManualService
+from services.server_service import ServerService
+
+
+def busiest_owner(dataset: Dataset) -> int:
+    return Counter(row["owner_telegram_id"] for row in dataset.servers).most_common(1)[0][0]
+
+
+async def build_cases(
+    dataset: Dataset,
+    servers: ServerService,
+    billing: BillingService,
+    manuals: ManualService,
+    export_import: ExportImportService,
+    forecast: ForecastService,
+    iterations: int,
+) -> list[BenchCase]:
+    owner = busiest_owner(dataset)
+    owned = dataset.servers_of(owner)
+    server_id = str(owned[len(owned) // 2]["id"])
+    name_fragment = owned[0]["name"].split("-")[1]
+
+    first_page = await servers.list_servers_page(owner)
+    second_cursor = first_page.next_cursor
+
+    async def export_and_drop() -> None:
+        export = await export_import.export_to_file(owner)
+        export.path.unlink(missing_ok=True)
+
+    # Повторный импорт собственного экспорта идемпотентен: серверы и мануалы
+    # обновляются, дубли оплат пропускаются — данные между итерациями не растут.
+    export = await export_import.export_to_file(owner)
+    try:
+        bundle = export.path.read_bytes()
+    finally:
+        export.path.unlink(missing_ok=True)
+
+    heavy = max(1, iterations // 10)
+    return [
+        BenchCase("servers.list_servers_page", lambda: servers.list_servers_page(owner, with_total=True), iterations),
+        BenchCase("servers.list_servers_page.next", lambda: servers.list_servers_page(owner, second_cursor), iterations),
+        BenchCase("servers.list_servers.search", lambda: servers.list_servers(owner, search=name_fragment), iterations),
+        BenchCase("servers.search_servers", lambda: servers.search_servers(owner, name_fragment), iterations),
+        BenchCase("servers.get_server", lambda: servers.get_server(owner, server_id), iterations),
+        BenchCase("servers.get_server_detail", lambda: servers.get_server_detail(owner, server_id), iterations),
+        BenchCase("billing.list_expiring", lambda: billing.list_expiring(owner, 30), iterations),
+        BenchCase("billing.monthly_summary", lambda: billing.monthly_summary(owner, BASE_DATE), iterations),
+        BenchCase("billing.spending_trend", lambda: billing.spending_trend(owner, target_date=BASE_DATE), iterations),
+        BenchCase(
+            "billing.spending_breakdown.provider",
+            lambda: billing.spending_breakdown(owner, "provider", target_date=BASE_DATE),
+            iterations,
+        ),
+        BenchCase("forecast.owner", lambda: forecast.forecast(owner, today=BASE_DATE), iterations),
+        BenchCase("forecast.fleet", lambda: forecast.forecast(None, 12, today=BASE_DATE), heavy),
+        BenchCase("manuals.list_categories", lambda: manuals.list_categories(owner), iterations),
+        BenchCase("manuals.list_manuals", lambda: manuals.list_manuals(owner), iterations),
+        BenchCase("manuals.search_manuals", lambda: manuals.search_manuals(owner, "nginx dock"), iterations),
+        BenchCase("export.export_to_file", export_and_drop, heavy),
+        BenchCase(
+            "export.import_bundle",
+            lambda: export_import.import_bundle(owner, export.filename, bundle),
+            heavy,
+        ),
+    ]
@@ -0,0 +1,176 @@
+﻿from __future__ import annotations
+
+import hashlib
+import json
+import random
+import uuid
+from dataclasses import dataclass, field, replace
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from crypto.secrets import SecretCipher
+from db.models import Billing, Manual, ManualCategory, ManualTag, SecretType, Server, ServerRole, ServerTag
+from services.billing_service import rebuild_spending_rollup, refresh_next_expiry
+from services.manual_service import refresh_search_vectors
+
+SEED_CHUNK_SIZE = 2000
+BASE_DATE = date(2025, 1, 1)
+
+PROVIDERS = ("hetzner", "aeza", "timeweb", "selectel", "vultr", "digitalocean", "ovh", "contabo")
+LOCATIONS = ("fra", "ams", "hel", "msk", "spb", "nyc", "sgp", "waw")
+TAGS = ("prod", "stage", "eu", "ru", "us", "asia", "reality", "ws", "grpc", "backup", "monitoring", "legacy")
+WORDS = (
+    "nginx", "xray", "docker", "postgres", "ssh", "firewall", "certbot", "systemd", "backup", "restore",
+    "upgrade", "kernel", "iptables", "reality", "panel", "bridge", "cron", "logrotate", "swap", "dns",
+)
+CURRENCIES = ("RUB", "RUB", "RUB", "USD", "EUR")
+PERIODS = (("1m", 30), ("3m", 90), ("6m", 180), ("12m", 365))
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    owners: int = 20
+    servers: int = 10_000
+    billings: int = 100_000
+    manuals: int = 5_000
+    seed: int = 42
+
+    def scaled(self, factor: float) -> DatasetSpec:
+        return replace(
+            self,
+            servers=max(1, int(self.servers * factor)),
+            billings=max(1, int(self.billings * factor)),
+            manuals=max(1, int(self.manuals * factor)),
+        )
+
+
+@dataclass
+class Dataset:
+    spec: DatasetSpec
+    owner_ids: list[int]
+    servers: list[dict] = field(default_factory=list)
+    server_tags: list[dict] = field(default_factory=list)
+    billings: list[dict] = field(default_factory=list)
+    manuals: list[dict] = field(default_factory=list)
+    manual_tags: list[list[str]] = field(default_factory=list)
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for section in (self.servers, self.server_tags, self.billings, self.manuals, self.manual_tags):
+            digest.update(json.dumps(section, default=str, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def servers_of(self, owner_id: int) -> list[dict]:
+        return [row for row in self.servers if row["owner_telegram_id"] == owner_id]
+
+
+def generate(spec: DatasetSpec) -> Dataset:
+    rng = random.Random(spec.seed)
+    owner_ids = [100_000 + index for index in range(spec.owners)]
+    dataset = Dataset(spec=spec, owner_ids=owner_ids)
+
+    roles = list(ServerRole)
+    for index in range(spec.servers):
+        server_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        provider = rng.choice(PROVIDERS)
+        dataset.servers.append(
+            {
+                "id": server_id,
+                # Распределение владельцев неравномерное: у первых — основная часть серверов.
+                "owner_telegram_id": owner_ids[min(int(rng.paretovariate(1.2)) - 1, spec.owners - 1)],
+                "name": f"{rng.choice(LOCATIONS)}-{provider}-{index:05d}",
+                "role": rng.choice(roles),
+                "provider": provider,
+                "ip4": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+                "domain": f"n{index}.example.net" if rng.random() < 0.4 else None,
+                "ssh_port": rng.choice((22, 22, 22, 2222)),
+                "ssh_user": rng.choice(("root", "admin", "ops")),
+                "secret_type": SecretType.PASSWORD if rng.random() < 0.3 else SecretType.NONE,
+                "notes": " ".join(rng.sample(WORDS, rng.randint(0, 4))),
+                "is_favorite": rng.random() < 0.05,
+            }
+        )
+        for tag in rng.sample(TAGS, rng.randint(0, 3)):
+            dataset.server_tags.append({"server_id": server_id, "tag": tag})
+
+    for _ in range(spec.billings):
+        server = rng.choice(dataset.servers)
+        period, days = rng.choice(PERIODS)
+        paid_at = BASE_DATE + timedelta(days=rng.randint(0, 730))
+        dataset.billings.append(
+            {
+                "server_id": server["id"],
+                "paid_at": paid_at,
+                "expires_at": paid_at + timedelta(days=days),
+                "price_amount": Decimal(rng.randint(200, 20_000)) / 100 * (days // 30),
+                "price_currency": rng.choice(CURRENCIES),
+                "period": period,
+                "comment": None,
+            }
+        )
+
+    categories = list(ManualCategory)
+    for index in range(spec.manuals):
+        words = rng.sample(WORDS, 4)
+        body = "\n".join(
+            f"{step}. {' '.join(rng.choices(WORDS, k=8))}\n`{rng.choice(WORDS)} --{rng.choice(WORDS)}`"
+            for step in range(1, rng.randint(3, 12))
+        )
+        dataset.manuals.append(
+            {
+                "owner_telegram_id": rng.choice(owner_ids),
+                "title": f"{words[0]} {words[1]} #{index}",
+                "category": rng.choice(categories),
+                "body_markdown": body,
+            }
+        )
+        dataset.manual_tags.append(rng.sample(TAGS, rng.randint(0, 3)))
+    return dataset
+
+
+def _chunks(rows: list, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+async def seed(
+    session_factory: async_sessionmaker[AsyncSession],
+    dataset: Dataset,
+    cipher: SecretCipher,
+    chunk_size: int = SEED_CHUNK_SIZE,
+) -> None:
+    async with session_factory() as session:
+        for chunk in _chunks(dataset.servers, chunk_size):
+            rows = [
+                {
+                    **row,
+                    "secret_encrypted": cipher.encrypt(f"pw-{row['name']}")
+                    if row["secret_type"] == SecretType.PASSWORD
+                    else None,
+                }
+                for row in chunk
+            ]
+            await session.execute(insert(Server), rows)
+        for chunk in _chunks(dataset.server_tags, chunk_size):
+            await session.execute(insert(ServerTag), chunk)
+        for chunk in _chunks(dataset.billings, chunk_size):
+            await session.execute(insert(Billing), chunk)
+
+        for manuals, tags in zip(_chunks(dataset.manuals, chunk_size), _chunks(dataset.manual_tags, chunk_size)):
+            manual_ids = list(
+                await session.scalars(insert(Manual).returning(Manual.id, sort_by_parameter_order=True), manuals)
+            )
+            tag_rows = [
+                {"manual_id": manual_id, "tag": tag} for manual_id, manual_tags in zip(manual_ids, tags) for tag in manual_tags
+            ]
+            if tag_rows:
+                await session.execute(insert(ManualTag), tag_rows)
+            await refresh_search_vectors(session, manual_ids)
+
+        for chunk in _chunks(dataset.servers, chunk_size):
+            await refresh_next_expiry(session, [row["id"] for row in chunk])
+        await rebuild_spending_rollup(session)
+        await session.commit()
@@ -0,0 +1,253 @@
+﻿from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import InlineKeyboardMarkup, Message, Update
+
+from benchmarks.runner import percentile
+
+logger = logging.getLogger(__name__)
+
+REPLAY_TOKEN = "42:REPLAY"
+
+
+@dataclass
+class RecordedCall:
+    method: str
+    chat_id: int | None
+    payload: dict[str, Any]
+
+
+class RecordingSession(BaseSession):
+    # Ничего не отправляет: запоминает вызовы и отвечает правдоподобным результатом,
+    # чтобы обработчики шли тем же путём, что и с настоящим Bot API.
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: list[RecordedCall] = []
+        self.messages: dict[int, dict[int, Message]] = {}
+        self._message_ids = itertools.count(1_000_000)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+        payload = method.model_dump(exclude_none=True)
+        chat_id = payload.get("chat_id")
+        self.calls.append(RecordedCall(method.__api_method__, chat_id, payload))
+
+        if method.__api_method__.startswith("edit") and isinstance(chat_id, int):
+            current = self.messages.get(chat_id, {}).get(payload.get("message_id"))
+            if current is None:
+                return True
+            updated = current.model_copy(
+                update={
+                    "text": payload.get("text", current.text),
+                    "reply_markup": _inline_markup(payload.get("reply_markup")),
+                }
+            )
+            self.messages[chat_id][updated.message_id] = updated
+            return updated
+        if method.__returning__ is Message and isinstance(chat_id, int):
+            message = Message.model_validate(
+                {
+                    "message_id": self.next_message_id(),
+                    "date": datetime.now(timezone.utc),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": payload.get("text") or payload.get("caption") or "",
+                    "reply_markup": _inline_markup(payload.get("reply_markup")),
+                },
+                context={"bot": bot},
+            )
+            self.messages.setdefault(chat_id, {})[message.message_id] = message
+            return message
+        return True
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        return None
+
+
+def _inline_markup(raw: Any) -> InlineKeyboardMarkup | None:
+    if isinstance(raw, dict) and "inline_keyboard" in raw:
+        return InlineKeyboardMarkup.model_validate(raw)
+    return None
+
+
+@dataclass
+class ReplayStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    started: float = 0.0
+    finished: float = 0.0
+
+    def summary(self) -> dict[str, float]:
+        elapsed = self.finished - self.started
+        return {
+            "updates": len(self.latencies),
+            "errors": self.errors,
+            "updates_per_sec": round(len(self.latencies) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(self.latencies, 0.5) * 1000, 3),
+            "p95_ms": round(percentile(self.latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(self.latencies, 0.99) * 1000, 3),
+        }
+
+
+class ReplayClient:
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, session: RecordingSession, user_id: int, stats: ReplayStats):
+        self._dispatcher = dispatcher
+        self._bot = bot
+        self._session = session
+        self._stats = stats
+        self.user_id = user_id
+        self._update_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+    def _user(self) -> dict[str, Any]:
+        return {"id": self.user_id, "is_bot": False, "first_name": f"replay{self.user_id}"}
+
+    async def feed(self, raw: dict[str, Any]) -> None:
+        update = Update.model_validate({"update_id": next(self._update_ids), **raw}, context={"bot": self._bot})
+        started = time.perf_counter()
+        try:
+            await self._dispatcher.feed_update(self._bot, update)
+        except Exception:  # noqa: BLE001
+            self._stats.errors += 1
+            logger.exception("Replay: ошибка обработки апдейта пользователя %s", self.user_id)
+        finally:
+            self._stats.latencies.append(time.perf_counter() - started)
+
+    async def send(self, text: str) -> None:
+        await self.feed(
+            {
+                "message": {
+                    "message_id": self._session.next_message_id(),
+                    "date": int(time.time()),
+                    "chat": {"id": self.user_id, "type": "private"},
+                    "from": self._user(),
+                    "text": text,
+                }
+            }
+        )
+
+    def find_button(self, data: str | None = None, prefix: str | None = None, text: str | None = None):
+        messages = self._session.messages.get(self.user_id, {})
+        for message_id in sorted(messages, reverse=True):
+            markup = messages[message_id].reply_markup
+            if markup is None:
+                continue
+            for row in markup.inline_keyboard:
+                for button in row:
+                    callback = button.callback_data or ""
+                    if (
+                        (data is not None and callback == data)
+                        or (prefix is not None and callback.startswith(prefix))
+                        or (text is not None and button.text == text)
+                    ):
+                        return messages[message_id], callback
+        return None, None
+
+    async def click(self, data: str | None = None, prefix: str | None = None, text: str | None = None) -> bool:
+        message, callback = self.find_button(data=data, prefix=prefix, text=text)
+        if message is None or callback == "noop":
+            return False
+        await self.feed(
+            {
+                "callback_query": {
+                    "id": f"{self.user_id}-{next(self._callback_ids)}",
+                    "chat_instance": str(self.user_id),
+                    "from": self._user(),
+                    "message": message.model_dump(mode="json", exclude_none=True),
+                    "data": callback,
+                }
+            }
+        )
+        return True
+
+
+Scenario = Callable[[ReplayClient, int], Awaitable[None]]
+
+LIST_PAGES = 5
+
+
+async def list_paging(client: ReplayClient, _round: int) -> None:
+    await client.send("📦 VPS")
+    await client.click(data="vps:list:")
+    for _ in range(LIST_PAGES):
+        if not await client.click(text="➡️"):
+            break
+
+
+async def add_server_flow(client: ReplayClient, round_number: int) -> None:
+    answers = [
+        f"replay-{client.user_id}-{round_number}",
+        "hetzner",
+        f"192.0.2.{round_number % 250 + 1}",
+        "-",
+        "root",
+        "none",
+        "-",
+        "2025-01-01",
+        "2025-02-01",
+        "10 EUR",
+    ]
+    await client.send("/add_server")
+    for answer in answers:
+        await client.send(answer)
+    await client.click(data="vps:add:confirm")
+    # Удаляем созданный сервер, чтобы повторные прогоны шли на тех же данных.
+    if await client.click(prefix="vps:delete_ask:"):
+        await client.click(prefix="vps:delete_confirm:")
+
+
+async def manual_search(client: ReplayClient, round_number: int) -> None:
+    queries = ("nginx", "docker post", "backup restore", "xray reality", "firewall")
+    await client.send("📚 База знаний")
+    await client.click(data="manual:search")
+    await client.send(queries[round_number % len(queries)])
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "list_paging": list_paging,
+    "add_server": add_server_flow,
+    "manual_search": manual_search,
+}
+
+
+async def run_scenario(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    session: RecordingSession,
+    scenario: Scenario,
+    user_ids: list[int],
+    rounds: int,
+) -> ReplayStats:
+    stats = ReplayStats()
+
+    async def drive(user_id: int) -> None:
+        client = ReplayClient(dispatcher, bot, session, user_id, stats)
+        for round_number in range(rounds):
+            await scenario(client, round_number)
+
+    stats.started = time.perf_counter()
+    await asyncio.gather(*(drive(user_id) for user_id in user_ids))
+    stats.finished = time.perf_counter()
+    return stats
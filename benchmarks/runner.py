@@ -0,0 +1,111 @@
+﻿from __future__ import annotations
+
+import json
+import math
+import platform
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from db.instrumentation import track_queries
+
+DEFAULT_TOLERANCE = 0.2
+
+
+@dataclass
+class BenchCase:
+    name: str
+    call: Callable[[], Awaitable[object]]
+    iterations: int = 50
+
+
+@dataclass
+class BenchResult:
+    name: str
+    iterations: int
+    ops_per_sec: float
+    p50_ms: float
+    p95_ms: float
+    queries_per_call: float
+
+
+@dataclass
+class Regression:
+    name: str
+    metric: str
+    baseline: float
+    current: float
+
+    def describe(self) -> str:
+        return f"{self.name}: {self.metric} {self.baseline:g} -> {self.current:g}"
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    # Ближайший ранг: при малом числе итераций интерполяция только маскирует выбросы.
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+async def measure(case: BenchCase, warmup: int = 3) -> BenchResult:
+    for _ in range(warmup):
+        await case.call()
+
+    timings: list[float] = []
+    queries = 0
+    for _ in range(case.iterations):
+        with track_queries(case.name) as stats:
+            started = time.perf_counter()
+            await case.call()
+            timings.append(time.perf_counter() - started)
+        queries += stats.queries
+
+    total = sum(timings)
+    return BenchResult(
+        name=case.name,
+        iterations=case.iterations,
+        ops_per_sec=round(case.iterations / total, 2) if total else 0.0,
+        p50_ms=round(percentile(timings, 0.5) * 1000, 3),
+        p95_ms=round(percentile(timings, 0.95) * 1000, 3),
+        queries_per_call=round(queries / case.iterations, 2),
+    )
+
+
+def build_report(results: list[BenchResult], meta: dict) -> dict:
+    return {
+        "meta": {
+            **meta,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+        },
+        "results": {result.name: asdict(result) for result in results},
+    }
+
+
+def write_report(path: Path, report: dict) -> None:
+    path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+
+def load_report(path: Path) -> dict:
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def compare(baseline: dict, current: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[Regression]:
+    regressions: list[Regression] = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        if now["ops_per_sec"] < before["ops_per_sec"] * (1 - tolerance):
+            regressions.append(Regression(name, "ops_per_sec", before["ops_per_sec"], now["ops_per_sec"]))
+        if now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(Regression(name, "p95_ms", before["p95_ms"], now["p95_ms"]))
+        # Число запросов детерминировано набором данных — любой рост означает изменение кода.
+        if now["queries_per_call"] > before["queries_per_call"]:
+            regressions.append(
+                Regression(name, "queries_per_call", before["queries_per_call"], now["queries_per_call"])
+            )
+    return regressions
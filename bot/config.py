@@ -1,9 +1,16 @@
 ﻿from __future__ import annotations
 
+import re
 from functools import lru_cache
-from pydantic import Field, field_validator
+from typing import Literal
+
+from pydantic import Field, field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Соединения вне обработки апдейтов: LISTEN настроек, advisory-lock напоминаний,
+# потоковое чтение и захват напоминаний, задача планировщика удалений.
+DB_POOL_RESERVE = 5
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
@@ -14,6 +21,20 @@ class Settings(BaseSettings):
     admin_telegram_id: int = Field(alias="ADMIN_TELEGRAM_ID")
     secret_ttl_seconds: int = Field(default=45, alias="SECRET_TTL_SECONDS")
     notify_hour_utc: int = Field(default=9, alias="NOTIFY_HOUR_UTC")
+    run_mode: Literal["polling", "webhook"] = Field(default="polling", alias="BOT_RUN_MODE")
+    webhook_base_url: str | None = Field(default=None, alias="WEBHOOK_BASE_URL")
+    webhook_path: str = Field(default="/telegram/webhook", alias="WEBHOOK_PATH")
+    webhook_host: str = Field(default="0.0.0.0", alias="WEBHOOK_HOST")
+    webhook_port: int = Field(default=8080, alias="WEBHOOK_PORT")
+    webhook_secret: str | None = Field(default=None, alias="WEBHOOK_SECRET")
+    webhook_max_concurrency: int = Field(default=32, alias="WEBHOOK_MAX_CONCURRENCY")
+    db_pool_size: int = Field(default=20, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=20, alias="DB_MAX_OVERFLOW")
+    fsm_storage: Literal["postgres", "redis", "memory"] = Field(default="postgres", alias="FSM_STORAGE")
+    fsm_redis_url: str | None = Field(default=None, alias="FSM_REDIS_URL")
+    fsm_state_ttl_seconds: int = Field(default=86400, alias="FSM_STATE_TTL_SECONDS")
+    metrics_host: str = Field(default="127.0.0.1", alias="METRICS_HOST")
+    metrics_port: int = Field(default=0, alias="METRICS_PORT")
 
     @field_validator("secret_ttl_seconds")
     @classmethod
@@ -29,6 +50,76 @@ class Settings(BaseSettings):
             raise ValueError("NOTIFY_HOUR_UTC должен быть в диапазоне 0..23")
         return value
 
+    @field_validator("webhook_path")
+    @classmethod
+    def validate_webhook_path(cls, value: str) -> str:
+        if not value.startswith("/"):
+            raise ValueError("WEBHOOK_PATH должен начинаться с '/'")
+        return value
+
+    @field_validator("webhook_secret")
+    @classmethod
+    def validate_webhook_secret(cls, value: str | None) -> str | None:
+        if value is not None and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", value):
+            raise ValueError("WEBHOOK_SECRET: 1..256 символов A-Z, a-z, 0-9, _ и -")
+        return value
+
+    @field_validator("webhook_max_concurrency")
+    @classmethod
+    def validate_webhook_concurrency(cls, value: int) -> int:
+        if value < 1 or value > 100:
+            raise ValueError("WEBHOOK_MAX_CONCURRENCY должен быть в диапазоне 1..100")
+        return value
+
+    @field_validator("db_pool_size")
+    @classmethod
+    def validate_db_pool_size(cls, value: int) -> int:
+        if value < 1 or value > 200:
+            raise ValueError("DB_POOL_SIZE должен быть в диапазоне 1..200")
+        return value
+
+    @field_validator("db_max_overflow")
+    @classmethod
+    def validate_db_max_overflow(cls, value: int) -> int:
+        if value < 0 or value > 200:
+            raise ValueError("DB_MAX_OVERFLOW должен быть в диапазоне 0..200")
+        return value
+
+    @field_validator("fsm_state_ttl_seconds")
+    @classmethod
+    def validate_fsm_ttl(cls, value: int) -> int:
+        if value < 60 or value > 30 * 86400:
+            raise ValueError("FSM_STATE_TTL_SECONDS должен быть в диапазоне 60..2592000")
+        return value
+
+    @field_validator("metrics_port")
+    @classmethod
+    def validate_metrics_port(cls, value: int) -> int:
+        if value < 0 or value > 65535:
+            raise ValueError("METRICS_PORT должен быть в диапазоне 0..65535 (0 — отключить)")
+        return value
+
+    @model_validator(mode="after")
+    def validate_webhook_mode(self) -> Settings:
+        if self.run_mode == "webhook" and not self.webhook_secret:
+            raise ValueError("Для BOT_RUN_MODE=webhook нужно задать WEBHOOK_SECRET")
+        return self
+
+    @model_validator(mode="after")
+    def validate_db_pool(self) -> Settings:
+        # Каждый апдейт держит соединение до конца обработчика, включая вызовы Bot API.
+        if self.db_pool_size + self.db_max_overflow < self.webhook_max_concurrency + DB_POOL_RESERVE:
+            raise ValueError(
+                f"DB_POOL_SIZE + DB_MAX_OVERFLOW должно быть не меньше WEBHOOK_MAX_CONCURRENCY + {DB_POOL_RESERVE}"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def validate_fsm_storage(self) -> Settings:
+        if self.fsm_storage == "redis" and not self.fsm_redis_url:
+            raise ValueError("Для FSM_STORAGE=redis нужно задать FSM_REDIS_URL")
+        return self
+
 
 @lru_cache
 def get_settings() -> Settings:
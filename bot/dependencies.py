@@ -9,11 +9,15 @@ from bot.config import Settings
 from crypto.secrets import SecretCipher
 from services.access_service import AccessService
 from services.billing_service import BillingService
+from services.deletion_scheduler import DeletionScheduler
 from services.export_import_service import ExportImportService
+from services.forecast_service import ForecastService
 from services.manual_service import ManualService
+from services.metrics import MetricsRegistry
 from services.reminder_service import ReminderService
 from services.server_service import ServerService
-from services.settings_service import SettingsService
+from services.settings_service import SECRET_TTL, SettingsService
+from services.view_cache import VIEWS_NOTIFY_PREFIX, ViewCache
 
 
 @dataclass
@@ -22,9 +26,13 @@ class AppServices:
     settings: SettingsService
     servers: ServerService
     billing: BillingService
+    forecast: ForecastService
     manuals: ManualService
     export_import: ExportImportService
     reminders: ReminderService
+    deletions: DeletionScheduler
+    metrics: MetricsRegistry
+    views: ViewCache
 
 
 def build_services(
@@ -33,23 +41,34 @@ def build_services(
     session_factory: async_sessionmaker,
     engine: AsyncEngine,
 ) -> AppServices:
-    _ = engine
     cipher = SecretCipher(settings.bot_master_key)
 
     access = AccessService(session_factory)
-    settings_service = SettingsService(session_factory, default_secret_ttl=settings.secret_ttl_seconds)
-    server_service = ServerService(session_factory, cipher)
-    billing_service = BillingService(session_factory)
-    manual_service = ManualService(session_factory)
-    export_import = ExportImportService(server_service, manual_service)
-    reminders = ReminderService(bot, access, billing_service, settings.notify_hour_utc)
+    settings_service = SettingsService(
+        session_factory,
+        engine,
+        defaults={SECRET_TTL.key: settings.secret_ttl_seconds},
+    )
+    # Без asyncpg LISTEN/NOTIFY недоступен — кэш экранов остаётся локальным для процесса.
+    views = ViewCache(broadcast=engine.dialect.driver == "asyncpg")
+    settings_service.subscribe(VIEWS_NOTIFY_PREFIX, views.on_remote)
+    server_service = ServerService(session_factory, cipher, views)
+    billing_service = BillingService(session_factory, views)
+    manual_service = ManualService(session_factory, views)
+    export_import = ExportImportService(server_service, manual_service, session_factory, cipher, views)
+    reminders = ReminderService(bot, access, billing_service, settings.notify_hour_utc, session_factory, engine)
+    deletions = DeletionScheduler(bot, session_factory)
 
     return AppServices(
         access=access,
         settings=settings_service,
         servers=server_service,
         billing=billing_service,
+        forecast=ForecastService(session_factory),
         manuals=manual_service,
         export_import=export_import,
         reminders=reminders,
+        deletions=deletions,
+        metrics=MetricsRegistry(),
+        views=views,
     )
@@ -0,0 +1,149 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.config import Settings
+from db.models import FsmState
+from db.unit_of_work import session_scope
+
+logger = logging.getLogger(__name__)
+
+EVICTION_INTERVAL_SECONDS = 600
+EVICTION_BATCH_SIZE = 500
+
+
+class PostgresStorage(BaseStorage):
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        state_ttl_seconds: int,
+        key_builder: KeyBuilder | None = None,
+        eviction_interval_seconds: int = EVICTION_INTERVAL_SECONDS,
+        eviction_batch_size: int = EVICTION_BATCH_SIZE,
+    ) -> None:
+        self._session_factory = session_factory
+        self._ttl = timedelta(seconds=state_ttl_seconds)
+        self._key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._eviction_interval = eviction_interval_seconds
+        self._eviction_batch_size = eviction_batch_size
+        self._eviction_task: asyncio.Task | None = None
+
+    def _key(self, key: StorageKey) -> str:
+        return self._key_builder.build(key)
+
+    def _expires_at(self) -> datetime:
+        return datetime.now(timezone.utc) + self._ttl
+
+    async def _write(self, key: StorageKey, **values: Any) -> None:
+        row_key = self._key(key)
+        statement = (
+            insert(FsmState)
+            .values(key=row_key, expires_at=self._expires_at(), **values)
+            .on_conflict_do_update(
+                index_elements=[FsmState.key],
+                set_={"expires_at": self._expires_at(), **values},
+            )
+        )
+        async with session_scope(self._session_factory) as session:
+            await session.execute(statement)
+            # Пустая запись (нет ни состояния, ни данных) не нужна — удаляем сразу.
+            await session.execute(
+                delete(FsmState).where(
+                    FsmState.key == row_key,
+                    FsmState.state.is_(None),
+                    FsmState.data == {},
+                )
+            )
+            await session.commit()
+
+    async def _read(self, key: StorageKey) -> FsmState | None:
+        statement = select(FsmState).where(
+            FsmState.key == self._key(key),
+            FsmState.expires_at > datetime.now(timezone.utc),
+        )
+        async with session_scope(self._session_factory) as session:
+            return (await session.execute(statement)).scalar_one_or_none()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._write(key, state=value)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        row = await self._read(key)
+        return row.state if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._write(key, data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        row = await self._read(key)
+        return dict(row.data) if row and row.data else {}
+
+    async def evict_expired(self) -> int:
+        evicted = 0
+        while True:
+            batch = (
+                select(FsmState.key)
+                .where(FsmState.expires_at <= datetime.now(timezone.utc))
+                .limit(self._eviction_batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            async with self._session_factory() as session:
+                result = await session.execute(delete(FsmState).where(FsmState.key.in_(batch.scalar_subquery())))
+                await session.commit()
+            evicted += result.rowcount
+            if result.rowcount < self._eviction_batch_size:
+                return evicted
+
+    async def _eviction_loop(self) -> None:
+        while True:
+            try:
+                evicted = await self.evict_expired()
+                if evicted:
+                    logger.info("FSM: удалено %s просроченных состояний", evicted)
+            except Exception:  # noqa: BLE001
+                logger.exception("FSM: ошибка очистки просроченных состояний")
+            await asyncio.sleep(self._eviction_interval)
+
+    def start_eviction(self) -> None:
+        if self._eviction_task is None:
+            self._eviction_task = asyncio.create_task(self._eviction_loop())
+
+    async def close(self) -> None:
+        if self._eviction_task is not None:
+            self._eviction_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._eviction_task
+            self._eviction_task = None
+
+
+def build_fsm_storage(settings: Settings, session_factory: async_sessionmaker) -> BaseStorage:
+    if settings.fsm_storage == "memory":
+        return MemoryStorage()
+
+    if settings.fsm_storage == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as exc:
+            raise RuntimeError("Для FSM_STORAGE=redis установите зависимость: pip install .[redis]") from exc
+        return RedisStorage.from_url(
+            settings.fsm_redis_url,
+            key_builder=DefaultKeyBuilder(with_destiny=True),
+            state_ttl=settings.fsm_state_ttl_seconds,
+            data_ttl=settings.fsm_state_ttl_seconds,
+        )
+
+    storage = PostgresStorage(session_factory, state_ttl_seconds=settings.fsm_state_ttl_seconds)
+    storage.start_eviction()
+    return storage
@@ -1,6 +1,10 @@
 ﻿from __future__ import annotations
 
+import html
+from decimal import Decimal
+
 from aiogram import F, Router
+from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 
@@ -8,8 +12,11 @@ from bot.dependencies import AppServices
 from bot.keyboards.billing import billing_menu_keyboard, billing_server_select_keyboard
 from bot.keyboards.main import CANCEL_MENU
 from bot.states.billing_states import AddBillingStates
-from bot.utils import parse_date_ru
+from bot.utils import parse_date_ru, show_view, status_marker
+from services.billing_service import TREND_MONTHS
+from services.forecast_service import FORECAST_MONTHS
 from services.schemas import BillingCreateSchema
+from services.view_cache import RenderedView
 
 router = Router()
 
@@ -20,7 +27,10 @@ async def bill_add_start(query: CallbackQuery, services: AppServices, user_id: i
     if not servers:
         await query.answer("Сначала добавьте сервер", show_alert=True)
         return
-    items = [(str(s.id), f"{s.name} ({s.ip4})") for s in servers]
+    items = []
+    for s in servers:
+        emoji, _ = status_marker(s.next_expires_at)
+        items.append((str(s.id), f"{emoji} {s.name} ({s.ip4})"))
     await query.message.answer("Выберите сервер:", reply_markup=billing_server_select_keyboard(items))
     await query.answer()
 
@@ -28,38 +38,104 @@ async def bill_add_start(query: CallbackQuery, services: AppServices, user_id: i
 @router.callback_query(F.data.startswith("bill:expiring:"))
 async def bill_expiring(query: CallbackQuery, services: AppServices, user_id: int) -> None:
     days = int(query.data.split(":")[2])
-    rows = await services.billing.list_expiring(user_id, days)
-    title = "⚠ В 7 дней" if days == 7 else "📆 В 30 дней"
-    if not rows:
-        await query.message.edit_text(f"{title}\n━━━━━━━━━━━━━━━━\nПусто", reply_markup=billing_menu_keyboard())
-        await query.answer()
-        return
 
-    lines = [title, "━━━━━━━━━━━━━━━━"]
-    for server, billing, delta in rows:
-        day_word = "день" if delta == 1 else "дней"
-        lines.append(
-            f"🖥 {server.name}\n"
-            f"📅 {billing.expires_at.strftime('%d.%m.%Y')}\n"
-            f"⏳ {delta} {day_word}\n"
-            f"💰 {billing.price_amount} {billing.price_currency}\n"
-            "━━━━━━━━━━━━━━━━"
-        )
-    await query.message.edit_text("\n".join(lines), reply_markup=billing_menu_keyboard())
+    async def render() -> RenderedView:
+        rows = await services.billing.list_expiring(user_id, days)
+        title = "⚠ В 7 дней" if days == 7 else "📆 В 30 дней"
+        if not rows:
+            return RenderedView(f"{title}\n━━━━━━━━━━━━━━━━\nПусто", billing_menu_keyboard())
+
+        lines = [title, "━━━━━━━━━━━━━━━━"]
+        for server, billing, delta in rows:
+            day_word = "день" if delta == 1 else "дней"
+            lines.append(
+                f"🖥 {html.escape(server.name)}\n"
+                f"📅 {billing.expires_at.strftime('%d.%m.%Y')}\n"
+                f"⏳ {delta} {day_word}\n"
+                f"💰 {billing.price_amount} {billing.price_currency}\n"
+                "━━━━━━━━━━━━━━━━"
+            )
+        return RenderedView("\n".join(lines), billing_menu_keyboard())
+
+    view = await services.views.get_or_render(user_id, query.data, render, daily=True)
+    await show_view(query.message, view)
     await query.answer()
 
 
 @router.callback_query(F.data == "bill:summary")
 async def bill_summary(query: CallbackQuery, services: AppServices, user_id: int) -> None:
-    summary = await services.billing.monthly_summary(user_id)
-    if not summary:
-        await query.message.answer("За текущий месяц оплат нет.")
-        await query.answer()
-        return
-    lines = ["Сводка за текущий месяц:"]
-    for currency, amount in summary.items():
-        lines.append(f"- {amount} {currency}")
-    await query.message.answer("\n".join(lines))
+    async def render() -> RenderedView:
+        summary = await services.billing.monthly_summary(user_id)
+        if not summary:
+            return RenderedView("За текущий месяц оплат нет.")
+        lines = ["Сводка за текущий месяц:"]
+        for currency, amount in summary.items():
+            lines.append(f"- {amount} {currency}")
+        return RenderedView("\n".join(lines))
+
+    # Сводка приходит отдельным сообщением, кэш избавляет только от запроса в БД.
+    view = await services.views.get_or_render(user_id, query.data, render, daily=True)
+    await query.message.answer(view.text)
+    await query.answer()
+
+
+def _format_amounts(amounts: dict[str, Decimal]) -> str:
+    if not amounts:
+        return "—"
+    return " · ".join(f"{amount} {currency}" for currency, amount in sorted(amounts.items()))
+
+
+@router.callback_query(F.data == "bill:trend")
+async def bill_trend(query: CallbackQuery, services: AppServices, user_id: int) -> None:
+    async def render() -> RenderedView:
+        trend = await services.billing.spending_trend(user_id, TREND_MONTHS)
+        lines = [f"📈 Расходы за {TREND_MONTHS} месяцев", "━━━━━━━━━━━━━━━━"]
+        for month, amounts in trend:
+            lines.append(f"{month.strftime('%m.%Y')}: {_format_amounts(amounts)}")
+        return RenderedView("\n".join(lines), billing_menu_keyboard())
+
+    view = await services.views.get_or_render(user_id, query.data, render, daily=True)
+    await show_view(query.message, view)
+    await query.answer()
+
+
+@router.callback_query(F.data.in_({"bill:by:provider", "bill:by:role"}))
+async def bill_breakdown(query: CallbackQuery, services: AppServices, user_id: int) -> None:
+    dimension = query.data.rsplit(":", maxsplit=1)[1]
+    title = "🏢 По провайдерам" if dimension == "provider" else "🧩 По ролям"
+
+    async def render() -> RenderedView:
+        rows = await services.billing.spending_breakdown(user_id, dimension, TREND_MONTHS)
+        lines = [f"{title} за {TREND_MONTHS} месяцев", "━━━━━━━━━━━━━━━━"]
+        if not rows:
+            lines.append("Пусто")
+        current = None
+        for key, currency, amount in rows:
+            if currency != current:
+                current = currency
+                lines.append(f"💱 {html.escape(currency)}")
+            lines.append(f"  {html.escape(key or '—')}: {amount}")
+        return RenderedView("\n".join(lines), billing_menu_keyboard())
+
+    view = await services.views.get_or_render(user_id, query.data, render, daily=True)
+    await show_view(query.message, view)
+    await query.answer()
+
+
+@router.callback_query(F.data == "bill:forecast")
+async def bill_forecast(query: CallbackQuery, services: AppServices, user_id: int) -> None:
+    async def render() -> RenderedView:
+        forecast = await services.forecast.forecast(user_id, FORECAST_MONTHS)
+        lines = [f"🔮 Прогноз продлений на {FORECAST_MONTHS} месяцев", "━━━━━━━━━━━━━━━━"]
+        for month, amounts, renewals in forecast.monthly():
+            suffix = f" ({renewals} шт.)" if renewals else ""
+            lines.append(f"{month.strftime('%m.%Y')}: {_format_amounts(amounts)}{suffix}")
+        lines += ["━━━━━━━━━━━━━━━━", f"Итого: {_format_amounts(forecast.by_currency())}"]
+        return RenderedView("\n".join(lines), billing_menu_keyboard())
+
+    # Первый месяц прогноза — текущий, поэтому экран живёт до полуночи.
+    view = await services.views.get_or_render(user_id, query.data, render, daily=True)
+    await show_view(query.message, view)
     await query.answer()
 
 
@@ -73,7 +149,7 @@ async def bill_add_for_server(query: CallbackQuery, state: FSMContext) -> None:
     await query.answer()
 
 
-@router.message(F.text.casefold() == "отмена")
+@router.message(StateFilter(AddBillingStates), F.text.casefold() == "отмена")
 async def bill_cancel(message: Message, state: FSMContext) -> None:
     current = await state.get_state()
     if current and current.startswith(AddBillingStates.__name__):
@@ -88,7 +164,7 @@ async def bill_paid_at(message: Message, state: FSMContext) -> None:
     except ValueError:
         await message.answer("Некорректная дата. Формат: ДД.ММ.ГГГГ")
         return
-    await state.update_data(paid_at=paid_at)
+    await state.update_data(paid_at=paid_at.isoformat())
     await state.set_state(AddBillingStates.expires_at)
     await message.answer("Дата истечения (ДД.ММ.ГГГГ):")
 
@@ -100,7 +176,7 @@ async def bill_expires_at(message: Message, state: FSMContext) -> None:
     except ValueError:
         await message.answer("Некорректная дата. Формат: ДД.ММ.ГГГГ")
         return
-    await state.update_data(expires_at=expires_at)
+    await state.update_data(expires_at=expires_at.isoformat())
     await state.set_state(AddBillingStates.amount)
     await message.answer("Сумма оплаты:")
 
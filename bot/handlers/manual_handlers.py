@@ -3,7 +3,7 @@
 import html
 
 from aiogram import F, Router
-from aiogram.filters import Command
+from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 
@@ -16,14 +16,17 @@ from bot.keyboards.manuals import (
     manual_category_choose_keyboard,
     manual_list_keyboard,
 )
-from bot.states.manual_states import EditManualStates, SearchManualState
+from bot.states.manual_states import AddManualStates, EditManualStates, SearchManualState
 from bot.structured_input import (
     ADD_MANUAL_TEMPLATE,
     ParsedManualInput,
     StructuredInputError,
     parse_manual_input,
 )
-from services.schemas import MANUAL_CATEGORY_MAP, parse_manual_commands, parse_tags_input
+from bot.utils import show_view
+from services.manual_service import HIGHLIGHT_START, HIGHLIGHT_STOP
+from services.schemas import MANUAL_CATEGORY_MAP, ManualCreateSchema, parse_manual_commands, parse_tags_input
+from services.view_cache import RenderedView
 
 router = Router()
 
@@ -34,15 +37,6 @@ CATEGORY_TITLE = {
     "other": "Другое",
 }
 
-PENDING_MANUAL_INPUT_USERS: set[int] = set()
-PENDING_MANUAL_PREVIEWS: dict[int, ParsedManualInput] = {}
-
-
-def _reset_manual_add(user_id: int) -> None:
-    PENDING_MANUAL_INPUT_USERS.discard(user_id)
-    PENDING_MANUAL_PREVIEWS.pop(user_id, None)
-
-
 def _format_manual_item(manual) -> str:
     tags = ", ".join(f"#{t.tag}" for t in manual.tags) if manual.tags else "-"
     body = html.escape(manual.body_markdown)
@@ -56,6 +50,11 @@ def _format_manual_item(manual) -> str:
     )
 
 
+def _highlight_snippet(snippet: str) -> str:
+    escaped = html.escape(" ".join(snippet.split()))
+    return escaped.replace(HIGHLIGHT_START, "<b>").replace(HIGHLIGHT_STOP, "</b>")
+
+
 def _manual_preview_text(parsed: ParsedManualInput) -> str:
     manual = parsed.manual
     tags = ", ".join(manual.tags) if manual.tags else "—"
@@ -74,33 +73,33 @@ def _manual_preview_text(parsed: ParsedManualInput) -> str:
 
 
 @router.message(Command("add_manual"))
-async def cmd_add_manual(message: Message) -> None:
+async def cmd_add_manual(message: Message, state: FSMContext) -> None:
     if not message.from_user:
         return
-    _reset_manual_add(message.from_user.id)
-    PENDING_MANUAL_INPUT_USERS.add(message.from_user.id)
+    await state.clear()
+    await state.set_state(AddManualStates.input)
     await message.answer(ADD_MANUAL_TEMPLATE, reply_markup=CANCEL_MENU)
 
 
 @router.callback_query(F.data == "manual:add")
-async def manual_add_start(query: CallbackQuery) -> None:
+async def manual_add_start(query: CallbackQuery, state: FSMContext) -> None:
     if not query.from_user:
         return
-    _reset_manual_add(query.from_user.id)
-    PENDING_MANUAL_INPUT_USERS.add(query.from_user.id)
+    await state.clear()
+    await state.set_state(AddManualStates.input)
     await query.message.answer(ADD_MANUAL_TEMPLATE, reply_markup=CANCEL_MENU)
     await query.answer()
 
 
-@router.message(lambda m: bool(m.from_user and m.from_user.id in PENDING_MANUAL_INPUT_USERS))
-async def manual_add_parse_single(message: Message) -> None:
+@router.message(AddManualStates.input)
+async def manual_add_parse_single(message: Message, state: FSMContext) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
     text = (message.text or "").strip()
 
     if text.casefold() == "отмена":
-        _reset_manual_add(user_id)
+        await state.clear()
         await message.answer("Добавление мануала отменено.")
         return
 
@@ -121,29 +120,30 @@ async def manual_add_parse_single(message: Message) -> None:
         await message.answer(f"Ошибка разбора: {exc}")
         return
 
-    PENDING_MANUAL_INPUT_USERS.discard(user_id)
-    PENDING_MANUAL_PREVIEWS[user_id] = parsed
+    # В хранилище FSM лежит JSON, поэтому предпросмотр хранится как dump схемы.
+    await state.update_data(manual=parsed.manual.model_dump(mode="json"))
+    await state.set_state(AddManualStates.preview)
     await message.answer(_manual_preview_text(parsed), parse_mode="HTML", reply_markup=add_manual_confirm_keyboard())
 
 
 @router.callback_query(F.data == "manual:add:confirm")
-async def manual_add_confirm(query: CallbackQuery, services: AppServices, is_admin: bool) -> None:
+async def manual_add_confirm(query: CallbackQuery, state: FSMContext, services: AppServices, is_admin: bool) -> None:
     if not query.from_user:
         return
     user_id = query.from_user.id
-    parsed = PENDING_MANUAL_PREVIEWS.get(user_id)
-    if not parsed:
+    data = await state.get_data()
+    if await state.get_state() != AddManualStates.preview.state or "manual" not in data:
         await query.answer("Нет данных для сохранения. Повторите /add_manual", show_alert=True)
         return
 
     try:
-        manual = await services.manuals.create_manual(parsed.manual)
+        manual = await services.manuals.create_manual(ManualCreateSchema.model_validate(data["manual"]))
     except Exception as exc:  # noqa: BLE001
         await query.answer("Ошибка сохранения", show_alert=True)
         await query.message.answer(f"Не удалось сохранить статью: {exc}")
         return
 
-    _reset_manual_add(user_id)
+    await state.clear()
     manual_full = await services.manuals.get_manual(user_id, manual.id)
     if manual_full:
         await query.message.edit_text(
@@ -157,23 +157,23 @@ async def manual_add_confirm(query: CallbackQuery, services: AppServices, is_adm
 
 
 @router.callback_query(F.data == "manual:add:cancel")
-async def manual_add_cancel(query: CallbackQuery) -> None:
-    if query.from_user:
-        _reset_manual_add(query.from_user.id)
+async def manual_add_cancel(query: CallbackQuery, state: FSMContext) -> None:
+    await state.clear()
     await query.message.edit_text("Добавление мануала отменено.")
     await query.answer()
 
 
 @router.callback_query(F.data == "manual:categories")
 async def manual_categories(query: CallbackQuery, services: AppServices, user_id: int) -> None:
-    items = await services.manuals.list_categories(user_id)
-    if not items:
-        await query.message.edit_text("Мануалов пока нет.")
-        await query.answer()
-        return
-
-    payload = [(category.value, count) for category, count in items]
-    await query.message.edit_text("Категории:", reply_markup=manual_categories_keyboard(payload))
+    async def render() -> RenderedView:
+        items = await services.manuals.list_categories(user_id)
+        if not items:
+            return RenderedView("Мануалов пока нет.")
+        payload = [(category.value, count) for category, count in items]
+        return RenderedView("Категории:", manual_categories_keyboard(payload))
+
+    view = await services.views.get_or_render(user_id, query.data, render)
+    await show_view(query.message, view)
     await query.answer()
 
 
@@ -220,13 +220,17 @@ async def manual_search_start(query: CallbackQuery, state: FSMContext) -> None:
 @router.message(SearchManualState.query)
 async def manual_search_apply(message: Message, state: FSMContext, services: AppServices, user_id: int) -> None:
     query_text = (message.text or "").strip()
-    items = await services.manuals.search_manuals(user_id, query_text)
+    hits = await services.manuals.search_manuals(user_id, query_text)
     await state.clear()
-    if not items:
+    if not hits:
         await message.answer("Совпадений не найдено.")
         return
-    payload = [(m.id, m.title) for m in items]
-    await message.answer("Результаты поиска:", reply_markup=manual_list_keyboard(payload))
+
+    lines = ["🔎 Результаты поиска:"]
+    for hit in hits:
+        lines.append(f"\n<b>{html.escape(hit.title)}</b>\n{_highlight_snippet(hit.snippet)}")
+    payload = [(hit.id, hit.title) for hit in hits]
+    await message.answer("\n".join(lines), parse_mode="HTML", reply_markup=manual_list_keyboard(payload))
 
 
 @router.callback_query(F.data.startswith("manual:cat_pick:"))
@@ -353,18 +357,9 @@ async def manual_edit_finish(message: Message, state: FSMContext, services: AppS
     await message.answer("Статья обновлена." if updated else "Статья не найдена.")
 
 
-@router.message(F.text.casefold() == "отмена")
+@router.message(StateFilter(AddManualStates, EditManualStates, SearchManualState), F.text.casefold() == "отмена")
 async def manual_cancel(message: Message, state: FSMContext) -> None:
-    pending_cleared = False
-    if message.from_user and message.from_user.id in PENDING_MANUAL_INPUT_USERS | set(PENDING_MANUAL_PREVIEWS.keys()):
-        _reset_manual_add(message.from_user.id)
-        pending_cleared = True
-
     current = await state.get_state()
-    if current and current.startswith((EditManualStates.__name__, SearchManualState.__name__)):
+    if current and current.startswith((AddManualStates.__name__, EditManualStates.__name__, SearchManualState.__name__)):
         await state.clear()
         await message.answer("Действие отменено.")
-        return
-
-    if pending_cleared:
-        await message.answer("Действие отменено.")
@@ -1,16 +1,28 @@
 ﻿from __future__ import annotations
 
-from aiogram import F, Router
+import html
+
+from aiogram import Bot, F, Router
+from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import BufferedInputFile, CallbackQuery, Message
+from aiogram.types import CallbackQuery, FSInputFile, Message
+from pydantic import ValidationError
 
 from bot.dependencies import AppServices
 from bot.keyboards.main import CANCEL_MENU
 from bot.keyboards.settings import settings_menu_keyboard
-from bot.states.settings_states import SettingsStates, WhitelistStates
+from bot.middlewares.metrics import API_DURATION, API_RETRY_AFTER, HANDLER_DURATION
+from bot.states.settings_states import ImportStates, SettingsStates, WhitelistStates
+from db.session import POOL_WAIT
+from services.export_import_service import IMPORT_MAX_BYTES, ImportReport
+from services.metrics import MetricSummary
+from services.settings_service import SECRET_TTL
 
 router = Router()
 
+IMPORT_ERRORS_SHOWN = 20
+STATS_ROWS_SHOWN = 12
+
 
 def _require_admin(is_admin: bool) -> bool:
     return is_admin
@@ -93,7 +105,7 @@ async def settings_secret_ttl_show(query: CallbackQuery, state: FSMContext, serv
         await query.answer("Только администратор", show_alert=True)
         return
 
-    ttl = await services.settings.get_secret_ttl()
+    ttl = services.settings.get(SECRET_TTL)
     await state.set_state(SettingsStates.set_secret_ttl)
     await query.message.answer(
         f"Текущее время автоудаления секрета: {ttl} сек.\nВведите новое значение (10..300):",
@@ -105,34 +117,126 @@ async def settings_secret_ttl_show(query: CallbackQuery, state: FSMContext, serv
 @router.message(SettingsStates.set_secret_ttl)
 async def settings_secret_ttl_apply(message: Message, state: FSMContext, services: AppServices) -> None:
     try:
-        ttl = int((message.text or "").strip())
-        if ttl < 10 or ttl > 300:
-            raise ValueError
-    except ValueError:
+        ttl = await services.settings.set(SECRET_TTL, (message.text or "").strip())
+    except ValidationError:
         await message.answer("Время должно быть числом от 10 до 300 секунд.")
         return
 
-    await services.settings.set_secret_ttl(ttl)
     await state.clear()
     await message.answer(f"Время автоудаления обновлено: {ttl} сек.", reply_markup=settings_menu_keyboard())
 
 
-@router.callback_query(F.data == "settings:export")
+@router.callback_query(F.data == "settings:export", flags={"unit_of_work": False})
 async def settings_export(query: CallbackQuery, services: AppServices, user_id: int, is_admin: bool) -> None:
     if not _require_admin(is_admin):
         await query.answer("Только администратор", show_alert=True)
         return
 
-    bundle = await services.export_import.export_user_data(user_id, include_secret=False)
-    payload = bundle.to_json().encode("utf-8")
-    file = BufferedInputFile(payload, filename="flow_proxy_export.json")
-    await query.message.answer_document(file, caption="Экспорт готов (без секретов).")
+    await query.answer("Готовлю экспорт…")
+    export = await services.export_import.export_to_file(user_id, include_secret=False)
+    try:
+        await query.message.answer_document(
+            FSInputFile(export.path, filename=export.filename),
+            caption=(
+                "Экспорт готов (без секретов).\n"
+                f"Серверов: {export.servers}, оплат: {export.billings}, мануалов: {export.manuals}"
+            ),
+        )
+    finally:
+        export.path.unlink(missing_ok=True)
+
+
+def _import_report_text(report: ImportReport) -> str:
+    lines = [
+        "Импорт завершён.",
+        f"Серверы: добавлено {report.servers_created}, обновлено {report.servers_updated}",
+        f"Оплаты: добавлено {report.billings_added}, пропущено дублей {report.billings_skipped}",
+        f"Мануалы: добавлено {report.manuals_created}, обновлено {report.manuals_updated}",
+    ]
+    if report.errors:
+        lines.append(f"\nОшибки ({len(report.errors)}):")
+        for error in report.errors[:IMPORT_ERRORS_SHOWN]:
+            lines.append(f"• {html.escape(error.source)}: {html.escape(error.message[:200])}")
+        if len(report.errors) > IMPORT_ERRORS_SHOWN:
+            lines.append(f"…и ещё {len(report.errors) - IMPORT_ERRORS_SHOWN}")
+    return "\n".join(lines)
+
+
+@router.callback_query(F.data == "settings:import")
+async def settings_import_start(query: CallbackQuery, state: FSMContext, is_admin: bool) -> None:
+    if not _require_admin(is_admin):
+        await query.answer("Только администратор", show_alert=True)
+        return
+
+    await state.set_state(ImportStates.upload)
+    await query.message.answer(
+        "Отправьте файл документом: экспорт бота (.ndjson.gz, .ndjson, .json) или CSV со столбцами полей сервера.",
+        reply_markup=CANCEL_MENU,
+    )
     await query.answer()
 
 
+@router.message(ImportStates.upload, F.document, flags={"unit_of_work": False})
+async def settings_import_apply(message: Message, state: FSMContext, services: AppServices, user_id: int, bot: Bot) -> None:
+    document = message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await message.answer("Файл больше 20 МБ — разбейте его на части.")
+        return
+
+    payload = await bot.download(document)
+    try:
+        report = await services.export_import.import_bundle(user_id, document.file_name or "import.ndjson", payload.getvalue())
+    except ValueError as exc:
+        await message.answer(f"Не удалось прочитать файл: {html.escape(str(exc))}")
+        return
+
+    await state.clear()
+    await message.answer(_import_report_text(report), reply_markup=settings_menu_keyboard())
+
+
 @router.message(F.text.casefold() == "отмена")
 async def settings_cancel(message: Message, state: FSMContext) -> None:
     current = await state.get_state()
-    if current and current.startswith((WhitelistStates.__name__, SettingsStates.__name__)):
+    if current and current.startswith((WhitelistStates.__name__, SettingsStates.__name__, ImportStates.__name__)):
         await state.clear()
         await message.answer("Действие отменено.")
+
+
+@router.message(ImportStates.upload)
+async def settings_import_expect_document(message: Message) -> None:
+    await message.answer("Пришлите файл документом или нажмите «Отмена».")
+
+
+def _stats_table(title: str, label: str, summaries: list[MetricSummary]) -> list[str]:
+    if not summaries:
+        return [f"<b>{title}</b>: нет данных"]
+    rows = sorted(summaries, key=lambda item: item.count, reverse=True)[:STATS_ROWS_SHOWN]
+    width = min(32, max(len(" ".join(item.labels.get(key, "") for key in label.split())) for item in rows))
+    lines = [f"{'':<{width}} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7}"]
+    for item in rows:
+        name = " ".join(item.labels.get(key, "") for key in label.split())[:width]
+        lines.append(
+            f"{name:<{width}} {item.count:>6} {item.p50 * 1000:>7.1f} {item.p95 * 1000:>7.1f} {item.p99 * 1000:>7.1f}"
+        )
+    return [f"<b>{title}</b>, мс:", "<pre>" + html.escape("\n".join(lines)) + "</pre>"]
+
+
+@router.message(Command("stats"))
+async def stats_command(message: Message, services: AppServices, is_admin: bool) -> None:
+    if not _require_admin(is_admin):
+        await message.answer("Только администратор")
+        return
+
+    metrics = services.metrics
+    pool = metrics.gauge_values()
+    lines = [
+        *_stats_table("Обработчики", "route", metrics.summaries(HANDLER_DURATION)),
+        *_stats_table("Telegram API", "method", metrics.summaries(API_DURATION)),
+        f"retry_after: {int(metrics.counter_total(API_RETRY_AFTER))}",
+        *_stats_table("Ожидание пула БД", "", metrics.summaries(POOL_WAIT)),
+        "Пул БД: "
+        f"размер {int(pool.get('db_pool_size', 0))}, "
+        f"занято {int(pool.get('db_pool_checked_out', 0))}, "
+        f"overflow {int(pool.get('db_pool_overflow', 0))}",
+    ]
+    await message.answer("\n".join(lines))
@@ -5,7 +5,7 @@ from datetime import date
 from decimal import Decimal, InvalidOperation
 
 from aiogram import F, Router
-from aiogram.filters import Command
+from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 
@@ -20,8 +20,11 @@ from bot.keyboards.vps import (
     vps_menu_keyboard,
 )
 from bot.states.vps_states import AddServerStates, SearchServerState
+from bot.utils import show_view, status_marker
 from db.models import ServerRole
 from services.schemas import BillingCreateSchema, SECRET_TYPE_MAP, ServerCreateSchema
+from services.server_service import ServerDetail
+from services.view_cache import RenderedView
 
 router = Router()
 PAGE_SIZE = 5
@@ -85,24 +88,9 @@ def _preview_text(data: dict[str, str]) -> str:
     )
 
 
-def _status_marker(expires_at: date | None) -> tuple[str, str]:
-    if expires_at is None:
-        return "⚪", "📅 Нет даты"
-
-    days_left = (expires_at - date.today()).days
-    if days_left <= 1:
-        if days_left < 0:
-            return "🔴", "⚠ Просрочен"
-        if days_left == 0:
-            return "🔴", "⚠ Истекает сегодня"
-        return "🔴", "⚠ Истекает завтра"
-    if days_left <= 14:
-        return "🟡", f"⚠ {days_left} дней"
-    return "🟢", f"📅 До {expires_at.strftime('%d.%m.%Y')}"
-
-
-def _server_card_text(server, latest_billing) -> str:
+def _server_card_text(server: ServerDetail) -> str:
     domain = server.domain or "—"
+    latest_billing = server.latest_billing
     if latest_billing:
         amount = f"{latest_billing.price_amount} {latest_billing.price_currency}"
         expires = latest_billing.expires_at.strftime("%d.%m.%Y")
@@ -123,14 +111,12 @@ def _server_card_text(server, latest_billing) -> str:
     )
 
 
-async def _format_server_list_blocks(services: AppServices, servers: list) -> tuple[list[str], list[tuple[str, str]]]:
+def _format_server_list_blocks(servers: list) -> tuple[list[str], list[tuple[str, str]]]:
     blocks: list[str] = []
     buttons: list[tuple[str, str]] = []
 
     for server in servers:
-        nearest = await services.billing.nearest_billing_for_server(server.id)
-        expires = nearest.expires_at if nearest else None
-        emoji, line3 = _status_marker(expires)
+        emoji, line3 = status_marker(server.next_expires_at)
 
         blocks.append(
             f"{emoji} {html.escape(server.name)}\n"
@@ -155,14 +141,13 @@ def _join_cards(title: str, blocks: list[str]) -> str:
 
 
 async def _render_server_card(query: CallbackQuery, services: AppServices, user_id: int, server_id: str) -> None:
-    server = await services.servers.get_server(user_id, server_id)
+    server = await services.servers.get_server_detail(user_id, server_id)
     if not server:
         await query.answer("Сервер не найден", show_alert=True)
         return
 
-    latest_billing = await services.billing.latest_billing_for_server(server.id)
     await query.message.edit_text(
-        _server_card_text(server, latest_billing),
+        _server_card_text(server),
         parse_mode="HTML",
         reply_markup=server_card_keyboard(str(server.id)),
     )
@@ -368,12 +353,11 @@ async def add_server_confirm(query: CallbackQuery, state: FSMContext, services:
         return
 
     await state.clear()
-    refreshed = await services.servers.get_server(query.from_user.id, str(server.id))
-    latest_billing = await services.billing.latest_billing_for_server(server.id)
+    refreshed = await services.servers.get_server_detail(query.from_user.id, str(server.id))
 
     if refreshed:
         await query.message.edit_text(
-            _server_card_text(refreshed, latest_billing),
+            _server_card_text(refreshed),
             parse_mode="HTML",
             reply_markup=server_card_keyboard(str(refreshed.id)),
         )
@@ -400,86 +384,91 @@ async def vps_search_start(query: CallbackQuery, state: FSMContext) -> None:
 @router.message(SearchServerState.query)
 async def vps_search_apply(message: Message, state: FSMContext, services: AppServices, user_id: int) -> None:
     query_text = (message.text or "").strip()
-    servers, total = await services.servers.list_servers(user_id, page=1, search=query_text, page_size=PAGE_SIZE)
+    servers = await services.servers.search_servers(user_id, query_text, limit=PAGE_SIZE)
     await state.clear()
     if not servers:
         await message.answer("Ничего не найдено.")
         return
 
-    blocks, buttons = await _format_server_list_blocks(services, servers)
+    blocks, buttons = _format_server_list_blocks(servers)
     await message.answer(
         _join_cards("🔎 Результаты", blocks),
         parse_mode="HTML",
-        reply_markup=server_list_keyboard(buttons, 1, total, page_size=max(total, 1)),
+        reply_markup=server_list_keyboard(buttons),
     )
 
 
 @router.callback_query(F.data == "vps:expiring_menu")
 async def vps_expiring_menu(query: CallbackQuery) -> None:
-    await query.message.edit_text("⏰ Истекают", reply_markup=expiring_menu_keyboard())
+    await show_view(query.message, RenderedView("⏰ Истекают", expiring_menu_keyboard()))
     await query.answer()
 
 
 @router.callback_query(F.data.startswith("vps:expiring:"))
 async def vps_expiring(query: CallbackQuery, services: AppServices, user_id: int) -> None:
     days = int(query.data.split(":", maxsplit=2)[2])
-    rows = await services.billing.list_expiring(user_id, days)
 
-    if not rows:
+    async def render() -> RenderedView:
+        rows = await services.billing.list_expiring(user_id, days)
         title = "⚠ В 7 дней" if days == 7 else "📆 В 30 дней"
-        await query.message.edit_text(f"{title}\n━━━━━━━━━━━━━━━━\nПусто", reply_markup=expiring_menu_keyboard())
-        await query.answer()
-        return
-
-    cards: list[str] = []
-    for server, billing, delta in rows:
-        day_word = "день" if delta == 1 else "дней"
-        cards.append(
-            f"🖥 {html.escape(server.name)}\n"
-            f"📅 {billing.expires_at.strftime('%d.%m.%Y')}\n"
-            f"⏳ {delta} {day_word}\n"
-            f"💰 {billing.price_amount} {billing.price_currency}"
-        )
+        cards: list[str] = []
+        for server, billing, delta in rows:
+            day_word = "день" if delta == 1 else "дней"
+            cards.append(
+                f"🖥 {html.escape(server.name)}\n"
+                f"📅 {billing.expires_at.strftime('%d.%m.%Y')}\n"
+                f"⏳ {delta} {day_word}\n"
+                f"💰 {billing.price_amount} {billing.price_currency}"
+            )
+        return RenderedView(_join_cards(title, cards), expiring_menu_keyboard())
 
-    title = "⚠ В 7 дней" if days == 7 else "📆 В 30 дней"
-    await query.message.edit_text(_join_cards(title, cards), parse_mode="HTML", reply_markup=expiring_menu_keyboard())
+    view = await services.views.get_or_render(user_id, query.data, render, daily=True)
+    await show_view(query.message, view)
     await query.answer()
 
 
-@router.callback_query(F.data == "vps:filter:favorites")
-async def vps_favorites(query: CallbackQuery, services: AppServices, user_id: int) -> None:
-    servers, _ = await services.servers.list_servers(user_id, page=1, page_size=200)
-    favorites = [srv for srv in servers if srv.is_favorite]
+async def _server_list_view(
+    services: AppServices, user_id: int, cursor: str, title: str, favorites_only: bool, callback_prefix: str
+) -> RenderedView:
+    page = await services.servers.list_servers_page(
+        user_id, cursor=cursor, page_size=PAGE_SIZE, with_total=True, favorites_only=favorites_only
+    )
+    if not page.items:
+        return RenderedView(f"{title}\n━━━━━━━━━━━━━━━━\nПусто", vps_menu_keyboard())
+
+    blocks, buttons = _format_server_list_blocks(page.items)
+    return RenderedView(
+        _join_cards(title, blocks),
+        server_list_keyboard(
+            buttons, page.prev_cursor, page.next_cursor, page.estimated_total, callback_prefix=callback_prefix
+        ),
+    )
 
-    if not favorites:
-        await query.message.edit_text("⭐ Избранное\n━━━━━━━━━━━━━━━━\nПусто", reply_markup=vps_menu_keyboard())
-        await query.answer()
-        return
 
-    blocks, buttons = await _format_server_list_blocks(services, favorites)
-    await query.message.edit_text(
-        _join_cards("⭐ Избранное", blocks),
-        parse_mode="HTML",
-        reply_markup=server_list_keyboard(buttons, 1, len(favorites), page_size=max(len(favorites), 1)),
+@router.callback_query(F.data.startswith("vps:filter:favorites"))
+async def vps_favorites(query: CallbackQuery, services: AppServices, user_id: int) -> None:
+    cursor = query.data.removeprefix("vps:filter:favorites").lstrip(":")
+    # Маркеры статуса считаются от сегодняшней даты, поэтому списки живут в кэше до полуночи.
+    view = await services.views.get_or_render(
+        user_id,
+        query.data,
+        lambda: _server_list_view(services, user_id, cursor, "⭐ Избранное", True, "vps:filter:favorites"),
+        daily=True,
     )
+    await show_view(query.message, view)
     await query.answer()
 
 
 @router.callback_query(F.data.startswith("vps:list:"))
 async def vps_list(query: CallbackQuery, services: AppServices, user_id: int) -> None:
-    page = int(query.data.split(":", maxsplit=2)[2])
-    servers, total = await services.servers.list_servers(user_id, page=page, page_size=PAGE_SIZE)
-    if not servers:
-        await query.message.edit_text("📋 Список серверов\n━━━━━━━━━━━━━━━━\nПусто", reply_markup=vps_menu_keyboard())
-        await query.answer()
-        return
-
-    blocks, buttons = await _format_server_list_blocks(services, servers)
-    await query.message.edit_text(
-        _join_cards("📋 Список серверов", blocks),
-        parse_mode="HTML",
-        reply_markup=server_list_keyboard(buttons, page, total, page_size=PAGE_SIZE),
+    cursor = query.data.split(":", maxsplit=2)[2]
+    view = await services.views.get_or_render(
+        user_id,
+        query.data,
+        lambda: _server_list_view(services, user_id, cursor, "📋 Список серверов", False, "vps:list"),
+        daily=True,
     )
+    await show_view(query.message, view)
     await query.answer()
 
 
@@ -493,7 +482,7 @@ async def vps_card(query: CallbackQuery, services: AppServices, user_id: int) ->
 @router.callback_query(F.data.startswith("vps:delete_ask:"))
 async def vps_delete_ask(query: CallbackQuery, services: AppServices, user_id: int) -> None:
     server_id = query.data.split(":", maxsplit=2)[2]
-    server = await services.servers.get_server(user_id, server_id)
+    server = await services.servers.get_server_detail(user_id, server_id)
     if not server:
         await query.answer("Сервер не найден", show_alert=True)
         return
@@ -531,7 +520,7 @@ async def vps_delete_cancel(query: CallbackQuery, services: AppServices, user_id
     await query.answer("Отменено")
 
 
-@router.message(F.text.casefold() == "отмена")
+@router.message(StateFilter(AddServerStates, SearchServerState), F.text.casefold() == "отмена")
 async def common_cancel(message: Message, state: FSMContext) -> None:
     current = await state.get_state()
     if not current:
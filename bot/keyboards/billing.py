@@ -9,6 +9,12 @@ def billing_menu_keyboard() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="⚠ В 7 дней", callback_data="bill:expiring:7")],
             [InlineKeyboardButton(text="📆 В 30 дней", callback_data="bill:expiring:30")],
             [InlineKeyboardButton(text="💰 Сводка за месяц", callback_data="bill:summary")],
+            [InlineKeyboardButton(text="📈 Расходы за 12 месяцев", callback_data="bill:trend")],
+            [InlineKeyboardButton(text="🔮 Прогноз продлений", callback_data="bill:forecast")],
+            [
+                InlineKeyboardButton(text="🏢 По провайдерам", callback_data="bill:by:provider"),
+                InlineKeyboardButton(text="🧩 По ролям", callback_data="bill:by:role"),
+            ],
             [InlineKeyboardButton(text="➕ Добавить оплату", callback_data="bill:add_start")],
         ]
     )
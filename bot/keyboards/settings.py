@@ -11,5 +11,6 @@ def settings_menu_keyboard() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="➖ Удалить из whitelist", callback_data="settings:whitelist:remove")],
             [InlineKeyboardButton(text="🔐 TTL секрета", callback_data="settings:secret_ttl")],
             [InlineKeyboardButton(text="📤 Экспорт JSON", callback_data="settings:export")],
+            [InlineKeyboardButton(text="📥 Импорт", callback_data="settings:import")],
         ]
     )
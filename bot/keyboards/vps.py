@@ -6,7 +6,7 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 def vps_menu_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="📋 Список серверов", callback_data="vps:list:1")],
+            [InlineKeyboardButton(text="📋 Список серверов", callback_data="vps:list:")],
             [InlineKeyboardButton(text="➕ Добавить сервер", callback_data="vps:add")],
             [InlineKeyboardButton(text="🔎 Поиск", callback_data="vps:search")],
             [InlineKeyboardButton(text="⏰ Истекают", callback_data="vps:expiring_menu")],
@@ -25,16 +25,21 @@ def expiring_menu_keyboard() -> InlineKeyboardMarkup:
     )
 
 
-def server_list_keyboard(items: list[tuple[str, str]], page: int, total: int, page_size: int = 5) -> InlineKeyboardMarkup:
+def server_list_keyboard(
+    items: list[tuple[str, str]],
+    prev_cursor: str | None = None,
+    next_cursor: str | None = None,
+    total: int | None = None,
+    callback_prefix: str = "vps:list",
+) -> InlineKeyboardMarkup:
     keyboard = [[InlineKeyboardButton(text=label, callback_data=f"vps:card:{server_id}")] for server_id, label in items]
 
-    max_page = max(1, (total + page_size - 1) // page_size)
-    if total > page_size:
+    if prev_cursor or next_cursor:
         keyboard.append(
             [
-                InlineKeyboardButton(text="⬅️", callback_data=f"vps:list:{max(1, page - 1)}"),
-                InlineKeyboardButton(text=f"{page}/{max_page}", callback_data="noop"),
-                InlineKeyboardButton(text="➡️", callback_data=f"vps:list:{min(max_page, page + 1)}"),
+                InlineKeyboardButton(text="⬅️", callback_data=f"{callback_prefix}:{prev_cursor}" if prev_cursor else "noop"),
+                InlineKeyboardButton(text=f"Всего: {total}" if total is not None else "·", callback_data="noop"),
+                InlineKeyboardButton(text="➡️", callback_data=f"{callback_prefix}:{next_cursor}" if next_cursor else "noop"),
             ]
         )
 
@@ -46,7 +51,7 @@ def server_card_keyboard(server_id: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(text="🗑 Удалить", callback_data=f"vps:delete_ask:{server_id}")],
-            [InlineKeyboardButton(text="⬅ Назад", callback_data="vps:list:1")],
+            [InlineKeyboardButton(text="⬅ Назад", callback_data="vps:list:")],
         ]
     )
 
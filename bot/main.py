@@ -5,49 +5,93 @@ import logging
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.fsm.storage.base import BaseStorage
+from aiohttp import web
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 from bot.config import get_settings
-from bot.dependencies import build_services
+from bot.dependencies import AppServices, build_services
+from bot.fsm_storage import build_fsm_storage
 from bot.handlers import billing_handlers, manual_handlers, menu_handlers, settings_handlers, vps_handlers
 from bot.logging import setup_logging
+from bot.metrics_server import start_metrics_server
+from bot.middlewares.metrics import HandlerMetricsMiddleware, TelegramApiMetrics
+from bot.middlewares.query_stats import QueryStatsMiddleware
 from bot.middlewares.services import ServiceMiddleware
+from bot.middlewares.unit_of_work import UnitOfWorkMiddleware
 from bot.middlewares.whitelist import WhitelistMiddleware
-from db.session import create_engine, create_session_factory
+from bot.webhook import run_webhook
+from db.instrumentation import instrument_engine
+from db.session import create_engine, create_session_factory, observe_pool
 from migrations.schema_manager import ensure_schema
 
 logger = logging.getLogger(__name__)
 
 
+def build_dispatcher(
+    services: AppServices,
+    storage: BaseStorage | None = None,
+    engine: AsyncEngine | None = None,
+) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
+    dp.update.middleware(QueryStatsMiddleware())
+    dp.update.middleware(ServiceMiddleware(services))
+    dp.update.middleware(WhitelistMiddleware(services.access))
+    # Внутренние middleware: к этому моменту фильтры пройдены и известен конкретный обработчик.
+    dp.message.middleware(HandlerMetricsMiddleware(services.metrics))
+    dp.callback_query.middleware(HandlerMetricsMiddleware(services.metrics))
+    if engine is not None:
+        # Одна транзакция и одно соединение на обработчик; флаги обработчика могут от неё отказаться.
+        dp.message.middleware(UnitOfWorkMiddleware(engine))
+        dp.callback_query.middleware(UnitOfWorkMiddleware(engine))
+
+    dp.include_router(menu_handlers.router)
+    dp.include_router(vps_handlers.router)
+    dp.include_router(billing_handlers.router)
+    dp.include_router(manual_handlers.router)
+    dp.include_router(settings_handlers.router)
+    return dp
+
+
 async def main() -> None:
     setup_logging()
     settings = get_settings()
 
     engine = create_engine(settings)
+    instrument_engine(engine)
     session_factory = create_session_factory(engine)
     await ensure_schema(engine, session_factory)
 
     bot = Bot(token=settings.bot_token, default=DefaultBotProperties(parse_mode="HTML"))
     services = build_services(settings, bot, session_factory, engine)
+    bot.session.middleware(TelegramApiMetrics(services.metrics))
+    observe_pool(engine, services.metrics)
 
+    await services.settings.start()
     await services.access.bootstrap_admin(settings.admin_telegram_id)
+    await services.billing.refresh_stale_next_expiry()
 
-    dp = Dispatcher()
-    dp.update.middleware(ServiceMiddleware(services))
-    dp.update.middleware(WhitelistMiddleware(services.access))
-
-    dp.include_router(menu_handlers.router)
-    dp.include_router(vps_handlers.router)
-    dp.include_router(billing_handlers.router)
-    dp.include_router(manual_handlers.router)
-    dp.include_router(settings_handlers.router)
-
+    dp = build_dispatcher(services, build_fsm_storage(settings, session_factory), engine)
     services.reminders.start()
+    await services.deletions.start()
+    metrics_runner: web.AppRunner | None = None
+    if settings.metrics_port:
+        metrics_runner = await start_metrics_server(services.metrics, settings.metrics_host, settings.metrics_port)
 
-    logger.info("Бот запущен")
+    logger.info("Бот запущен (режим: %s)", settings.run_mode)
     try:
-        await dp.start_polling(bot)
+        if settings.run_mode == "webhook":
+            await run_webhook(dp, bot, settings)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot, tasks_concurrency_limit=settings.webhook_max_concurrency)
     finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
         services.reminders.shutdown()
+        await services.deletions.shutdown()
+        await services.settings.stop()
+        await dp.storage.close()
         await bot.session.close()
         await engine.dispose()
 
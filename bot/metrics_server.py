@@ -0,0 +1,31 @@
+﻿from __future__ import annotations
+
+import logging
+
+from aiohttp import web
+
+from services.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def create_metrics_app(metrics: MetricsRegistry) -> web.Application:
+    async def handle_metrics(_request: web.Request) -> web.Response:
+        response = web.Response(text=metrics.render_prometheus())
+        response.headers["Content-Type"] = METRICS_CONTENT_TYPE
+        return response
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+async def start_metrics_server(metrics: MetricsRegistry, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(create_metrics_app(metrics), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info("Метрики Prometheus: http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,100 @@
+﻿from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from services.metrics import MetricsRegistry
+
+HANDLER_DURATION = "bot_handler_duration_seconds"
+HANDLER_ERRORS = "bot_handler_errors_total"
+API_DURATION = "telegram_api_duration_seconds"
+API_RETRY_AFTER = "telegram_api_retry_after_total"
+API_ERRORS = "telegram_api_errors_total"
+
+
+def handler_label(data: dict[str, Any]) -> str:
+    handler_object = data.get("handler")
+    callback = getattr(handler_object, "callback", None)
+    if callback is None:
+        return "unknown"
+    module = getattr(callback, "__module__", "").rsplit(".", 1)[-1]
+    return f"{module}.{getattr(callback, '__name__', type(callback).__name__)}"
+
+
+def route_label(event: TelegramObject, data: dict[str, Any]) -> str:
+    # В метку идут только первые два сегмента callback_data — без id и курсоров,
+    # иначе число временных рядов растёт с каждой записью.
+    if isinstance(event, CallbackQuery):
+        return ":".join((event.data or "").split(":")[:2]) or "callback"
+    if isinstance(event, Message):
+        text = event.text or ""
+        if text.startswith("/"):
+            return text.split(maxsplit=1)[0].split("@", 1)[0]
+        return data.get("raw_state") or "message"
+    return type(event).__name__
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, metrics: MetricsRegistry) -> None:
+        self._metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        labels = {"handler": handler_label(data), "route": route_label(event, data)}
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self._metrics.inc(HANDLER_ERRORS, labels=labels, help_text="Исключения в обработчиках")
+            raise
+        finally:
+            self._metrics.observe(
+                HANDLER_DURATION,
+                time.perf_counter() - started,
+                labels=labels,
+                help_text="Время выполнения обработчика",
+            )
+
+
+class TelegramApiMetrics(BaseRequestMiddleware):
+    def __init__(self, metrics: MetricsRegistry) -> None:
+        self._metrics = metrics
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        labels = {"method": method.__api_method__}
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            self._metrics.inc(API_RETRY_AFTER, labels=labels, help_text="Ответы Telegram с retry_after (flood control)")
+            raise
+        except TelegramAPIError as exc:
+            self._metrics.inc(
+                API_ERRORS,
+                labels={**labels, "error": type(exc).__name__},
+                help_text="Ошибки Telegram Bot API",
+            )
+            raise
+        finally:
+            self._metrics.observe(
+                API_DURATION,
+                time.perf_counter() - started,
+                labels=labels,
+                help_text="Время запроса к Telegram Bot API",
+            )
@@ -0,0 +1,37 @@
+﻿from __future__ import annotations
+
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from db.instrumentation import REPEAT_THRESHOLD, track_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStatsMiddleware(BaseMiddleware):
+    def __init__(self, repeat_threshold: int = REPEAT_THRESHOLD) -> None:
+        self._repeat_threshold = repeat_threshold
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        label = f"update {event.update_id} ({event.event_type})" if isinstance(event, Update) else type(event).__name__
+        with track_queries(label) as stats:
+            try:
+                return await handler(event, data)
+            finally:
+                logger.debug(
+                    "%s: запросов %s, соединений %s, SQL %.1f мс",
+                    stats.label,
+                    stats.queries,
+                    stats.connections,
+                    stats.total_time * 1000,
+                )
+                for statement, count in stats.repeated(self._repeat_threshold):
+                    logger.warning("%s: возможный N+1 — запрос выполнен %s раз: %s", stats.label, count, " ".join(statement.split())[:300])
@@ -0,0 +1,28 @@
+﻿from __future__ import annotations
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from db.unit_of_work import unit_of_work
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    def __init__(self, engine: AsyncEngine) -> None:
+        self._engine = engine
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        # Экспорт и импорт (flags={"unit_of_work": False}) работают через свои соединения:
+        # внутри общей транзакции апдейт держал бы из пула сразу два соединения.
+        if not get_flag(data, "unit_of_work", default=True):
+            return await handler(event, data)
+        async with unit_of_work(self._engine):
+            return await handler(event, data)
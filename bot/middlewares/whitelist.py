@@ -32,8 +32,8 @@ class WhitelistMiddleware(BaseMiddleware):
             # на обязательном параметре user_id.
             return None
 
-        allowed = await self._access_service.is_allowed(user_id)
-        if not allowed:
+        role = await self._access_service.get_role(user_id)
+        if not role.allowed:
             if isinstance(event, Message):
                 await event.answer("Доступ запрещён.")
             elif isinstance(event, CallbackQuery):
@@ -41,5 +41,5 @@ class WhitelistMiddleware(BaseMiddleware):
             return None
 
         data["user_id"] = user_id
-        data["is_admin"] = await self._access_service.is_admin(user_id)
+        data["is_admin"] = role.is_admin
         return await handler(event, data)
@@ -6,6 +6,8 @@ class AddManualStates(StatesGroup):
     category = State()
     tags = State()
     body = State()
+    input = State()
+    preview = State()
 
 
 class SearchManualState(StatesGroup):
@@ -8,3 +8,7 @@ class WhitelistStates(StatesGroup):
 
 class SettingsStates(StatesGroup):
     set_secret_ttl = State()
+
+
+class ImportStates(StatesGroup):
+    upload = State()
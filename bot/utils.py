@@ -1,24 +1,53 @@
 ﻿from __future__ import annotations
 
-import asyncio
-from datetime import datetime
+import html
+import re
+from datetime import date, datetime
 
 from aiogram import Bot
-from aiogram.types import Message
+from aiogram.types import InaccessibleMessage, Message
+
+from services.clock import utc_today
+from services.deletion_scheduler import DeletionScheduler
+from services.view_cache import RenderedView
+
+_HTML_TAG = re.compile(r"<[^>]+>")
 
 
 def parse_date_ru(text: str) -> datetime.date:
     return datetime.strptime(text.strip(), "%d.%m.%Y").date()
 
 
-async def send_temporary_secret(bot: Bot, chat_id: int, text: str, ttl_seconds: int) -> None:
+def status_marker(expires_at: date | None) -> tuple[str, str]:
+    if expires_at is None:
+        return "⚪", "📅 Нет даты"
+
+    days_left = (expires_at - utc_today()).days
+    if days_left <= 1:
+        if days_left < 0:
+            return "🔴", "⚠ Просрочен"
+        if days_left == 0:
+            return "🔴", "⚠ Истекает сегодня"
+        return "🔴", "⚠ Истекает завтра"
+    if days_left <= 14:
+        return "🟡", f"⚠ {days_left} дней"
+    return "🟢", f"📅 До {expires_at.strftime('%d.%m.%Y')}"
+
+
+async def send_temporary_secret(
+    bot: Bot, deletions: DeletionScheduler, chat_id: int, text: str, ttl_seconds: int
+) -> None:
     msg = await bot.send_message(chat_id, text)
+    await deletions.schedule(msg.chat.id, msg.message_id, ttl_seconds)
+
+
+def _visible_text(text: str) -> str:
+    return html.unescape(_HTML_TAG.sub("", text)).strip()
 
-    async def _delete_later(message: Message) -> None:
-        await asyncio.sleep(ttl_seconds)
-        try:
-            await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-        except Exception:  # noqa: BLE001
-            return
 
-    asyncio.create_task(_delete_later(msg))
+async def show_view(message: Message | InaccessibleMessage, view: RenderedView) -> None:
+    # Повторный тап по тому же экрану не ходит в Bot API: Telegram всё равно
+    # ответил бы ошибкой «message is not modified».
+    if getattr(message, "text", None) == _visible_text(view.text) and getattr(message, "reply_markup", None) == view.reply_markup:
+        return
+    await message.edit_text(view.text, reply_markup=view.reply_markup)
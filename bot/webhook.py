@@ -0,0 +1,72 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from bot.config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int, **kwargs: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        # Пока все слоты заняты, ответ Telegram задерживается — это и есть
+        # обратное давление: новые апдейты не копятся в памяти без предела.
+        await self._slots.acquire()
+        try:
+            return await super()._handle_request_background(bot=bot, request=request)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _background_feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        try:
+            await super()._background_feed_update(bot=bot, update=update)
+        finally:
+            self._slots.release()
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot, settings: Settings, **data: Any) -> web.Application:
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher,
+        bot,
+        max_concurrency=settings.webhook_max_concurrency,
+        secret_token=settings.webhook_secret,
+        **data,
+    )
+    handler.register(app, path=settings.webhook_path)
+    setup_application(app, dispatcher, bot=bot, **data)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, settings: Settings) -> None:
+    app = create_webhook_app(dispatcher, bot, settings)
+    if settings.webhook_base_url:
+        await bot.set_webhook(
+            url=settings.webhook_base_url.rstrip("/") + settings.webhook_path,
+            secret_token=settings.webhook_secret,
+            max_connections=settings.webhook_max_concurrency,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+    else:
+        logger.warning("WEBHOOK_BASE_URL не задан: setWebhook не вызывается, ожидаются локальные запросы")
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=settings.webhook_host, port=settings.webhook_port)
+    await site.start()
+    logger.info("Webhook слушает %s:%s%s", settings.webhook_host, settings.webhook_port, settings.webhook_path)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -1,11 +1,17 @@
 ﻿from __future__ import annotations
 
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 
 
 class SecretCipher:
+    # BOT_MASTER_KEY может содержать несколько ключей через запятую: первый
+    # шифрует, расшифровывают все — так старый ключ живёт, пока идёт ротация.
     def __init__(self, key: str) -> None:
-        self._fernet = Fernet(key.encode("utf-8"))
+        fernets = [Fernet(item.strip().encode("utf-8")) for item in key.split(",") if item.strip()]
+        if not fernets:
+            raise ValueError("BOT_MASTER_KEY не задан")
+        self._primary = fernets[0]
+        self._fernet = MultiFernet(fernets)
 
     def encrypt(self, plaintext: str) -> str:
         token = self._fernet.encrypt(plaintext.encode("utf-8"))
@@ -17,3 +23,17 @@ class SecretCipher:
         except InvalidToken as exc:
             raise ValueError("Не удалось расшифровать секрет") from exc
         return value.decode("utf-8")
+
+    def is_current(self, ciphertext: str) -> bool:
+        try:
+            self._primary.decrypt(ciphertext.encode("utf-8"))
+        except InvalidToken:
+            return False
+        return True
+
+    def rotate(self, ciphertext: str) -> str:
+        try:
+            token = self._fernet.rotate(ciphertext.encode("utf-8"))
+        except InvalidToken as exc:
+            raise ValueError("Не удалось расшифровать секрет") from exc
+        return token.decode("utf-8")
@@ -0,0 +1,72 @@
+﻿from __future__ import annotations
+
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+REPEAT_THRESHOLD = 5
+
+
+@dataclass
+class QueryStats:
+    label: str = ""
+    queries: int = 0
+    total_time: float = 0.0
+    connections: int = 0
+    statements: Counter[str] = field(default_factory=Counter)
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD) -> list[tuple[str, int]]:
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> QueryStats | None:
+    return _current_stats.get()
+
+
+@contextmanager
+def track_queries(label: str = "") -> Iterator[QueryStats]:
+    stats = QueryStats(label=label)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.total_time += time.perf_counter() - conn.info.get("query_started", time.perf_counter())
+    # Параметры не учитываются: один и тот же SQL с разными id — типичный N+1.
+    stats.statements[statement] += 1
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.connections += 1
+
+
+def instrument_engine(engine: Engine | AsyncEngine) -> None:
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine.pool, "checkout", _on_checkout)
@@ -20,8 +20,9 @@ from sqlalchemy import (
     Text,
     UniqueConstraint,
     func,
+    text,
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from db.base import Base
@@ -73,6 +74,14 @@ class Server(Base):
     __table_args__ = (
         UniqueConstraint("owner_telegram_id", "name", name="uq_server_owner_name"),
         Index("ix_servers_owner_name", "owner_telegram_id", "name"),
+        Index("ix_servers_owner_keyset", "owner_telegram_id", text("(NOT is_favorite)"), "name", "id"),
+        Index("ix_servers_owner_favorites", "owner_telegram_id", "name", postgresql_where=text("is_favorite")),
+        Index("ix_servers_owner_next_expires", "owner_telegram_id", "next_expires_at"),
+        Index("ix_servers_next_expires", "next_expires_at"),
+        Index("ix_servers_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_servers_ip4_trgm", "ip4", postgresql_using="gin", postgresql_ops={"ip4": "gin_trgm_ops"}),
+        Index("ix_servers_provider_trgm", "provider", postgresql_using="gin", postgresql_ops={"provider": "gin_trgm_ops"}),
+        Index("ix_servers_notes_trgm", "notes", postgresql_using="gin", postgresql_ops={"notes": "gin_trgm_ops"}),
     )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -93,6 +102,8 @@ class Server(Base):
     ram_load: Mapped[float | None] = mapped_column(Numeric(5, 2), nullable=True)
     disk_load: Mapped[float | None] = mapped_column(Numeric(5, 2), nullable=True)
     net_notes: Mapped[str | None] = mapped_column(Text, nullable=True)
+    next_expires_at: Mapped[date | None] = mapped_column(Date, nullable=True)
+    next_billing_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
@@ -117,6 +128,8 @@ class Billing(Base):
     __tablename__ = "billings"
     __table_args__ = (
         Index("ix_billings_expires_at", "expires_at"),
+        Index("ix_billings_server_expires", "server_id", "expires_at"),
+        Index("ix_billings_server_paid", "server_id", "paid_at", "id"),
         CheckConstraint("price_amount >= 0", name="ck_billings_price_non_negative"),
     )
 
@@ -133,14 +146,28 @@ class Billing(Base):
     server: Mapped[Server] = relationship(back_populates="billings")
 
 
+class SpendingRollup(Base):
+    __tablename__ = "spending_rollups"
+
+    owner_telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    currency: Mapped[str] = mapped_column(String(10), primary_key=True)
+    provider: Mapped[str] = mapped_column(String(100), primary_key=True)
+    role: Mapped[ServerRole] = mapped_column(Enum(ServerRole, name="server_role_enum"), primary_key=True)
+    total: Mapped[Decimal] = mapped_column(Numeric(14, 2))
+    billings_count: Mapped[int] = mapped_column(Integer)
+
+
 class Manual(Base):
     __tablename__ = "manuals"
+    __table_args__ = (Index("ix_manuals_search_vector", "search_vector", postgresql_using="gin"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     owner_telegram_id: Mapped[int] = mapped_column(BigInteger, index=True)
     title: Mapped[str] = mapped_column(String(200), index=True)
     category: Mapped[ManualCategory] = mapped_column(Enum(ManualCategory, name="manual_category_enum"), default=ManualCategory.OTHER)
     body_markdown: Mapped[str] = mapped_column(Text)
+    search_vector: Mapped[str | None] = mapped_column(TSVECTOR, nullable=True, deferred=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
@@ -160,6 +187,33 @@ class ManualTag(Base):
     manual: Mapped[Manual] = relationship(back_populates="tags")
 
 
+class ReminderDelivery(Base):
+    __tablename__ = "reminder_deliveries"
+
+    billing_id: Mapped[int] = mapped_column(Integer, ForeignKey("billings.id", ondelete="CASCADE"), primary_key=True)
+    threshold_days: Mapped[int] = mapped_column(Integer, primary_key=True)
+    recipient_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    claimed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class PendingDeletion(Base):
+    __tablename__ = "pending_deletions"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    message_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    delete_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSONB, default=dict, server_default=text("'{}'::jsonb"))
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
 class SchemaVersion(Base):
     __tablename__ = "schema_version"
 
@@ -1,12 +1,57 @@
 ﻿from __future__ import annotations
 
+import time
+from collections.abc import Callable
+
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from bot.config import Settings
+from services.metrics import MetricsRegistry
+
+POOL_WAIT = "db_pool_wait_seconds"
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    wait_observer: Callable[[float], None] | None = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.wait_observer is not None:
+                self.wait_observer(time.perf_counter() - started)
+
+    def recreate(self) -> TimedQueuePool:
+        pool = super().recreate()
+        pool.wait_observer = self.wait_observer
+        return pool
 
 
 def create_engine(settings: Settings) -> AsyncEngine:
-    return create_async_engine(settings.database_url, echo=False, pool_pre_ping=True)
+    return create_async_engine(
+        settings.database_url,
+        echo=False,
+        pool_pre_ping=True,
+        poolclass=TimedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+    )
+
+
+def observe_pool(engine: AsyncEngine, metrics: MetricsRegistry) -> None:
+    # Пул берём через engine при каждом чтении: после dispose() он пересоздаётся.
+    def pool():
+        return engine.sync_engine.pool
+
+    if isinstance(pool(), TimedQueuePool):
+        pool().wait_observer = lambda seconds: metrics.observe(
+            POOL_WAIT, seconds, help_text="Ожидание свободного соединения в пуле"
+        )
+    metrics.gauge("db_pool_size", lambda: pool().size(), help_text="Размер пула соединений")
+    metrics.gauge("db_pool_checked_out", lambda: pool().checkedout(), help_text="Соединения, выданные из пула")
+    metrics.gauge("db_pool_overflow", lambda: max(0, pool().overflow()), help_text="Соединения сверх размера пула")
 
 
 def create_session_factory(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
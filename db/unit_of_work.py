@@ -0,0 +1,96 @@
+﻿from __future__ import annotations
+
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, AsyncTransaction, async_sessionmaker
+
+
+class UnitOfWork:
+    def __init__(self, engine: AsyncEngine) -> None:
+        self._engine = engine
+        self._connection: AsyncConnection | None = None
+        self._transaction: AsyncTransaction | None = None
+        self.closed = False
+        self._after_commit: list[Callable[[], None]] = []
+
+    async def connection(self) -> AsyncConnection:
+        # Соединение берётся из пула только при первом обращении к БД:
+        # апдейты, обслуженные из кэша, пул не трогают.
+        if self._connection is None:
+            self._connection = await self._engine.connect()
+            self._transaction = await self._connection.begin()
+        return self._connection
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        self._after_commit.append(callback)
+
+    async def commit(self) -> None:
+        if self._transaction is not None and self._transaction.is_active:
+            await self._transaction.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    async def rollback(self) -> None:
+        self._after_commit.clear()
+        if self._transaction is not None and self._transaction.is_active:
+            await self._transaction.rollback()
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+        self._connection = None
+        self._transaction = None
+        self.closed = True
+
+
+_current_uow: ContextVar[UnitOfWork | None] = ContextVar("unit_of_work", default=None)
+
+
+def current_unit_of_work() -> UnitOfWork | None:
+    return _current_uow.get()
+
+
+def on_commit(callback: Callable[[], None]) -> None:
+    # Сброс кэшей после записи: внутри апдейта — только когда транзакция зафиксирована,
+    # иначе параллельный апдейт успеет закэшировать старое значение.
+    uow = _current_uow.get()
+    if uow is None or uow.closed:
+        callback()
+    else:
+        uow.after_commit(callback)
+
+
+@asynccontextmanager
+async def unit_of_work(engine: AsyncEngine) -> AsyncIterator[UnitOfWork]:
+    uow = UnitOfWork(engine)
+    token = _current_uow.set(uow)
+    try:
+        yield uow
+        await uow.commit()
+    except BaseException:
+        await uow.rollback()
+        raise
+    finally:
+        _current_uow.reset(token)
+        await uow.close()
+
+
+@asynccontextmanager
+async def session_scope(session_factory: async_sessionmaker[AsyncSession]) -> AsyncIterator[AsyncSession]:
+    uow = _current_uow.get()
+    # Задачи, запущенные из обработчика, наследуют контекст и могут пережить апдейт —
+    # к закрытой единице работы они не присоединяются.
+    if uow is None or uow.closed:
+        async with session_factory() as session:
+            yield session
+        return
+
+    # Внутри апдейта сессия работает в SAVEPOINT общей транзакции: commit() сервиса
+    # освобождает savepoint, а ошибка откатывает только его — обработчик может её
+    # перехватить и продолжить. Сама транзакция фиксируется после обработчика.
+    connection = await uow.connection()
+    async with session_factory(bind=connection, join_transaction_mode="create_savepoint") as session:
+        yield session
@@ -9,11 +9,13 @@ from db.base import Base
 from db.models import SchemaVersion
 
 logger = logging.getLogger(__name__)
-CURRENT_SCHEMA_VERSION = 2
+CURRENT_SCHEMA_VERSION = 11
+TRGM_SEARCH_COLUMNS = ("name", "ip4", "provider", "notes")
 
 
 async def ensure_schema(engine: AsyncEngine, session_factory: async_sessionmaker) -> None:
     async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
 
     async with session_factory() as session:
@@ -41,3 +43,124 @@ async def apply_manual_migrations(engine: AsyncEngine, from_version: int, to_ver
                 text("CREATE INDEX IF NOT EXISTS ix_servers_owner_name ON servers (owner_telegram_id, name)")
             )
         logger.info("Миграция v2: удалено поле status и связанные объекты.")
+
+    if from_version < 3 <= to_version:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("CREATE INDEX IF NOT EXISTS ix_billings_server_expires ON billings (server_id, expires_at)")
+            )
+        logger.info("Миграция v3: индекс billings (server_id, expires_at) для пакетного поиска истечений.")
+
+    if from_version < 4 <= to_version:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_servers_owner_keyset "
+                    "ON servers (owner_telegram_id, (NOT is_favorite), name, id)"
+                )
+            )
+        logger.info("Миграция v4: индекс для keyset-пагинации списка серверов.")
+
+    if from_version < 5 <= to_version:
+        async with engine.begin() as conn:
+            for column in TRGM_SEARCH_COLUMNS:
+                await conn.execute(
+                    text(
+                        f"CREATE INDEX IF NOT EXISTS ix_servers_{column}_trgm "
+                        f"ON servers USING gin ({column} gin_trgm_ops)"
+                    )
+                )
+        logger.info("Миграция v5: триграммные GIN-индексы для поиска серверов.")
+
+    if from_version < 6 <= to_version:
+        async with engine.begin() as conn:
+            await conn.execute(text("ALTER TABLE manuals ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+            await conn.execute(
+                text("CREATE INDEX IF NOT EXISTS ix_manuals_search_vector ON manuals USING gin (search_vector)")
+            )
+            await conn.execute(
+                text(
+                    "UPDATE manuals m SET search_vector = "
+                    "setweight(to_tsvector('simple', m.title), 'A') || "
+                    "setweight(to_tsvector('simple', coalesce("
+                    "(SELECT string_agg(t.tag, ' ') FROM manual_tags t WHERE t.manual_id = m.id), '')), 'B') || "
+                    "setweight(to_tsvector('simple', m.body_markdown), 'C')"
+                )
+            )
+        logger.info("Миграция v6: полнотекстовый индекс мануалов (search_vector).")
+
+    if from_version < 7 <= to_version:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_servers_owner_favorites "
+                    "ON servers (owner_telegram_id, name) WHERE is_favorite"
+                )
+            )
+        logger.info("Миграция v7: частичный индекс избранных серверов.")
+
+    if from_version < 8 <= to_version:
+        async with engine.begin() as conn:
+            await conn.execute(text("ALTER TABLE servers ADD COLUMN IF NOT EXISTS next_expires_at DATE"))
+            await conn.execute(text("ALTER TABLE servers ADD COLUMN IF NOT EXISTS next_billing_id INTEGER"))
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_servers_owner_next_expires "
+                    "ON servers (owner_telegram_id, next_expires_at)"
+                )
+            )
+            await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_servers_next_expires ON servers (next_expires_at)"))
+            await conn.execute(
+                text(
+                    "UPDATE servers s SET next_billing_id = nb.id, next_expires_at = nb.expires_at "
+                    "FROM (SELECT DISTINCT ON (server_id) id, server_id, expires_at FROM billings "
+                    "WHERE expires_at >= CURRENT_DATE ORDER BY server_id, expires_at, id) nb "
+                    "WHERE nb.server_id = s.id"
+                )
+            )
+        logger.info("Миграция v8: servers.next_expires_at/next_billing_id заполнены из billings.")
+
+    if from_version < 9 <= to_version:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("CREATE INDEX IF NOT EXISTS ix_billings_server_paid ON billings (server_id, paid_at, id)")
+            )
+        logger.info("Миграция v9: создан индекс billings(server_id, paid_at, id) для последней оплаты.")
+
+    if from_version < 10 <= to_version:
+        # Таблицу создал create_all, здесь только первичное заполнение куба из истории оплат.
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM spending_rollups"))
+            await conn.execute(
+                text(
+                    "INSERT INTO spending_rollups "
+                    "(owner_telegram_id, month, currency, provider, role, total, billings_count) "
+                    "SELECT s.owner_telegram_id, date_trunc('month', b.paid_at)::date, b.price_currency, "
+                    "s.provider, s.role, sum(b.price_amount), count(b.id) "
+                    "FROM billings b JOIN servers s ON s.id = b.server_id "
+                    "GROUP BY 1, 2, 3, 4, 5"
+                )
+            )
+        logger.info("Миграция v10: spending_rollups заполнена из billings.")
+
+    if from_version < 11 <= to_version:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "ALTER TABLE reminder_deliveries "
+                    "ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()"
+                )
+            )
+            # Прежние записи появлялись только при отправке — считаем их доставленными.
+            await conn.execute(text("UPDATE reminder_deliveries SET claimed_at = sent_at WHERE sent_at IS NOT NULL"))
+            await conn.execute(
+                text("ALTER TABLE reminder_deliveries ALTER COLUMN sent_at DROP NOT NULL, ALTER COLUMN sent_at DROP DEFAULT")
+            )
+            await conn.execute(text("DROP INDEX IF EXISTS ix_reminder_deliveries_sent_at"))
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_reminder_deliveries_claimed_at "
+                    "ON reminder_deliveries (claimed_at)"
+                )
+            )
+        logger.info("Миграция v11: reminder_deliveries.claimed_at, sent_at ставится после отправки.")
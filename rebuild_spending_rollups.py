@@ -0,0 +1,36 @@
+﻿import argparse
+import asyncio
+
+from bot.config import get_settings
+from bot.logging import setup_logging
+from db.session import create_engine, create_session_factory
+from services.billing_service import BillingService
+from services.view_cache import ViewCache
+
+
+async def run(owner_telegram_id: int | None) -> int:
+    settings = get_settings()
+    engine = create_engine(settings)
+    # Работающие боты сбросят кэш экранов по уведомлению.
+    views = ViewCache(broadcast=engine.dialect.driver == "asyncpg")
+    service = BillingService(create_session_factory(engine), views)
+    try:
+        rows = await service.rebuild_spending_rollup(owner_telegram_id)
+    finally:
+        await engine.dispose()
+
+    scope = "всех владельцев" if owner_telegram_id is None else f"владельца {owner_telegram_id}"
+    print(f"Куб расходов пересобран для {scope}: строк {rows}")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пересобрать куб расходов spending_rollups из истории оплат")
+    parser.add_argument("--owner", type=int, default=None, help="telegram id владельца; по умолчанию — все")
+    args = parser.parse_args()
+    setup_logging()
+    raise SystemExit(asyncio.run(run(args.owner)))
+
+
+if __name__ == "__main__":
+    main()
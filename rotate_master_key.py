@@ -0,0 +1,40 @@
+﻿import argparse
+import asyncio
+
+from bot.config import get_settings
+from bot.logging import setup_logging
+from crypto.secrets import SecretCipher
+from db.session import create_engine, create_session_factory
+from services.key_rotation_service import KeyRotationService
+
+
+async def run(verify: bool, restart: bool) -> int:
+    settings = get_settings()
+    engine = create_engine(settings)
+    service = KeyRotationService(create_session_factory(engine), SecretCipher(settings.bot_master_key))
+    try:
+        if verify:
+            report = await service.verify()
+            print(f"Проверено: {report.scanned}, на старых ключах: {report.stale}, не расшифровано: {len(report.failed)}")
+        else:
+            report = await service.rotate(restart=restart)
+            print(f"Просмотрено: {report.scanned}, перешифровано: {report.rotated}, не расшифровано: {len(report.failed)}")
+    finally:
+        await engine.dispose()
+
+    for server_id in report.failed:
+        print(f"  {server_id}")
+    return 1 if report.failed or (verify and report.stale) else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Перешифровать секреты серверов новым мастер-ключом")
+    parser.add_argument("--verify", action="store_true", help="только проверить, что все секреты расшифровываются")
+    parser.add_argument("--restart", action="store_true", help="начать заново, игнорируя сохранённую позицию")
+    args = parser.parse_args()
+    setup_logging()
+    raise SystemExit(asyncio.run(run(args.verify, args.restart)))
+
+
+if __name__ == "__main__":
+    main()
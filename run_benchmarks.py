@@ -0,0 +1,252 @@
+﻿import argparse
+import asyncio
+import base64
+import os
+import random
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from benchmarks.cases import build_cases
+from benchmarks.dataset import DatasetSpec, generate, seed
+from benchmarks.replay import REPLAY_TOKEN, SCENARIOS, RecordingSession, run_scenario
+from benchmarks.runner import DEFAULT_TOLERANCE, build_report, compare, load_report, measure, write_report
+from bot.config import Settings
+from bot.dependencies import build_services
+from bot.fsm_storage import build_fsm_storage
+from bot.logging import setup_logging
+from bot.main import build_dispatcher
+from bot.middlewares.metrics import HANDLER_DURATION, TelegramApiMetrics
+from crypto.secrets import SecretCipher
+from db.instrumentation import instrument_engine
+from db.models import AppSetting, Server
+from db.session import TimedQueuePool, create_session_factory, observe_pool
+from migrations.schema_manager import ensure_schema
+from services.billing_service import BillingService
+from services.export_import_service import ExportImportService
+from services.forecast_service import ForecastService
+from services.manual_service import ManualService
+from services.server_service import ServerService
+
+DATASET_KEY = "benchmark_dataset"
+SEEDED_TABLES = "servers, server_tags, billings, spending_rollups, manuals, manual_tags, reminder_deliveries"
+
+
+def _master_key(seed_value: int) -> str:
+    return base64.urlsafe_b64encode(random.Random(seed_value).randbytes(32)).decode("ascii")
+
+
+async def prepare(session_factory, spec: DatasetSpec, cipher: SecretCipher, reset: bool):
+    dataset = generate(spec)
+    fingerprint = dataset.fingerprint()
+    async with session_factory() as session:
+        stored = await session.scalar(select(AppSetting.value).where(AppSetting.key == DATASET_KEY))
+        populated = bool(await session.scalar(select(func.count()).select_from(Server)))
+        if stored == fingerprint and not reset:
+            print(f"Набор данных {fingerprint} уже загружен")
+            return dataset, fingerprint
+        if populated and not reset:
+            raise SystemExit("База не пуста и содержит другой набор данных: запустите с --reset")
+        await session.execute(text(f"TRUNCATE {SEEDED_TABLES} RESTART IDENTITY CASCADE"))
+        await session.commit()
+
+    started = time.perf_counter()
+    await seed(session_factory, dataset, cipher)
+    async with session_factory() as session:
+        statement = insert(AppSetting).values(key=DATASET_KEY, value=fingerprint)
+        await session.execute(
+            statement.on_conflict_do_update(index_elements=[AppSetting.key], set_={"value": statement.excluded.value})
+        )
+        # Свежая статистика, иначе планировщик оценивает только что залитые таблицы как пустые.
+        await session.execute(text(f"ANALYZE {SEEDED_TABLES}"))
+        await session.commit()
+    print(f"Набор данных {fingerprint} загружен за {time.perf_counter() - started:.1f} с")
+    return dataset, fingerprint
+
+
+def _database_url(args: argparse.Namespace) -> str:
+    database_url = args.database_url or os.environ.get("BENCH_DATABASE_URL")
+    if not database_url:
+        raise SystemExit("Укажите --database-url или BENCH_DATABASE_URL (отдельная база, данные в ней будут перезаписаны)")
+    return database_url
+
+
+async def run(args: argparse.Namespace) -> int:
+    database_url = _database_url(args)
+    spec = DatasetSpec(seed=args.seed).scaled(args.scale)
+    cipher = SecretCipher(_master_key(args.seed))
+    engine = create_async_engine(database_url, pool_pre_ping=True, poolclass=TimedQueuePool)
+    instrument_engine(engine)
+    session_factory = create_session_factory(engine)
+    try:
+        await ensure_schema(engine, session_factory)
+        dataset, fingerprint = await prepare(session_factory, spec, cipher, args.reset)
+
+        server_service = ServerService(session_factory, cipher)
+        manual_service = ManualService(session_factory)
+        cases = await build_cases(
+            dataset,
+            server_service,
+            BillingService(session_factory),
+            manual_service,
+            ExportImportService(server_service, manual_service, session_factory, cipher),
+            ForecastService(session_factory),
+            args.iterations,
+        )
+        results = []
+        for case in cases:
+            if args.only and not any(case.name.startswith(prefix) for prefix in args.only):
+                continue
+            result = await measure(case)
+            results.append(result)
+            print(
+                f"{result.name:<40} {result.ops_per_sec:>9.1f} ops/s  "
+                f"p95 {result.p95_ms:>8.2f} мс  запросов {result.queries_per_call:g}"
+            )
+    finally:
+        await engine.dispose()
+
+    report = build_report(results, {"dataset": fingerprint, "spec": asdict(spec), "iterations": args.iterations})
+    write_report(args.output, report)
+    print(f"Результаты: {args.output}")
+    if args.baseline:
+        return report_regressions(load_report(args.baseline), report, args.tolerance)
+    return 0
+
+
+async def replay(args: argparse.Namespace) -> int:
+    database_url = _database_url(args)
+    spec = DatasetSpec(seed=args.seed).scaled(args.scale)
+    cipher = SecretCipher(_master_key(args.seed))
+    if args.users > spec.owners:
+        raise SystemExit(f"--users не больше числа владельцев в наборе ({spec.owners})")
+
+    engine = create_async_engine(database_url, pool_pre_ping=True, poolclass=TimedQueuePool)
+    instrument_engine(engine)
+    session_factory = create_session_factory(engine)
+    await ensure_schema(engine, session_factory)
+    dataset, fingerprint = await prepare(session_factory, spec, cipher, args.reset)
+    user_ids = dataset.owner_ids[: args.users]
+
+    # Та же сборка, что в bot/main.py, только вместо Bot API — сессия-заглушка.
+    settings = Settings(
+        _env_file=None,
+        BOT_TOKEN=REPLAY_TOKEN,
+        DATABASE_URL=database_url,
+        BOT_MASTER_KEY=_master_key(args.seed),
+        ADMIN_TELEGRAM_ID=user_ids[0],
+        FSM_STORAGE=args.fsm_storage,
+    )
+    session = RecordingSession()
+    bot = Bot(token=REPLAY_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    services = build_services(settings, bot, session_factory, engine)
+    bot.session.middleware(TelegramApiMetrics(services.metrics))
+    observe_pool(engine, services.metrics)
+    for user_id in user_ids:
+        await services.access.add_to_whitelist(user_id)
+    await services.settings.warm()
+    dp = build_dispatcher(
+        services,
+        build_fsm_storage(settings, session_factory),
+        None if args.no_unit_of_work else engine,
+    )
+
+    results = {}
+    try:
+        for name in args.scenarios:
+            stats = await run_scenario(dp, bot, session, SCENARIOS[name], user_ids, args.rounds)
+            results[name] = stats.summary()
+            print(
+                f"{name:<16} {results[name]['updates']:>6} апдейтов  {results[name]['updates_per_sec']:>8.1f} upd/s  "
+                f"p50 {results[name]['p50_ms']:>7.2f}  p95 {results[name]['p95_ms']:>7.2f}  "
+                f"p99 {results[name]['p99_ms']:>7.2f} мс  ошибок {results[name]['errors']}"
+            )
+    finally:
+        await dp.storage.close()
+        await bot.session.close()
+        await engine.dispose()
+
+    report = {
+        "meta": {
+            "dataset": fingerprint,
+            "users": args.users,
+            "rounds": args.rounds,
+            "fsm_storage": args.fsm_storage,
+            "unit_of_work": not args.no_unit_of_work,
+            "telegram_calls": len(session.calls),
+        },
+        "scenarios": results,
+        "handlers": [
+            {**item.labels, "count": item.count, "p95_ms": round(item.p95 * 1000, 3)}
+            for item in services.metrics.summaries(HANDLER_DURATION)
+        ],
+    }
+    write_report(args.output, report)
+    print(f"Результаты: {args.output}")
+    return 1 if any(item["errors"] for item in results.values()) else 0
+
+
+def report_regressions(baseline: dict, current: dict, tolerance: float) -> int:
+    if baseline["meta"].get("dataset") != current["meta"].get("dataset"):
+        print("Внимание: базовый прогон сделан на другом наборе данных, сравнение приблизительное")
+    regressions = compare(baseline, current, tolerance)
+    for regression in regressions:
+        print(f"РЕГРЕССИЯ {regression.describe()}")
+    if not regressions:
+        print(f"Регрессий нет (допуск {tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарки сервисного слоя на синтетическом наборе данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="загрузить набор данных и замерить вызовы сервисов")
+    run_parser.add_argument("--database-url", help="отдельная база PostgreSQL (по умолчанию BENCH_DATABASE_URL)")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--scale", type=float, default=1.0, help="множитель размера набора (1.0 — 10k серверов)")
+    run_parser.add_argument("--iterations", type=int, default=50)
+    run_parser.add_argument("--only", nargs="*", help="префиксы имён замеров, например servers. billing.")
+    run_parser.add_argument("--reset", action="store_true", help="очистить таблицы и загрузить набор заново")
+    run_parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    run_parser.add_argument("--baseline", type=Path, help="сравнить с сохранённым прогоном")
+    run_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+
+    replay_parser = commands.add_parser("replay", help="прогнать сценарии апдейтов через полный Dispatcher без Telegram")
+    replay_parser.add_argument("--database-url", help="отдельная база PostgreSQL (по умолчанию BENCH_DATABASE_URL)")
+    replay_parser.add_argument("--seed", type=int, default=42)
+    replay_parser.add_argument("--scale", type=float, default=1.0)
+    replay_parser.add_argument("--reset", action="store_true")
+    replay_parser.add_argument("--users", type=int, default=10, help="число одновременных пользователей")
+    replay_parser.add_argument("--rounds", type=int, default=20, help="повторов сценария на пользователя")
+    replay_parser.add_argument("--scenarios", nargs="*", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    replay_parser.add_argument("--fsm-storage", choices=("postgres", "memory"), default="postgres")
+    replay_parser.add_argument(
+        "--no-unit-of-work",
+        action="store_true",
+        help="отдельная сессия на каждый вызов сервиса (для сравнения с UnitOfWorkMiddleware)",
+    )
+    replay_parser.add_argument("--output", type=Path, default=Path("replay-results.json"))
+
+    compare_parser = commands.add_parser("compare", help="сравнить два сохранённых прогона")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+
+    args = parser.parse_args()
+    setup_logging()
+    if args.command == "compare":
+        raise SystemExit(report_regressions(load_report(args.baseline), load_report(args.current), args.tolerance))
+    if args.command == "replay":
+        raise SystemExit(asyncio.run(replay(args)))
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,37 @@
 ﻿from __future__ import annotations
 
+from dataclasses import dataclass
+
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from db.models import AccessUser
+from db.unit_of_work import on_commit, session_scope
+from services.cache import TTLCache
+
+ACCESS_CACHE_TTL_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class AccessRole:
+    allowed: bool
+    is_admin: bool
+
+
+DENIED = AccessRole(allowed=False, is_admin=False)
 
 
 class AccessService:
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        cache_ttl_seconds: float = ACCESS_CACHE_TTL_SECONDS,
+    ) -> None:
         self._session_factory = session_factory
+        self._cache: TTLCache[int, AccessRole] = TTLCache(cache_ttl_seconds)
 
     async def bootstrap_admin(self, admin_telegram_id: int) -> None:
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             user = await session.scalar(select(AccessUser).where(AccessUser.telegram_id == admin_telegram_id))
             if user is None:
                 session.add(AccessUser(telegram_id=admin_telegram_id, is_admin=True))
@@ -20,35 +40,44 @@ class AccessService:
             if not user.is_admin:
                 user.is_admin = True
                 await session.commit()
+        on_commit(lambda: self._cache.invalidate(admin_telegram_id))
+
+    async def get_role(self, telegram_id: int) -> AccessRole:
+        cached = self._cache.get(telegram_id)
+        if cached is not None:
+            return cached
+
+        async with session_scope(self._session_factory) as session:
+            is_admin = await session.scalar(select(AccessUser.is_admin).where(AccessUser.telegram_id == telegram_id))
+
+        role = DENIED if is_admin is None else AccessRole(allowed=True, is_admin=bool(is_admin))
+        self._cache.set(telegram_id, role)
+        return role
 
     async def is_allowed(self, telegram_id: int) -> bool:
-        async with self._session_factory() as session:
-            row = await session.scalar(select(AccessUser.id).where(AccessUser.telegram_id == telegram_id))
-            return row is not None
+        return (await self.get_role(telegram_id)).allowed
 
     async def is_admin(self, telegram_id: int) -> bool:
-        async with self._session_factory() as session:
-            row = await session.scalar(
-                select(AccessUser.id).where(AccessUser.telegram_id == telegram_id, AccessUser.is_admin.is_(True))
-            )
-            return row is not None
+        return (await self.get_role(telegram_id)).is_admin
 
     async def add_to_whitelist(self, telegram_id: int, is_admin: bool = False) -> None:
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             existing = await session.scalar(select(AccessUser).where(AccessUser.telegram_id == telegram_id))
             if existing is None:
                 session.add(AccessUser(telegram_id=telegram_id, is_admin=is_admin))
             else:
                 existing.is_admin = existing.is_admin or is_admin
             await session.commit()
+        on_commit(lambda: self._cache.invalidate(telegram_id))
 
     async def remove_from_whitelist(self, telegram_id: int) -> bool:
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             result = await session.execute(delete(AccessUser).where(AccessUser.telegram_id == telegram_id))
             await session.commit()
-            return result.rowcount > 0
+        on_commit(lambda: self._cache.invalidate(telegram_id))
+        return result.rowcount > 0
 
     async def list_whitelist(self) -> list[AccessUser]:
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             result = await session.scalars(select(AccessUser).order_by(AccessUser.is_admin.desc(), AccessUser.telegram_id))
             return list(result)
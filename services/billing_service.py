@@ -2,20 +2,142 @@
 
 import uuid
 from collections import defaultdict
+from dataclasses import dataclass
 from datetime import date, timedelta
 from decimal import Decimal
+from typing import AsyncIterator, Iterable, Literal
 
-from sqlalchemy import and_, func, select
+from sqlalchemy import Date, cast, delete, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.elements import ColumnElement
 
-from db.models import Billing, Server
+from db.models import Billing, Server, SpendingRollup
+from db.unit_of_work import session_scope
+from services.clock import utc_today
 from services.schemas import BillingCreateSchema
+from services.view_cache import ViewCache
+
+
+@dataclass
+class DueReminder:
+    billing_id: int
+    server_name: str
+    ip4: str
+    expires_at: date
+    days_left: int
+    threshold_days: int
+    price_amount: Decimal
+    price_currency: str
+
+
+def reminder_threshold(days_left: int, thresholds: list[int]) -> int:
+    # Порог — ближайший сверху из списка: если день напоминания пропущен
+    # (бот был выключен), запись всё равно попадёт в свой порог позже.
+    return next(t for t in sorted(thresholds) if days_left <= t)
+
+
+def _next_billing_subquery(column, today: date):
+    return (
+        select(column)
+        .where(Billing.server_id == Server.id, Billing.expires_at >= today)
+        .order_by(Billing.expires_at.asc(), Billing.id.asc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+async def refresh_next_expiry(session: AsyncSession, server_ids: Iterable[uuid.UUID] | None = None) -> int:
+    today = utc_today()
+    statement = update(Server).values(
+        next_billing_id=_next_billing_subquery(Billing.id, today),
+        next_expires_at=_next_billing_subquery(Billing.expires_at, today),
+    )
+    if server_ids is None:
+        # Истекшие значения: ближайшая оплата уже в прошлом, берём следующую.
+        statement = statement.where(Server.next_expires_at < today)
+    else:
+        ids = list(server_ids)
+        if not ids:
+            return 0
+        statement = statement.where(Server.id.in_(ids))
+    result = await session.execute(statement.execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+ROLLUP_KEY = ("owner_telegram_id", "month", "currency", "provider", "role")
+TREND_MONTHS = 12
+
+SpendingDimension = Literal["provider", "role"]
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def shift_month(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _rollup_source(condition: ColumnElement[bool] | None, sign: int = 1):
+    # 'month' литералом, а не параметром: иначе выражения в SELECT и GROUP BY получают
+    # разные плейсхолдеры и PostgreSQL не считает их одинаковыми.
+    key = (
+        Server.owner_telegram_id,
+        cast(func.date_trunc(literal_column("'month'"), Billing.paid_at), Date),
+        Billing.price_currency,
+        Server.provider,
+        Server.role,
+    )
+    query = (
+        select(*key, func.sum(Billing.price_amount) * sign, func.count(Billing.id) * sign)
+        .join(Server, Server.id == Billing.server_id)
+        .group_by(*key)
+    )
+    return query if condition is None else query.where(condition)
+
+
+async def apply_to_spending_rollup(session: AsyncSession, condition: ColumnElement[bool], sign: int = 1) -> None:
+    # Оплаты, попавшие под условие, добавляются в куб (sign=1) или вычитаются из него
+    # (sign=-1) одним INSERT ... SELECT. Вызывать в той же транзакции, что и запись:
+    # до удаления оплат или смены provider/role сервера — с минусом, после — с плюсом.
+    statement = insert(SpendingRollup).from_select(
+        [*ROLLUP_KEY, "total", "billings_count"], _rollup_source(condition, sign)
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEY),
+        set_={
+            "total": SpendingRollup.total + statement.excluded.total,
+            "billings_count": SpendingRollup.billings_count + statement.excluded.billings_count,
+        },
+    ).returning(SpendingRollup.owner_telegram_id)
+    owners = set((await session.scalars(statement)).all())
+    if sign < 0 and owners:
+        await session.execute(
+            delete(SpendingRollup).where(
+                SpendingRollup.owner_telegram_id.in_(owners), SpendingRollup.billings_count <= 0
+            )
+        )
+
+
+async def rebuild_spending_rollup(session: AsyncSession, owner_telegram_id: int | None = None) -> int:
+    cleanup = delete(SpendingRollup)
+    condition = None
+    if owner_telegram_id is not None:
+        cleanup = cleanup.where(SpendingRollup.owner_telegram_id == owner_telegram_id)
+        condition = Server.owner_telegram_id == owner_telegram_id
+    await session.execute(cleanup)
+    result = await session.execute(
+        insert(SpendingRollup).from_select([*ROLLUP_KEY, "total", "billings_count"], _rollup_source(condition))
+    )
+    return result.rowcount
 
 
 class BillingService:
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], views: ViewCache | None = None) -> None:
         self._session_factory = session_factory
+        self._views = views if views is not None else ViewCache()
 
     async def add_billing(self, payload: BillingCreateSchema) -> Billing:
         billing = Billing(
@@ -27,26 +149,60 @@ class BillingService:
             period=payload.period,
             comment=payload.comment,
         )
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             session.add(billing)
+            await session.flush()
+            await refresh_next_expiry(session, [billing.server_id])
+            await apply_to_spending_rollup(session, Billing.id == billing.id)
+            owner_telegram_id = await session.scalar(select(Server.owner_telegram_id).where(Server.id == billing.server_id))
+            await self._views.publish(session, owner_telegram_id)
             await session.commit()
+            self._views.bump(owner_telegram_id)
             await session.refresh(billing)
             return billing
 
+    async def delete_billing(self, owner_telegram_id: int, billing_id: int) -> bool:
+        async with session_scope(self._session_factory) as session:
+            server_id = await session.scalar(
+                select(Billing.server_id)
+                .join(Server, Server.id == Billing.server_id)
+                .where(Billing.id == billing_id, Server.owner_telegram_id == owner_telegram_id)
+            )
+            if server_id is None:
+                return False
+            await apply_to_spending_rollup(session, Billing.id == billing_id, sign=-1)
+            await session.execute(delete(Billing).where(Billing.id == billing_id))
+            await refresh_next_expiry(session, [server_id])
+            await self._views.publish(session, owner_telegram_id)
+            await session.commit()
+            self._views.bump(owner_telegram_id)
+            return True
+
+    async def refresh_stale_next_expiry(self) -> int:
+        async with session_scope(self._session_factory) as session:
+            updated = await refresh_next_expiry(session)
+            if updated:
+                await self._views.publish(session, None)
+            await session.commit()
+        if updated:
+            self._views.clear()
+        return updated
+
     async def list_expiring(self, owner_telegram_id: int, days: int) -> list[tuple[Server, Billing, int]]:
-        start_date = date.today()
+        start_date = utc_today()
         end_date = start_date + timedelta(days=days)
 
-        async with self._session_factory() as session:
+        # Каждый сервер попадает в список один раз, с ближайшей будущей оплатой.
+        async with session_scope(self._session_factory) as session:
             rows = await session.execute(
                 select(Server, Billing)
-                .join(Billing, Billing.server_id == Server.id)
+                .join(Billing, Billing.id == Server.next_billing_id)
                 .where(
                     Server.owner_telegram_id == owner_telegram_id,
-                    Billing.expires_at >= start_date,
-                    Billing.expires_at <= end_date,
+                    Server.next_expires_at >= start_date,
+                    Server.next_expires_at <= end_date,
                 )
-                .order_by(Billing.expires_at.asc())
+                .order_by(Server.next_expires_at.asc())
             )
             result: list[tuple[Server, Billing, int]] = []
             for server, billing in rows.all():
@@ -59,45 +215,21 @@ class BillingService:
             server_uuid = uuid.UUID(server_id)
         except ValueError:
             return []
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             server = await session.scalar(select(Server.id).where(Server.id == server_uuid, Server.owner_telegram_id == owner_telegram_id))
             if server is None:
                 return []
             rows = await session.scalars(select(Billing).where(Billing.server_id == server_uuid).order_by(Billing.expires_at.desc()))
             return list(rows)
 
-    async def nearest_billing_for_server(self, server_id: uuid.UUID) -> Billing | None:
-        async with self._session_factory() as session:
-            today = date.today()
-            return await session.scalar(
-                select(Billing)
-                .where(Billing.server_id == server_id, Billing.expires_at >= today)
-                .order_by(Billing.expires_at.asc())
-            )
-
-    async def latest_billing_for_server(self, server_id: uuid.UUID) -> Billing | None:
-        async with self._session_factory() as session:
-            return await session.scalar(
-                select(Billing)
-                .where(Billing.server_id == server_id)
-                .order_by(Billing.paid_at.desc(), Billing.id.desc())
-            )
-
     async def monthly_summary(self, owner_telegram_id: int, target_date: date | None = None) -> dict[str, Decimal]:
-        current = target_date or date.today()
-        month_start = date(current.year, current.month, 1)
-        next_month = date(current.year + (1 if current.month == 12 else 0), 1 if current.month == 12 else current.month + 1, 1)
+        month = month_start(target_date or utc_today())
 
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             rows = await session.execute(
-                select(Billing.price_currency, func.sum(Billing.price_amount))
-                .join(Server, Server.id == Billing.server_id)
-                .where(
-                    Server.owner_telegram_id == owner_telegram_id,
-                    Billing.paid_at >= month_start,
-                    Billing.paid_at < next_month,
-                )
-                .group_by(Billing.price_currency)
+                select(SpendingRollup.currency, func.sum(SpendingRollup.total))
+                .where(SpendingRollup.owner_telegram_id == owner_telegram_id, SpendingRollup.month == month)
+                .group_by(SpendingRollup.currency)
             )
 
             result: dict[str, Decimal] = defaultdict(Decimal)
@@ -105,27 +237,102 @@ class BillingService:
                 result[str(currency)] = amount
             return dict(result)
 
-    async def due_notifications(self, days_before: list[int]) -> list[tuple[Server, Billing, int]]:
-        today = date.today()
-        max_days = max(days_before)
-        date_limit = today + timedelta(days=max_days)
+    async def spending_trend(
+        self, owner_telegram_id: int, months: int = TREND_MONTHS, target_date: date | None = None
+    ) -> list[tuple[date, dict[str, Decimal]]]:
+        last = month_start(target_date or utc_today())
+        first = shift_month(last, 1 - months)
 
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             rows = await session.execute(
-                select(Server, Billing)
-                .join(Billing, Billing.server_id == Server.id)
-                .options(joinedload(Server.tags))
+                select(SpendingRollup.month, SpendingRollup.currency, func.sum(SpendingRollup.total))
                 .where(
-                    and_(
-                        Billing.expires_at >= today,
-                        Billing.expires_at <= date_limit,
-                    )
+                    SpendingRollup.owner_telegram_id == owner_telegram_id,
+                    SpendingRollup.month >= first,
+                    SpendingRollup.month <= last,
                 )
+                .group_by(SpendingRollup.month, SpendingRollup.currency)
             )
+            by_month: dict[date, dict[str, Decimal]] = defaultdict(dict)
+            for month, currency, amount in rows.all():
+                by_month[month][str(currency)] = amount
 
-            result: list[tuple[Server, Billing, int]] = []
-            for server, billing in rows.all():
-                delta = (billing.expires_at - today).days
-                if delta in days_before:
-                    result.append((server, billing, delta))
-            return result
+        return [(month, by_month.get(month, {})) for month in (shift_month(first, i) for i in range(months))]
+
+    async def spending_breakdown(
+        self,
+        owner_telegram_id: int,
+        dimension: SpendingDimension,
+        months: int = TREND_MONTHS,
+        target_date: date | None = None,
+    ) -> list[tuple[str, str, Decimal]]:
+        last = month_start(target_date or utc_today())
+        column = SpendingRollup.provider if dimension == "provider" else SpendingRollup.role
+        total = func.sum(SpendingRollup.total)
+
+        async with session_scope(self._session_factory) as session:
+            rows = await session.execute(
+                select(column, SpendingRollup.currency, total)
+                .where(
+                    SpendingRollup.owner_telegram_id == owner_telegram_id,
+                    SpendingRollup.month >= shift_month(last, 1 - months),
+                    SpendingRollup.month <= last,
+                )
+                .group_by(column, SpendingRollup.currency)
+                .order_by(SpendingRollup.currency, total.desc())
+            )
+            return [
+                (key.value if dimension == "role" else key, str(currency), amount)
+                for key, currency, amount in rows.all()
+            ]
+
+    async def rebuild_spending_rollup(self, owner_telegram_id: int | None = None) -> int:
+        async with session_scope(self._session_factory) as session:
+            rows = await rebuild_spending_rollup(session, owner_telegram_id)
+            await self._views.publish(session, owner_telegram_id)
+            await session.commit()
+        if owner_telegram_id is None:
+            self._views.clear()
+        else:
+            self._views.bump(owner_telegram_id)
+        return rows
+
+    async def stream_due_notifications(
+        self, thresholds: list[int], batch_size: int = 500
+    ) -> AsyncIterator[list[DueReminder]]:
+        today = utc_today()
+        ordered = sorted(thresholds)
+        query = (
+            select(
+                Billing.id,
+                Server.name,
+                Server.ip4,
+                Billing.expires_at,
+                Billing.price_amount,
+                Billing.price_currency,
+            )
+            .join(Billing, Billing.id == Server.next_billing_id)
+            .where(Server.next_expires_at >= today, Server.next_expires_at <= today + timedelta(days=ordered[-1]))
+            .order_by(Server.next_expires_at, Server.name)
+            .execution_options(yield_per=batch_size)
+        )
+
+        async with session_scope(self._session_factory) as session:
+            result = await session.stream(query)
+            async for rows in result.partitions(batch_size):
+                batch: list[DueReminder] = []
+                for billing_id, name, ip4, expires_at, price_amount, price_currency in rows:
+                    days_left = (expires_at - today).days
+                    batch.append(
+                        DueReminder(
+                            billing_id=billing_id,
+                            server_name=name,
+                            ip4=ip4,
+                            expires_at=expires_at,
+                            days_left=days_left,
+                            threshold_days=reminder_threshold(days_left, ordered),
+                            price_amount=price_amount,
+                            price_currency=price_currency,
+                        )
+                    )
+                yield batch
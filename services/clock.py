@@ -0,0 +1,9 @@
+﻿from __future__ import annotations
+
+from datetime import date, datetime, timezone
+
+
+def utc_today() -> date:
+    # Сроки оплат сравниваются с текущей датой по UTC, как и расписание напоминаний,
+    # чтобы результат не зависел от часового пояса сервера.
+    return datetime.now(timezone.utc).date()
@@ -0,0 +1,138 @@
+﻿from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from collections import defaultdict
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.models import PendingDeletion
+from db.unit_of_work import session_scope
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_WINDOW_SECONDS = 1.0
+DELETE_MESSAGES_LIMIT = 100
+DRAIN_TIMEOUT_SECONDS = 10.0
+
+PendingKey = tuple[int, int]
+
+
+class DeletionScheduler:
+    def __init__(
+        self,
+        bot: Bot,
+        session_factory: async_sessionmaker[AsyncSession],
+        batch_window_seconds: float = DELETE_BATCH_WINDOW_SECONDS,
+    ) -> None:
+        self._bot = bot
+        self._session_factory = session_factory
+        self._batch_window = batch_window_seconds
+        self._heap: list[tuple[float, int, int]] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    async def start(self) -> None:
+        async with session_scope(self._session_factory) as session:
+            rows = (
+                await session.execute(
+                    select(PendingDeletion.chat_id, PendingDeletion.message_id, PendingDeletion.delete_at)
+                )
+            ).all()
+        for chat_id, message_id, delete_at in rows:
+            heapq.heappush(self._heap, (delete_at.timestamp(), chat_id, message_id))
+        if rows:
+            logger.info("Автоудаление: восстановлено %s сообщений", len(rows))
+        self._task = asyncio.create_task(self._run())
+
+    async def schedule(self, chat_id: int, message_id: int, ttl_seconds: int) -> None:
+        delete_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        async with session_scope(self._session_factory) as session:
+            await session.execute(
+                insert(PendingDeletion)
+                .values(chat_id=chat_id, message_id=message_id, delete_at=delete_at)
+                .on_conflict_do_nothing()
+            )
+            await session.commit()
+        heapq.heappush(self._heap, (delete_at.timestamp(), chat_id, message_id))
+        self._wakeup.set()
+
+    def _pop_due(self, horizon: float) -> list[PendingKey]:
+        due: list[PendingKey] = []
+        while self._heap and self._heap[0][0] <= horizon:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            due.append((chat_id, message_id))
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+                continue
+            except asyncio.TimeoutError:
+                pass
+            # Всё, что истекает в пределах окна, удаляем одним заходом.
+            due = self._pop_due(time.time() + self._batch_window)
+            try:
+                await self._delete(due)
+            except Exception:  # noqa: BLE001
+                logger.exception("Автоудаление: ошибка удаления, записи останутся до перезапуска")
+
+    async def _delete(self, due: list[PendingKey]) -> None:
+        by_chat: dict[int, list[int]] = defaultdict(list)
+        for chat_id, message_id in due:
+            by_chat[chat_id].append(message_id)
+
+        done: list[PendingKey] = []
+        for chat_id, message_ids in by_chat.items():
+            for start in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+                part = message_ids[start : start + DELETE_MESSAGES_LIMIT]
+                try:
+                    await self._bot.delete_messages(chat_id=chat_id, message_ids=part)
+                except TelegramRetryAfter as exc:
+                    retry_at = time.time() + exc.retry_after
+                    for message_id in part:
+                        heapq.heappush(self._heap, (retry_at, chat_id, message_id))
+                    continue
+                except TelegramAPIError as exc:
+                    # Сообщение уже удалено или старше 48 часов — повторять бессмысленно.
+                    logger.warning("Автоудаление: чат %s: %s", chat_id, exc)
+                done.extend((chat_id, message_id) for message_id in part)
+
+        if not done:
+            return
+        async with session_scope(self._session_factory) as session:
+            await session.execute(
+                delete(PendingDeletion).where(tuple_(PendingDeletion.chat_id, PendingDeletion.message_id).in_(done))
+            )
+            await session.commit()
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+        # Не оставляем секреты в чатах на время простоя: удаляем всё, что ещё ждёт.
+        due = self._pop_due(float("inf"))
+        if not due:
+            return
+        try:
+            await asyncio.wait_for(self._delete(due), DRAIN_TIMEOUT_SECONDS)
+        except Exception:  # noqa: BLE001
+            logger.exception("Автоудаление: не все сообщения удалены при остановке, удалятся после перезапуска")
@@ -1,29 +1,215 @@
 ﻿from __future__ import annotations
 
+import asyncio
+import csv
+import gzip
+import io
 import json
-from dataclasses import dataclass
+import logging
+import re
+import tempfile
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, BinaryIO
 
-from db.models import Manual, Server
-from services.manual_service import ManualService
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import case, delete, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from crypto.secrets import SecretCipher
+from db.models import Billing, Manual, ManualTag, SecretType, Server, ServerTag
+from services.billing_service import apply_to_spending_rollup, refresh_next_expiry
+from services.manual_service import ManualService, refresh_search_vectors
+from services.schemas import BillingCreateSchema, ManualCreateSchema, ServerImportSchema
 from services.server_service import ServerService
+from services.view_cache import ViewCache
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FORMATS = ("ndjson", "json")
+
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
+IMPORT_KINDS = ("server", "billing", "manual")
+IMPORT_SECTIONS = {"servers": "server", "billings": "billing", "manuals": "manual"}
+
+_server_rows = TypeAdapter(list[ServerImportSchema])
+_billing_rows = TypeAdapter(list[BillingCreateSchema])
+_manual_rows = TypeAdapter(list[ManualCreateSchema])
+
+
+@dataclass
+class ExportResult:
+    path: Path
+    filename: str
+    servers: int = 0
+    billings: int = 0
+    manuals: int = 0
 
 
 @dataclass
-class ExportBundle:
-    servers: list[dict]
-    manuals: list[dict]
+class ImportRow:
+    source: str
+    data: dict[str, Any]
+
+
+@dataclass
+class ImportRowError:
+    source: str
+    message: str
+
+
+@dataclass
+class ImportReport:
+    servers_created: int = 0
+    servers_updated: int = 0
+    billings_added: int = 0
+    billings_skipped: int = 0
+    manuals_created: int = 0
+    manuals_updated: int = 0
+    errors: list[ImportRowError] = field(default_factory=list)
+
+    def merge(self, other: ImportReport) -> None:
+        for item in fields(self):
+            setattr(self, item.name, getattr(self, item.name) + getattr(other, item.name))
+
 
-    def to_json(self) -> str:
-        return json.dumps({"servers": self.servers, "manuals": self.manuals}, ensure_ascii=False, indent=2)
+def read_import_rows(filename: str, payload: bytes) -> tuple[dict[str, list[ImportRow]], list[ImportRowError]]:
+    if payload[:2] == b"\x1f\x8b":
+        payload = gzip.decompress(payload)
+    name = filename.lower().removesuffix(".gz")
+    try:
+        text = payload.decode("utf-8-sig")
+    except UnicodeDecodeError as exc:
+        raise ValueError("файл должен быть в UTF-8") from exc
+
+    rows: dict[str, list[ImportRow]] = {kind: [] for kind in IMPORT_KINDS}
+    errors: list[ImportRowError] = []
+
+    def add(source: str, kind: str, data: Any) -> None:
+        if not isinstance(data, dict):
+            errors.append(ImportRowError(source, "ожидается объект"))
+            return
+        if kind not in rows:
+            errors.append(ImportRowError(source, f"неизвестный тип записи: {kind}"))
+            return
+        if isinstance(data.get("tags"), str):
+            data["tags"] = re.split(r"[,;]", data["tags"])
+        rows[kind].append(ImportRow(source, data))
+
+    if name.endswith(".csv"):
+        for line_no, record in enumerate(csv.DictReader(io.StringIO(text)), start=2):
+            data = {
+                key.strip(): value.strip()
+                for key, value in record.items()
+                if key and isinstance(value, str) and value.strip()
+            }
+            add(f"строка {line_no}", data.pop("type", "server"), data)
+    elif name.endswith(".json"):
+        try:
+            document = json.loads(text)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"некорректный JSON: {exc}") from exc
+        if not isinstance(document, dict):
+            raise ValueError("ожидается объект с секциями servers/billings/manuals")
+        for section, kind in IMPORT_SECTIONS.items():
+            for index, data in enumerate(document.get(section) or []):
+                add(f"{section}[{index}]", kind, data)
+    else:
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                errors.append(ImportRowError(f"строка {line_no}", "некорректный JSON"))
+                continue
+            kind = data.pop("type", "server") if isinstance(data, dict) else "server"
+            add(f"строка {line_no}", kind, data)
+
+    return rows, errors
+
+
+def validate_import_rows(
+    adapter: TypeAdapter, rows: list[ImportRow], errors: list[ImportRowError]
+) -> list[tuple[ImportRow, Any]]:
+    try:
+        return list(zip(rows, adapter.validate_python([row.data for row in rows])))
+    except ValidationError as exc:
+        failed: dict[int, list[str]] = {}
+        for error in exc.errors():
+            index, *path = error["loc"]
+            where = ".".join(str(part) for part in path)
+            failed.setdefault(index, []).append(f"{where}: {error['msg']}" if where else error["msg"])
+        for index, messages in sorted(failed.items()):
+            errors.append(ImportRowError(rows[index].source, "; ".join(messages)))
+        # Повторная проверка только корректных строк — одним вызовом, без цикла по строкам.
+        valid = [row for index, row in enumerate(rows) if index not in failed]
+        return list(zip(valid, adapter.validate_python([row.data for row in valid]))) if valid else []
+
+
+def _chunks(items: list, size: int = IMPORT_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class ExportWriter:
+    def __init__(self, stream: BinaryIO, fmt: str = "ndjson") -> None:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+        self._stream = stream
+        self._fmt = fmt
+        self._sections = 0
+        self._first_item = True
+
+    async def _write(self, payload: str) -> None:
+        if payload:
+            await asyncio.to_thread(self._stream.write, payload.encode("utf-8"))
+
+    async def section(self, name: str) -> None:
+        if self._fmt == "json":
+            prefix = "{" if self._sections == 0 else "],"
+            await self._write(f"{prefix}{json.dumps(name)}:[")
+        self._sections += 1
+        self._first_item = True
+
+    async def write(self, kind: str, records: list[dict]) -> None:
+        if not records:
+            return
+        if self._fmt == "ndjson":
+            await self._write("".join(json.dumps({"type": kind, **r}, ensure_ascii=False) + "\n" for r in records))
+            return
+        prefix = "" if self._first_item else ","
+        self._first_item = False
+        await self._write(prefix + ",".join(json.dumps(r, ensure_ascii=False) for r in records))
+
+    async def close(self) -> None:
+        if self._fmt == "json":
+            await self._write("]}" if self._sections else "{}")
 
 
 class ExportImportService:
-    def __init__(self, server_service: ServerService, manual_service: ManualService) -> None:
+    def __init__(
+        self,
+        server_service: ServerService,
+        manual_service: ManualService,
+        session_factory: async_sessionmaker,
+        cipher: SecretCipher,
+        views: ViewCache | None = None,
+    ) -> None:
         self._server_service = server_service
         self._manual_service = manual_service
+        self._session_factory = session_factory
+        self._cipher = cipher
+        self._views = views if views is not None else ViewCache()
 
     @staticmethod
-    def _serialize_server(server: Server, include_secret: bool = False) -> dict:
+    def _serialize_server(server: Server, tags: list[str], include_secret: bool = False) -> dict:
         payload = {
             "name": server.name,
             "role": server.role.value,
@@ -34,7 +220,7 @@ class ExportImportService:
             "ssh_port": server.ssh_port,
             "ssh_user": server.ssh_user,
             "secret_type": server.secret_type.value,
-            "tags": [t.tag for t in server.tags],
+            "tags": tags,
             "notes": server.notes,
             "is_favorite": server.is_favorite,
             "cpu_load": float(server.cpu_load) if server.cpu_load is not None else None,
@@ -47,18 +233,354 @@ class ExportImportService:
         return payload
 
     @staticmethod
-    def _serialize_manual(manual: Manual) -> dict:
+    def _serialize_billing(server_name: str, billing: Billing) -> dict:
+        return {
+            "server": server_name,
+            "paid_at": billing.paid_at.isoformat(),
+            "expires_at": billing.expires_at.isoformat(),
+            "price_amount": str(billing.price_amount),
+            "price_currency": billing.price_currency,
+            "period": billing.period,
+            "comment": billing.comment,
+        }
+
+    @staticmethod
+    def _serialize_manual(manual: Manual, tags: list[str]) -> dict:
         return {
             "title": manual.title,
             "category": manual.category.value,
-            "tags": [t.tag for t in manual.tags],
+            "tags": tags,
             "body_markdown": manual.body_markdown,
         }
 
-    async def export_user_data(self, telegram_id: int, include_secret: bool = False) -> ExportBundle:
-        servers, _ = await self._server_service.list_servers(telegram_id, page=1, page_size=1000, scope="all")
-        manuals = await self._manual_service.list_manuals(telegram_id)
-        return ExportBundle(
-            servers=[self._serialize_server(s, include_secret=include_secret) for s in servers],
-            manuals=[self._serialize_manual(m) for m in manuals],
+    async def _stream_servers(
+        self, session: AsyncSession, telegram_id: int, include_secret: bool
+    ) -> AsyncIterator[list[dict]]:
+        tags = (
+            select(func.array_agg(aggregate_order_by(ServerTag.tag, ServerTag.tag)))
+            .where(ServerTag.server_id == Server.id)
+            .scalar_subquery()
+        )
+        query = (
+            select(Server, tags)
+            .where(Server.owner_telegram_id == telegram_id)
+            .order_by(Server.name, Server.id)
+            .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        result = await session.stream(query)
+        async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+            yield [self._serialize_server(server, server_tags or [], include_secret) for server, server_tags in rows]
+
+    async def _stream_billings(self, session: AsyncSession, telegram_id: int) -> AsyncIterator[list[dict]]:
+        query = (
+            select(Server.name, Billing)
+            .join(Billing, Billing.server_id == Server.id)
+            .where(Server.owner_telegram_id == telegram_id)
+            .order_by(Server.name, Billing.paid_at, Billing.id)
+            .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        result = await session.stream(query)
+        async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+            yield [self._serialize_billing(name, billing) for name, billing in rows]
+
+    async def _stream_manuals(self, session: AsyncSession, telegram_id: int) -> AsyncIterator[list[dict]]:
+        tags = (
+            select(func.array_agg(aggregate_order_by(ManualTag.tag, ManualTag.tag)))
+            .where(ManualTag.manual_id == Manual.id)
+            .scalar_subquery()
+        )
+        query = (
+            select(Manual, tags)
+            .where(Manual.owner_telegram_id == telegram_id)
+            .order_by(Manual.id)
+            .execution_options(yield_per=EXPORT_CHUNK_SIZE)
         )
+        result = await session.stream(query)
+        async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+            yield [self._serialize_manual(manual, manual_tags or []) for manual, manual_tags in rows]
+
+    async def export_to_file(self, telegram_id: int, include_secret: bool = False, fmt: str = "ndjson") -> ExportResult:
+        suffix = f".{fmt}.gz"
+        handle = tempfile.NamedTemporaryFile(prefix="flow_proxy_export_", suffix=suffix, delete=False)
+        export = ExportResult(path=Path(handle.name), filename=f"flow_proxy_export{suffix}")
+        try:
+            with handle, gzip.GzipFile(fileobj=handle, mode="wb") as stream:
+                writer = ExportWriter(stream, fmt)
+                # Своя сессия даже внутри апдейта: экспорту нужен отдельный снимок REPEATABLE READ.
+                async with self._session_factory() as session:
+                    # Один снимок данных на весь экспорт, даже если он пишется долго.
+                    await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+                    await writer.section("servers")
+                    async for chunk in self._stream_servers(session, telegram_id, include_secret):
+                        await writer.write("server", chunk)
+                        export.servers += len(chunk)
+
+                    await writer.section("billings")
+                    async for chunk in self._stream_billings(session, telegram_id):
+                        await writer.write("billing", chunk)
+                        export.billings += len(chunk)
+
+                    await writer.section("manuals")
+                    async for chunk in self._stream_manuals(session, telegram_id):
+                        await writer.write("manual", chunk)
+                        export.manuals += len(chunk)
+                await writer.close()
+        except BaseException:
+            export.path.unlink(missing_ok=True)
+            raise
+        return export
+
+    async def import_bundle(self, telegram_id: int, filename: str, payload: bytes) -> ImportReport:
+        rows, errors = await asyncio.to_thread(read_import_rows, filename, payload)
+        report = ImportReport(errors=errors)
+        # Импорт фиксируется по частям и не должен держать транзакцию апдейта до конца файла.
+        importers = {"server": self._import_servers, "billing": self._import_billings, "manual": self._import_manuals}
+        try:
+            async with self._session_factory() as session:
+                for kind in IMPORT_KINDS:
+                    for chunk in _chunks(rows[kind]):
+                        await self._import_chunk(session, importers[kind], telegram_id, chunk, report)
+        finally:
+            # Части файла фиксируются в своей сессии: даже после ошибки или отката
+            # транзакции апдейта экраны могли устареть.
+            self._views.bump_now(telegram_id)
+        return report
+
+    async def _import_chunk(
+        self,
+        session: AsyncSession,
+        importer: Callable[[AsyncSession, int, list[ImportRow], ImportReport], Awaitable[None]],
+        telegram_id: int,
+        chunk: list[ImportRow],
+        report: ImportReport,
+    ) -> None:
+        # Ошибка БД (ограничение, переполнение) откатывает только свою часть файла: остальные
+        # части уже зафиксированы, поэтому исключение не должно уходить в обработчик.
+        partial = ImportReport()
+        try:
+            await importer(session, telegram_id, chunk, partial)
+            await self._views.publish(session, telegram_id)
+            await session.commit()
+        except SQLAlchemyError:
+            await session.rollback()
+            logger.exception("Импорт: не удалось сохранить строки %s – %s", chunk[0].source, chunk[-1].source)
+            partial = ImportReport(
+                errors=[
+                    *partial.errors,
+                    ImportRowError(f"{chunk[0].source} – {chunk[-1].source}", "ошибка базы данных, строки не сохранены"),
+                ]
+            )
+        report.merge(partial)
+
+    async def _import_servers(
+        self, session: AsyncSession, telegram_id: int, chunk: list[ImportRow], report: ImportReport
+    ) -> None:
+        for row in chunk:
+            row.data["owner_telegram_id"] = telegram_id
+        # ON CONFLICT не может обновить одну строку дважды за запрос — оставляем последнюю запись.
+        latest: dict[str, tuple[ImportRow, ServerImportSchema]] = {}
+        for row, item in validate_import_rows(_server_rows, chunk, report.errors):
+            if item.name in latest:
+                duplicate = latest[item.name][0]
+                report.errors.append(ImportRowError(duplicate.source, f"сервер {item.name} повторяется, взята последняя запись"))
+            latest[item.name] = (row, item)
+        if not latest:
+            return
+
+        values = []
+        for _, item in latest.values():
+            encrypted_secret = None
+            if item.secret_type != SecretType.NONE and item.secret_value:
+                encrypted_secret = self._cipher.encrypt(item.secret_value)
+            values.append(
+                {
+                    "id": uuid.uuid4(),
+                    "owner_telegram_id": telegram_id,
+                    "name": item.name,
+                    "role": item.role,
+                    "provider": item.provider,
+                    "ip4": item.ip4,
+                    "ip6": item.ip6,
+                    "domain": item.domain,
+                    "ssh_port": item.ssh_port,
+                    "ssh_user": item.ssh_user,
+                    "secret_type": item.secret_type,
+                    "secret_encrypted": encrypted_secret,
+                    "notes": item.notes,
+                    "is_favorite": item.is_favorite,
+                    "net_notes": item.net_notes,
+                }
+            )
+
+        # Обновление может сменить provider/role у сервера с оплатами: вычитаем их из куба
+        # расходов до upsert и добавляем обратно уже с новыми ключами.
+        updated_servers = select(Server.id).where(Server.owner_telegram_id == telegram_id, Server.name.in_(list(latest)))
+        await apply_to_spending_rollup(session, Billing.server_id.in_(updated_servers), sign=-1)
+
+        statement = insert(Server).values(values)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=[Server.owner_telegram_id, Server.name],
+            set_={
+                **{
+                    column: excluded[column]
+                    for column in (
+                        "role", "provider", "ip4", "ip6", "domain", "ssh_port", "ssh_user",
+                        "secret_type", "notes", "is_favorite", "net_notes",
+                    )
+                },
+                # Экспорт идёт без секретов: повторный импорт не должен стирать сохранённый секрет.
+                "secret_encrypted": case(
+                    (excluded.secret_type == SecretType.NONE, None),
+                    else_=func.coalesce(excluded.secret_encrypted, Server.secret_encrypted),
+                ),
+                "updated_at": func.now(),
+            },
+        ).returning(Server.id, Server.name, literal_column("xmax = 0"))
+        result = (await session.execute(statement)).all()
+
+        server_ids = [server_id for server_id, _, _ in result]
+        await apply_to_spending_rollup(session, Billing.server_id.in_(server_ids))
+        created = sum(1 for _, _, inserted in result if inserted)
+        report.servers_created += created
+        report.servers_updated += len(result) - created
+
+        await session.execute(delete(ServerTag).where(ServerTag.server_id.in_(server_ids)))
+        tag_rows = [
+            {"server_id": server_id, "tag": tag}
+            for server_id, name, _ in result
+            for tag in latest[name][1].tags
+        ]
+        if tag_rows:
+            await session.execute(insert(ServerTag), tag_rows)
+
+    async def _import_billings(
+        self, session: AsyncSession, telegram_id: int, chunk: list[ImportRow], report: ImportReport
+    ) -> None:
+        names = {str(row.data["server"]) for row in chunk if row.data.get("server")}
+        server_by_name = dict(
+            (
+                await session.execute(
+                    select(Server.name, Server.id).where(Server.owner_telegram_id == telegram_id, Server.name.in_(names))
+                )
+            ).all()
+        )
+        raw_ids: set[uuid.UUID] = set()
+        for row in chunk:
+            try:
+                raw_ids.add(uuid.UUID(str(row.data.get("server_id"))))
+            except ValueError:
+                pass
+        owned_ids: dict[str, uuid.UUID] = {}
+        if raw_ids:
+            owned = await session.scalars(
+                select(Server.id).where(Server.owner_telegram_id == telegram_id, Server.id.in_(raw_ids))
+            )
+            owned_ids = {str(server_id): server_id for server_id in owned}
+
+        resolved: list[ImportRow] = []
+        for row in chunk:
+            reference = row.data.pop("server", None)
+            if reference is not None:
+                server_id = server_by_name.get(str(reference))
+            else:
+                reference = row.data.get("server_id")
+                server_id = owned_ids.get(str(reference).lower())
+            if server_id is None:
+                report.errors.append(ImportRowError(row.source, f"сервер не найден: {reference}"))
+                continue
+            row.data["server_id"] = str(server_id)
+            resolved.append(row)
+
+        valid = validate_import_rows(_billing_rows, resolved, report.errors)
+        if not valid:
+            return
+
+        server_ids = {uuid.UUID(item.server_id) for _, item in valid}
+        existing = set(
+            (
+                await session.execute(
+                    select(
+                        Billing.server_id, Billing.paid_at, Billing.expires_at, Billing.price_amount, Billing.price_currency
+                    ).where(Billing.server_id.in_(server_ids))
+                )
+            ).all()
+        )
+        new_rows = []
+        for _, item in valid:
+            key = (uuid.UUID(item.server_id), item.paid_at, item.expires_at, item.price_amount, item.price_currency)
+            if key in existing:
+                report.billings_skipped += 1
+                continue
+            existing.add(key)
+            new_rows.append(
+                {
+                    "server_id": key[0],
+                    "paid_at": item.paid_at,
+                    "expires_at": item.expires_at,
+                    "price_amount": item.price_amount,
+                    "price_currency": item.price_currency,
+                    "period": item.period,
+                    "comment": item.comment,
+                }
+            )
+        if new_rows:
+            billing_ids = list(await session.scalars(insert(Billing).returning(Billing.id), new_rows))
+            await apply_to_spending_rollup(session, Billing.id.in_(billing_ids))
+            await refresh_next_expiry(session, server_ids)
+        report.billings_added += len(new_rows)
+
+    async def _import_manuals(
+        self, session: AsyncSession, telegram_id: int, chunk: list[ImportRow], report: ImportReport
+    ) -> None:
+        for row in chunk:
+            row.data["owner_telegram_id"] = telegram_id
+        latest: dict[str, ManualCreateSchema] = {}
+        for _, item in validate_import_rows(_manual_rows, chunk, report.errors):
+            latest[item.title] = item
+        if not latest:
+            return
+
+        existing = dict(
+            (
+                await session.execute(
+                    select(Manual.title, Manual.id).where(
+                        Manual.owner_telegram_id == telegram_id, Manual.title.in_(latest.keys())
+                    )
+                )
+            ).all()
+        )
+        updates = [
+            {"id": existing[title], "category": item.category, "body_markdown": item.body_markdown}
+            for title, item in latest.items()
+            if title in existing
+        ]
+        if updates:
+            await session.execute(update(Manual), updates)
+
+        new_items = [item for title, item in latest.items() if title not in existing]
+        manual_ids = dict(existing)
+        if new_items:
+            created = await session.scalars(
+                insert(Manual).returning(Manual.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "owner_telegram_id": telegram_id,
+                        "title": item.title,
+                        "category": item.category,
+                        "body_markdown": item.body_markdown,
+                    }
+                    for item in new_items
+                ],
+            )
+            manual_ids.update(zip((item.title for item in new_items), created.all()))
+        report.manuals_created += len(new_items)
+        report.manuals_updated += len(updates)
+
+        ids = [manual_ids[title] for title in latest]
+        await session.execute(delete(ManualTag).where(ManualTag.manual_id.in_(ids)))
+        tag_rows = [{"manual_id": manual_ids[title], "tag": tag} for title, item in latest.items() for tag in item.tags]
+        if tag_rows:
+            await session.execute(insert(ManualTag), tag_rows)
+        await refresh_search_vectors(session, ids)
@@ -0,0 +1,206 @@
+﻿from __future__ import annotations
+
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import BigInteger, Date, cast, literal, select, true
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.models import Billing, Server
+from db.unit_of_work import session_scope
+from services.billing_service import month_start, shift_month
+from services.clock import utc_today
+
+FORECAST_MONTHS = 6
+PERIOD_PATTERN = re.compile(r"(\d+)\s*([dwmy]?)")
+CENTS = Decimal("0.01")
+EPOCH = date(1970, 1, 1)
+
+
+@dataclass(frozen=True)
+class RenewalInterval:
+    days: int = 0
+    months: int = 0
+
+
+def parse_period(text: str | None) -> RenewalInterval | None:
+    match = PERIOD_PATTERN.fullmatch((text or "").strip().lower())
+    if match is None or int(match.group(1)) <= 0:
+        return None
+    count, unit = int(match.group(1)), match.group(2) or "d"
+    if unit == "d":
+        return RenewalInterval(days=count)
+    if unit == "w":
+        return RenewalInterval(days=7 * count)
+    if unit == "m":
+        return RenewalInterval(months=count)
+    return RenewalInterval(months=12 * count)
+
+
+@dataclass
+class RenewalBook:
+    # Текущая (самая дальняя по expires_at) оплата каждого сервера, разложенная по колонкам.
+    expires_at: np.ndarray
+    step_days: np.ndarray
+    step_months: np.ndarray
+    amount_cents: np.ndarray
+    currency: np.ndarray
+    currencies: list[str]
+
+    def __len__(self) -> int:
+        return len(self.expires_at)
+
+
+def build_book(
+    paid_at: Sequence[date | int],
+    expires_at: Sequence[date | int],
+    price_cents: Sequence[int],
+    price_currency: Sequence[str],
+    period: Sequence[str],
+) -> RenewalBook:
+    # Даты — объекты date или номера дней от 1970-01-01: из БД приходят числа,
+    # так массив собирается без разбора объектов date.
+    paid = np.array(paid_at, dtype="datetime64[D]")
+    expires = np.array(expires_at, dtype="datetime64[D]")
+    amounts = np.array(price_cents, dtype=np.int64)
+    currencies, currency = np.unique(np.array(price_currency, dtype=str), return_inverse=True)
+
+    # Разбираем только уникальные строки периода, а не каждую оплату.
+    periods, period_index = np.unique(np.array(period, dtype=str), return_inverse=True)
+    parsed = [parse_period(text) for text in periods]
+    known = np.array([item is not None for item in parsed], dtype=bool)[period_index]
+    step_days = np.array([item.days if item else 0 for item in parsed], dtype=np.int64)[period_index]
+    step_months = np.array([item.months if item else 0 for item in parsed], dtype=np.int64)[period_index]
+    # Нераспознанный период («custom») — считаем длиной последней оплаты.
+    fallback = (expires - paid).astype(np.int64)
+    step_days = np.where(known, step_days, np.maximum(fallback, 0))
+
+    return RenewalBook(
+        expires_at=expires,
+        step_days=step_days,
+        step_months=step_months,
+        amount_cents=amounts,
+        currency=currency.astype(np.int64),
+        currencies=[str(item) for item in currencies],
+    )
+
+
+@dataclass
+class SpendForecast:
+    months: list[date]
+    currencies: list[str]
+    totals: np.ndarray
+    renewals: np.ndarray
+
+    def monthly(self) -> list[tuple[date, dict[str, Decimal], int]]:
+        return [
+            (
+                month,
+                {
+                    currency: _from_cents(self.totals[row, column])
+                    for row, currency in enumerate(self.currencies)
+                    if self.totals[row, column]
+                },
+                int(self.renewals[column]),
+            )
+            for column, month in enumerate(self.months)
+        ]
+
+    def by_currency(self) -> dict[str, Decimal]:
+        sums = self.totals.sum(axis=1)
+        return {currency: _from_cents(sums[row]) for row, currency in enumerate(self.currencies) if sums[row]}
+
+
+def _from_cents(value: np.integer) -> Decimal:
+    return (Decimal(int(value)) / 100).quantize(CENTS)
+
+
+def project_renewals(book: RenewalBook, first_month: date, months: int) -> SpendForecast:
+    start = np.datetime64(month_start(first_month), "M")
+    start_index = start.astype(np.int64)
+    end_day = (start + months).astype("datetime64[D]")
+    columns = len(book.currencies) * months
+    totals = np.zeros(columns, dtype=np.int64)
+    renewals = np.zeros(months, dtype=np.int64)
+
+    # Продление ждём в день истечения текущей оплаты и дальше с шагом периода. Сервер,
+    # оплата которого истекла до начала первого месяца, считаем заброшенным; истёкшая
+    # в текущем месяце — просроченное продление и попадает в первый месяц.
+    first_bucket = book.expires_at.astype("datetime64[M]").astype(np.int64) - start_index
+    active = (first_bucket >= 0) & (first_bucket < months)
+
+    # Цикл только по различным периодам (30d, 1m, 1y, ...), внутри — операции над массивами.
+    steps = np.stack([book.step_days, book.step_months], axis=1)
+    groups, group_index = np.unique(steps, axis=0, return_inverse=True)
+    for group, (step_days, step_months) in enumerate(groups):
+        members = np.flatnonzero(active & (group_index.ravel() == group))
+        if members.size == 0:
+            continue
+        if step_months:
+            count = (months - 1 - first_bucket[members].min()) // step_months + 1
+            buckets = first_bucket[members, None] + step_months * np.arange(count)
+        elif step_days:
+            expires = book.expires_at[members]
+            count = int((end_day - expires.min()).astype(np.int64)) // step_days + 1
+            dates = expires[:, None] + step_days * np.arange(count)
+            buckets = dates.astype("datetime64[M]").astype(np.int64) - start_index
+        else:
+            buckets = first_bucket[members, None]
+
+        inside = buckets < months
+        cells = (book.currency[members, None] * months + buckets)[inside]
+        amounts = np.broadcast_to(book.amount_cents[members, None], buckets.shape)[inside]
+        totals += np.bincount(cells, weights=amounts, minlength=columns).astype(np.int64)
+        renewals += np.bincount(buckets[inside], minlength=months)
+
+    return SpendForecast(
+        months=[shift_month(month_start(first_month), offset) for offset in range(months)],
+        currencies=book.currencies,
+        totals=totals.reshape(len(book.currencies), months),
+        renewals=renewals,
+    )
+
+
+class ForecastService:
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        self._session_factory = session_factory
+
+    async def load_book(self, owner_telegram_id: int | None = None) -> RenewalBook:
+        epoch = literal(EPOCH, Date)
+        current = (
+            select(
+                (Billing.paid_at - epoch).label("paid_day"),
+                (Billing.expires_at - epoch).label("expires_day"),
+                cast(Billing.price_amount * 100, BigInteger).label("price_cents"),
+                Billing.price_currency,
+                Billing.period,
+            )
+            .where(Billing.server_id == Server.id)
+            .order_by(Billing.expires_at.desc(), Billing.id.desc())
+            .limit(1)
+            .lateral("current_billing")
+        )
+        query = select(
+            current.c.paid_day,
+            current.c.expires_day,
+            current.c.price_cents,
+            current.c.price_currency,
+            current.c.period,
+        ).select_from(Server).join(current, true())
+        if owner_telegram_id is not None:
+            query = query.where(Server.owner_telegram_id == owner_telegram_id)
+
+        async with session_scope(self._session_factory) as session:
+            rows = (await session.execute(query)).all()
+        columns = list(zip(*rows)) or [()] * 5
+        return build_book(*columns)
+
+    async def forecast(
+        self, owner_telegram_id: int | None, months: int = FORECAST_MONTHS, today: date | None = None
+    ) -> SpendForecast:
+        book = await self.load_book(owner_telegram_id)
+        return project_renewals(book, today or utc_today(), months)
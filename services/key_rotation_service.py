@@ -0,0 +1,165 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from crypto.secrets import SecretCipher
+from db.models import AppSetting, Server
+
+logger = logging.getLogger(__name__)
+
+ROTATION_CURSOR_KEY = "key_rotation_cursor"
+ROTATION_CHUNK_SIZE = 500
+ROTATION_WORKERS = 4
+
+SecretRow = tuple[uuid.UUID, str]
+
+
+@dataclass
+class RotationReport:
+    scanned: int = 0
+    rotated: int = 0
+    stale: int = 0
+    failed: list[uuid.UUID] = field(default_factory=list)
+
+
+def rotate_secrets(cipher: SecretCipher, rows: list[SecretRow]) -> tuple[list[dict], list[uuid.UUID]]:
+    updates: list[dict] = []
+    failed: list[uuid.UUID] = []
+    for server_id, token in rows:
+        if cipher.is_current(token):
+            continue
+        try:
+            updates.append({"b_id": server_id, "b_old": token, "b_new": cipher.rotate(token)})
+        except ValueError:
+            failed.append(server_id)
+    return updates, failed
+
+
+def verify_secrets(cipher: SecretCipher, rows: list[SecretRow]) -> tuple[int, list[uuid.UUID]]:
+    stale = 0
+    failed: list[uuid.UUID] = []
+    for server_id, token in rows:
+        if cipher.is_current(token):
+            continue
+        try:
+            cipher.decrypt(token)
+        except ValueError:
+            failed.append(server_id)
+        else:
+            stale += 1
+    return stale, failed
+
+
+def _split(rows: list[SecretRow], parts: int) -> list[list[SecretRow]]:
+    size = max(1, -(-len(rows) // parts))
+    return [rows[start : start + size] for start in range(0, len(rows), size)]
+
+
+class KeyRotationService:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        cipher: SecretCipher,
+        chunk_size: int = ROTATION_CHUNK_SIZE,
+        workers: int = ROTATION_WORKERS,
+    ) -> None:
+        self._session_factory = session_factory
+        self._cipher = cipher
+        self._chunk_size = chunk_size
+        self._workers = workers
+
+    async def _load_cursor(self, session: AsyncSession) -> uuid.UUID | None:
+        value = await session.scalar(select(AppSetting.value).where(AppSetting.key == ROTATION_CURSOR_KEY))
+        return uuid.UUID(value) if value else None
+
+    async def _save_cursor(self, session: AsyncSession, cursor: uuid.UUID) -> None:
+        statement = insert(AppSetting).values(key=ROTATION_CURSOR_KEY, value=str(cursor))
+        await session.execute(
+            statement.on_conflict_do_update(index_elements=[AppSetting.key], set_={"value": statement.excluded.value})
+        )
+
+    async def _fetch_chunk(self, session: AsyncSession, after: uuid.UUID | None) -> list[SecretRow]:
+        query = (
+            select(Server.id, Server.secret_encrypted)
+            .where(Server.secret_encrypted.is_not(None))
+            .order_by(Server.id)
+            .limit(self._chunk_size)
+        )
+        if after is not None:
+            query = query.where(Server.id > after)
+        return [tuple(row) for row in (await session.execute(query)).all()]
+
+    async def rotate(self, restart: bool = False) -> RotationReport:
+        report = RotationReport()
+        loop = asyncio.get_running_loop()
+        # Условие на старое значение: если секрет поменяли во время ротации, его не перетираем.
+        write_back = (
+            update(Server.__table__)
+            .where(Server.__table__.c.id == bindparam("b_id"), Server.__table__.c.secret_encrypted == bindparam("b_old"))
+            .values(secret_encrypted=bindparam("b_new"))
+        )
+
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="key-rotation") as executor:
+            async with self._session_factory() as session:
+                cursor = None if restart else await self._load_cursor(session)
+                if cursor is not None:
+                    logger.info("Ротация ключа: продолжаем после %s", cursor)
+
+                while True:
+                    rows = await self._fetch_chunk(session, cursor)
+                    if not rows:
+                        break
+                    results = await asyncio.gather(
+                        *(
+                            loop.run_in_executor(executor, rotate_secrets, self._cipher, part)
+                            for part in _split(rows, self._workers)
+                        )
+                    )
+                    updates = [item for part_updates, _ in results for item in part_updates]
+                    for _, part_failed in results:
+                        report.failed.extend(part_failed)
+
+                    if updates:
+                        await session.execute(write_back, updates)
+                    cursor = rows[-1][0]
+                    await self._save_cursor(session, cursor)
+                    await session.commit()
+
+                    report.scanned += len(rows)
+                    report.rotated += len(updates)
+                    logger.info("Ротация ключа: просмотрено %s, перешифровано %s", report.scanned, report.rotated)
+
+                await session.execute(delete(AppSetting).where(AppSetting.key == ROTATION_CURSOR_KEY))
+                await session.commit()
+        return report
+
+    async def verify(self) -> RotationReport:
+        report = RotationReport()
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="key-verify") as executor:
+            async with self._session_factory() as session:
+                cursor = None
+                while True:
+                    rows = await self._fetch_chunk(session, cursor)
+                    if not rows:
+                        break
+                    results = await asyncio.gather(
+                        *(
+                            loop.run_in_executor(executor, verify_secrets, self._cipher, part)
+                            for part in _split(rows, self._workers)
+                        )
+                    )
+                    report.scanned += len(rows)
+                    for stale, failed in results:
+                        report.stale += stale
+                        report.failed.extend(failed)
+                    cursor = rows[-1][0]
+        return report
@@ -1,16 +1,62 @@
 ﻿from __future__ import annotations
 
-from sqlalchemy import delete, or_, select
+import re
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import joinedload
 
 from db.models import Manual, ManualCategory, ManualTag
+from db.unit_of_work import session_scope
 from services.schemas import ManualCreateSchema
+from services.view_cache import ViewCache
+
+SEARCH_CONFIG = "simple"
+SEARCH_LIMIT = 10
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords=25, MinWords=10, MaxFragments=2"
+
+
+@dataclass
+class ManualSearchHit:
+    id: int
+    title: str
+    snippet: str
+
+
+def build_prefix_tsquery(text: str) -> str | None:
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+async def refresh_search_vectors(session: AsyncSession, manual_ids: Iterable[int]) -> None:
+    ids = list(manual_ids)
+    if not ids:
+        return
+    tags_text = (
+        select(func.string_agg(ManualTag.tag, " "))
+        .where(ManualTag.manual_id == Manual.id)
+        .scalar_subquery()
+    )
+    vector = (
+        func.setweight(func.to_tsvector(SEARCH_CONFIG, Manual.title), "A")
+        .op("||")(func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(tags_text, "")), "B"))
+        .op("||")(func.setweight(func.to_tsvector(SEARCH_CONFIG, Manual.body_markdown), "C"))
+    )
+    await session.execute(
+        update(Manual).where(Manual.id.in_(ids)).values(search_vector=vector).execution_options(synchronize_session=False)
+    )
 
 
 class ManualService:
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], views: ViewCache | None = None) -> None:
         self._session_factory = session_factory
+        self._views = views if views is not None else ViewCache()
 
     async def create_manual(self, payload: ManualCreateSchema) -> Manual:
         manual = Manual(
@@ -20,14 +66,18 @@ class ManualService:
             body_markdown=payload.body_markdown,
             tags=[ManualTag(tag=t) for t in payload.tags],
         )
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             session.add(manual)
+            await session.flush()
+            await refresh_search_vectors(session, [manual.id])
+            await self._views.publish(session, payload.owner_telegram_id)
             await session.commit()
+            self._views.bump(payload.owner_telegram_id)
             await session.refresh(manual)
             return manual
 
     async def list_categories(self, owner_telegram_id: int) -> list[tuple[ManualCategory, int]]:
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             rows = await session.execute(
                 select(Manual.category, Manual.id)
                 .where(Manual.owner_telegram_id == owner_telegram_id)
@@ -42,33 +92,39 @@ class ManualService:
         query = select(Manual).where(Manual.owner_telegram_id == owner_telegram_id).options(joinedload(Manual.tags)).order_by(Manual.updated_at.desc())
         if category:
             query = query.where(Manual.category == category)
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             rows = await session.scalars(query)
             return list(rows.unique().all())
 
-    async def search_manuals(self, owner_telegram_id: int, text: str) -> list[Manual]:
-        like = f"%{text}%"
+    async def search_manuals(self, owner_telegram_id: int, text: str, limit: int = SEARCH_LIMIT) -> list[ManualSearchHit]:
+        raw_query = build_prefix_tsquery(text)
+        if raw_query is None:
+            return []
+        tsquery = func.to_tsquery(SEARCH_CONFIG, raw_query)
+        rank = func.ts_rank(Manual.search_vector, tsquery)
+        top = (
+            select(Manual.id, rank.label("rank"))
+            .where(Manual.owner_telegram_id == owner_telegram_id, Manual.search_vector.op("@@")(tsquery))
+            .order_by(rank.desc(), Manual.updated_at.desc())
+            .limit(limit)
+            .subquery()
+        )
         query = (
-            select(Manual)
-            .outerjoin(ManualTag, ManualTag.manual_id == Manual.id)
-            .where(
-                Manual.owner_telegram_id == owner_telegram_id,
-                or_(
-                    Manual.title.ilike(like),
-                    Manual.body_markdown.ilike(like),
-                    ManualTag.tag.ilike(like),
-                ),
+            select(
+                Manual.id,
+                Manual.title,
+                func.ts_headline(SEARCH_CONFIG, Manual.body_markdown, tsquery, HEADLINE_OPTIONS),
             )
-            .options(joinedload(Manual.tags))
-            .order_by(Manual.updated_at.desc())
+            .join(top, top.c.id == Manual.id)
+            .order_by(top.c.rank.desc(), Manual.updated_at.desc())
         )
 
-        async with self._session_factory() as session:
-            rows = await session.scalars(query)
-            return list(rows.unique().all())
+        async with session_scope(self._session_factory) as session:
+            rows = await session.execute(query)
+            return [ManualSearchHit(id=manual_id, title=title, snippet=snippet) for manual_id, title, snippet in rows.all()]
 
     async def get_manual(self, owner_telegram_id: int, manual_id: int) -> Manual | None:
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             return await session.scalar(
                 select(Manual).where(Manual.id == manual_id, Manual.owner_telegram_id == owner_telegram_id).options(joinedload(Manual.tags))
             )
@@ -82,7 +138,7 @@ class ManualService:
         tags: list[str],
         body_markdown: str,
     ) -> bool:
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             manual = await session.scalar(
                 select(Manual).where(Manual.id == manual_id, Manual.owner_telegram_id == owner_telegram_id).options(joinedload(Manual.tags))
             )
@@ -93,11 +149,17 @@ class ManualService:
             manual.body_markdown = body_markdown
             manual.tags.clear()
             manual.tags.extend(ManualTag(tag=t) for t in tags)
+            await session.flush()
+            await refresh_search_vectors(session, [manual.id])
+            await self._views.publish(session, owner_telegram_id)
             await session.commit()
+            self._views.bump(owner_telegram_id)
             return True
 
     async def delete_manual(self, owner_telegram_id: int, manual_id: int) -> bool:
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             result = await session.execute(delete(Manual).where(Manual.id == manual_id, Manual.owner_telegram_id == owner_telegram_id))
+            await self._views.publish(session, owner_telegram_id)
             await session.commit()
+            self._views.bump(owner_telegram_id)
             return result.rowcount > 0
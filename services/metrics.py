@@ -0,0 +1,151 @@
+﻿from __future__ import annotations
+
+import bisect
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(values: dict[str, str] | None) -> Labels:
+    return tuple(sorted((values or {}).items()))
+
+
+def _format_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    body = ",".join(f'{key}="{_escape(value)}"' for key, value in items)
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    counts: list[int] = field(default_factory=list)
+    total: float = 0.0
+    count: int = 0
+
+    def __post_init__(self) -> None:
+        if not self.counts:
+            self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Линейная интерполяция внутри корзины — как histogram_quantile в Prometheus.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index >= len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+@dataclass
+class MetricSummary:
+    name: str
+    labels: dict[str, str]
+    count: int
+    p50: float
+    p95: float
+    p99: float
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._help: dict[str, tuple[str, str]] = {}
+        self._histograms: dict[str, dict[Labels, Histogram]] = {}
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._gauges: dict[str, Callable[[], float]] = {}
+
+    def _describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help.setdefault(name, (kind, help_text))
+
+    def observe(self, name: str, value: float, labels: dict[str, str] | None = None, help_text: str = "") -> None:
+        with self._lock:
+            self._describe(name, "histogram", help_text)
+            series = self._histograms.setdefault(name, {})
+            key = _labels(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, labels: dict[str, str] | None = None, help_text: str = "") -> None:
+        with self._lock:
+            self._describe(name, "counter", help_text)
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0.0) + amount
+
+    def gauge(self, name: str, read: Callable[[], float], help_text: str = "") -> None:
+        with self._lock:
+            self._describe(name, "gauge", help_text)
+            self._gauges[name] = read
+
+    def counter_value(self, name: str, labels: dict[str, str] | None = None) -> float:
+        return self._counters.get(name, {}).get(_labels(labels), 0.0)
+
+    def counter_total(self, name: str) -> float:
+        return sum(self._counters.get(name, {}).values())
+
+    def gauge_values(self) -> dict[str, float]:
+        return {name: float(read()) for name, read in self._gauges.items()}
+
+    def summaries(self, name: str) -> list[MetricSummary]:
+        with self._lock:
+            series = list(self._histograms.get(name, {}).items())
+        return [
+            MetricSummary(
+                name=name,
+                labels=dict(labels),
+                count=histogram.count,
+                p50=histogram.quantile(0.5),
+                p95=histogram.quantile(0.95),
+                p99=histogram.quantile(0.99),
+            )
+            for labels, histogram in series
+        ]
+
+    def render_prometheus(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                kind, help_text = self._help[name]
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', repr(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+            for name, series in sorted(self._counters.items()):
+                kind, help_text = self._help[name]
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            gauges = sorted(self._gauges.items())
+        for name, read in gauges:
+            kind, help_text = self._help[name]
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {float(read())}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,76 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def build_digest_parts(header: str, lines: Iterable[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[tuple[str, int]]:
+    # Каждое сообщение вместе с числом строк в нём: по нему вызывающий код сопоставляет
+    # сообщение с записями, из которых оно собрано.
+    parts: list[tuple[str, int]] = []
+    current, count = header, 0
+    for line in lines:
+        candidate = f"{current}\n\n{line}"
+        if len(candidate) > limit and count:
+            parts.append((current, count))
+            candidate, count = f"{header}\n\n{line}", 0
+        current = candidate[:limit]
+        count += 1
+    if count:
+        parts.append((current, count))
+    return parts
+
+
+class NotificationSender:
+    def __init__(self, bot: Bot, concurrency: int = 8, max_attempts: int = 3) -> None:
+        self._bot = bot
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._max_attempts = max_attempts
+
+    async def send(self, chat_id: int, text: str) -> bool:
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                await self._bot.send_message(chat_id, text)
+                return True
+            except TelegramRetryAfter as exc:
+                if attempt == self._max_attempts:
+                    break
+                logger.warning("Flood control для chat_id=%s, повтор через %s с", chat_id, exc.retry_after)
+                await asyncio.sleep(exc.retry_after)
+            except TelegramAPIError:
+                logger.exception("Не удалось отправить уведомление chat_id=%s", chat_id)
+                return False
+        logger.error("Уведомление chat_id=%s не отправлено после %s попыток", chat_id, self._max_attempts)
+        return False
+
+    async def _send_chat(self, chat_id: int, texts: list[str]) -> list[bool]:
+        # Сообщения одному получателю уходят по очереди, чтобы не упираться
+        # в лимит Telegram на чат; разные чаты обрабатываются параллельно.
+        async with self._semaphore:
+            return [await self.send(chat_id, text) for text in texts]
+
+    async def send_each(self, messages: Iterable[tuple[int, str]]) -> list[bool]:
+        # Результат по каждому сообщению в порядке входа.
+        messages = list(messages)
+        per_chat: dict[int, list[int]] = defaultdict(list)
+        for index, (chat_id, _) in enumerate(messages):
+            per_chat[chat_id].append(index)
+
+        chat_ids = list(per_chat)
+        results = await asyncio.gather(
+            *(self._send_chat(chat_id, [messages[index][1] for index in per_chat[chat_id]]) for chat_id in chat_ids)
+        )
+        sent = [False] * len(messages)
+        for chat_id, chat_results in zip(chat_ids, results):
+            for index, ok in zip(per_chat[chat_id], chat_results):
+                sent[index] = ok
+        return sent
@@ -1,16 +1,44 @@
 ﻿from __future__ import annotations
 
+import html
 import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
+from db.models import ReminderDelivery
+from db.unit_of_work import session_scope
 from services.access_service import AccessService
-from services.billing_service import BillingService
+from services.billing_service import BillingService, DueReminder
+from services.notification_sender import NotificationSender, build_digest_parts
 
 logger = logging.getLogger(__name__)
 
+REMINDER_DAYS = [14, 7, 3, 1]
+DIGEST_HEADER = "⏰ Напоминание об оплате"
+REMINDER_LOCK_ID = 0x72656D31
+DELIVERY_RETENTION_DAYS = 60
+# Захват без отметки об отправке старше этого срока остался от упавшего процесса.
+CLAIM_TIMEOUT = timedelta(minutes=30)
+
+DeliveryKey = tuple[int, int, int]
+
+_delivery_key = tuple_(ReminderDelivery.billing_id, ReminderDelivery.threshold_days, ReminderDelivery.recipient_id)
+
+
+def format_reminder_line(item: DueReminder) -> str:
+    return (
+        f"🖥 {html.escape(item.server_name)} ({html.escape(item.ip4)})\n"
+        f"📅 {item.expires_at.strftime('%d.%m.%Y')}, осталось дней: {item.days_left}\n"
+        f"💰 {item.price_amount} {html.escape(item.price_currency)}"
+    )
+
 
 class ReminderService:
     def __init__(
@@ -19,45 +47,131 @@ class ReminderService:
         access_service: AccessService,
         billing_service: BillingService,
         notify_hour_utc: int,
+        session_factory: async_sessionmaker[AsyncSession],
+        engine: AsyncEngine,
     ) -> None:
         self._bot = bot
         self._access_service = access_service
         self._billing_service = billing_service
         self._notify_hour_utc = notify_hour_utc
+        self._session_factory = session_factory
+        self._engine = engine
+        self._sender = NotificationSender(bot)
         self._scheduler = AsyncIOScheduler(timezone="UTC")
 
     def start(self) -> None:
         trigger = CronTrigger(hour=self._notify_hour_utc, minute=0)
         self._scheduler.add_job(self._run_reminders, trigger=trigger, id="expiry_reminders", replace_existing=True)
+        self._scheduler.add_job(
+            self._refresh_next_expiry,
+            trigger=CronTrigger(hour=0, minute=1),
+            id="next_expiry_refresh",
+            replace_existing=True,
+        )
+        if datetime.now(timezone.utc).hour >= self._notify_hour_utc:
+            # Сегодняшний запуск мог быть пропущен, пока бот был выключен;
+            # журнал доставок не даст отправить напоминания повторно.
+            self._scheduler.add_job(self._run_reminders, id="expiry_reminders_catchup", replace_existing=True)
         self._scheduler.start()
         logger.info("Планировщик напоминаний запущен (UTC %s:00)", self._notify_hour_utc)
 
+    async def _refresh_next_expiry(self) -> None:
+        updated = await self._billing_service.refresh_stale_next_expiry()
+        logger.info("Обновлены ближайшие даты истечения: %s серверов", updated)
+
     async def _run_reminders(self) -> None:
-        due = await self._billing_service.due_notifications([14, 7, 3, 1])
-        if not due:
-            logger.info("Напоминания: записей нет")
-            return
+        async with self._engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            locked = await conn.scalar(select(func.pg_try_advisory_lock(REMINDER_LOCK_ID)))
+            if not locked:
+                logger.info("Напоминания уже рассылает другой экземпляр бота")
+                return
+            try:
+                await self._refresh_next_expiry()
+                await self._deliver_reminders()
+            finally:
+                await conn.scalar(select(func.pg_advisory_unlock(REMINDER_LOCK_ID)))
 
+    async def _deliver_reminders(self) -> None:
         users = await self._access_service.list_whitelist()
         admins = [u.telegram_id for u in users if u.is_admin]
         if not admins:
             logger.warning("Нет админов для отправки уведомлений")
             return
 
-        for server, billing, days_left in due:
-            text = (
-                "⏰ Напоминание об оплате\n"
-                f"Сервер: {server.name}\n"
-                f"IP: {server.ip4}\n"
-                f"Истекает: {billing.expires_at.strftime('%d.%m.%Y')}\n"
-                f"Осталось дней: {days_left}\n"
-                f"Сумма: {billing.price_amount} {billing.price_currency}"
-            )
-            for admin_id in admins:
-                try:
-                    await self._bot.send_message(admin_id, text)
-                except Exception:  # noqa: BLE001
-                    logger.exception("Не удалось отправить уведомление admin_id=%s", admin_id)
+        lines: dict[int, list[str]] = defaultdict(list)
+        claimed: dict[int, list[DeliveryKey]] = defaultdict(list)
+        async for batch in self._billing_service.stream_due_notifications(REMINDER_DAYS):
+            by_key = {(item.billing_id, item.threshold_days): item for item in batch}
+            for billing_id, threshold_days, recipient_id in await self._claim(batch, admins):
+                lines[recipient_id].append(format_reminder_line(by_key[(billing_id, threshold_days)]))
+                claimed[recipient_id].append((billing_id, threshold_days, recipient_id))
+
+        if not lines:
+            logger.info("Напоминания: новых записей нет")
+            await self._prune_deliveries()
+            return
+
+        # Дайджест одного получателя может занять несколько сообщений: отметки ставим
+        # по каждому сообщению, чтобы не повторять уже доставленные части.
+        messages: list[tuple[int, str]] = []
+        message_keys: list[list[DeliveryKey]] = []
+        for recipient_id, recipient_lines in lines.items():
+            keys = claimed[recipient_id]
+            for text, count in build_digest_parts(DIGEST_HEADER, recipient_lines):
+                messages.append((recipient_id, text))
+                message_keys.append(keys[:count])
+                keys = keys[count:]
+
+        sent = await self._sender.send_each(messages)
+        delivered = [key for ok, keys in zip(sent, message_keys) if ok for key in keys]
+        failed = [key for ok, keys in zip(sent, message_keys) if not ok for key in keys]
+        if delivered:
+            await self._mark_sent(delivered)
+        if failed:
+            await self._release(failed)
+        logger.info("Напоминания: доставлено сообщений %s/%s, получателей %s", sum(sent), len(sent), len(lines))
+        await self._prune_deliveries()
+
+    async def _claim(self, batch: list[DueReminder], recipients: list[int]) -> list[DeliveryKey]:
+        rows = [
+            {"billing_id": item.billing_id, "threshold_days": item.threshold_days, "recipient_id": recipient_id}
+            for item in batch
+            for recipient_id in recipients
+        ]
+        if not rows:
+            return []
+        statement = insert(ReminderDelivery).values(rows)
+        # Запись без sent_at, захваченная давно, — процесс упал между захватом и отправкой:
+        # забираем её заново. Отправленные и свежие захваты ON CONFLICT не трогает и не возвращает.
+        statement = statement.on_conflict_do_update(
+            index_elements=[ReminderDelivery.billing_id, ReminderDelivery.threshold_days, ReminderDelivery.recipient_id],
+            set_={"claimed_at": func.now()},
+            where=ReminderDelivery.sent_at.is_(None)
+            & (ReminderDelivery.claimed_at < datetime.now(timezone.utc) - CLAIM_TIMEOUT),
+        ).returning(ReminderDelivery.billing_id, ReminderDelivery.threshold_days, ReminderDelivery.recipient_id)
+        async with session_scope(self._session_factory) as session:
+            result = await session.execute(statement)
+            claimed = [tuple(row) for row in result.all()]
+            await session.commit()
+            return claimed
+
+    async def _mark_sent(self, keys: list[DeliveryKey]) -> None:
+        async with session_scope(self._session_factory) as session:
+            await session.execute(update(ReminderDelivery).where(_delivery_key.in_(keys)).values(sent_at=func.now()))
+            await session.commit()
+
+    async def _release(self, keys: list[DeliveryKey]) -> None:
+        # Неотправленные записи убираем из журнала, чтобы следующий запуск повторил их.
+        async with session_scope(self._session_factory) as session:
+            await session.execute(delete(ReminderDelivery).where(_delivery_key.in_(keys)))
+            await session.commit()
+
+    async def _prune_deliveries(self) -> None:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=DELIVERY_RETENTION_DAYS)
+        async with session_scope(self._session_factory) as session:
+            await session.execute(delete(ReminderDelivery).where(ReminderDelivery.claimed_at < cutoff))
+            await session.commit()
 
     def shutdown(self) -> None:
         if self._scheduler.running:
@@ -3,13 +3,20 @@
 import ipaddress
 import re
 from datetime import date
-from decimal import Decimal, InvalidOperation
-from typing import Literal
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Annotated, Literal
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, StringConstraints, field_validator
 
 from db.models import ManualCategory, SecretType, ServerRole
 
+# Ограничения совпадают с колонками: server_tags.tag/manual_tags.tag — String(50),
+# billings.price_amount — Numeric(12, 2).
+TAG_MAX_LENGTH = 50
+PRICE_MAX = Decimal("9999999999.99")
+
+Tag = Annotated[str, StringConstraints(strip_whitespace=True, to_lower=True, max_length=TAG_MAX_LENGTH)]
+
 
 class ServerCreateSchema(BaseModel):
     owner_telegram_id: int
@@ -23,7 +30,7 @@ class ServerCreateSchema(BaseModel):
     ssh_user: str = Field(min_length=1, max_length=100)
     secret_type: SecretType = SecretType.NONE
     secret_value: str | None = None
-    tags: list[str] = Field(default_factory=list)
+    tags: list[Tag] = Field(default_factory=list)
     notes: str = ""
 
     @field_validator("ip4")
@@ -59,8 +66,7 @@ class ServerCreateSchema(BaseModel):
     def normalize_tags(cls, value: list[str]) -> list[str]:
         seen: set[str] = set()
         result: list[str] = []
-        for raw in value:
-            tag = raw.strip().lower()
+        for tag in value:
             if not tag or tag in seen:
                 continue
             seen.add(tag)
@@ -76,6 +82,11 @@ class ServerCreateSchema(BaseModel):
         return value or None
 
 
+class ServerImportSchema(ServerCreateSchema):
+    is_favorite: bool = False
+    net_notes: str | None = None
+
+
 class BillingCreateSchema(BaseModel):
     server_id: str
     paid_at: date
@@ -95,8 +106,16 @@ class BillingCreateSchema(BaseModel):
                 amount = Decimal(str(value).replace(",", "."))
             except InvalidOperation as exc:
                 raise ValueError("Сумма должна быть числом") from exc
+        if not amount.is_finite():
+            raise ValueError("Сумма должна быть числом")
         if amount < 0:
             raise ValueError("Сумма не может быть отрицательной")
+        # Округляем как PostgreSQL: 9999999999.995 станет 10000000000.00 и не поместится в колонку.
+        # Заведомо большие суммы отсекаем раньше — quantize ограничен точностью контекста.
+        if amount <= PRICE_MAX + 1:
+            amount = amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        if amount > PRICE_MAX:
+            raise ValueError(f"Сумма не может быть больше {PRICE_MAX}")
         return amount
 
     @field_validator("price_currency")
@@ -117,7 +136,7 @@ class ManualCreateSchema(BaseModel):
     owner_telegram_id: int
     title: str = Field(min_length=1, max_length=200)
     category: ManualCategory = ManualCategory.OTHER
-    tags: list[str] = Field(default_factory=list)
+    tags: list[Tag] = Field(default_factory=list)
     body_markdown: str = Field(min_length=1)
 
     @field_validator("tags")
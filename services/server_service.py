@@ -1,21 +1,124 @@
 ﻿from __future__ import annotations
 
+import base64
+import binascii
+import json
 import uuid
-from typing import Iterable
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, Literal
 
-from sqlalchemy import and_, func, or_, select
+from sqlalchemy import and_, func, literal, not_, or_, select, text, true, tuple_
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
 from crypto.secrets import SecretCipher
 from db.models import Billing, SecretType, Server, ServerTag
+from db.unit_of_work import session_scope
+from services.billing_service import apply_to_spending_rollup
+from services.clock import utc_today
 from services.schemas import SearchScope, ServerCreateSchema
+from services.view_cache import ViewCache
+
+CursorDirection = Literal["n", "p"]
+EXACT_COUNT_THRESHOLD = 1000
+
+
+@dataclass
+class ServerPage:
+    items: list[Server]
+    next_cursor: str | None
+    prev_cursor: str | None
+    estimated_total: int | None = None
+
+
+@dataclass
+class BillingBrief:
+    paid_at: date
+    expires_at: date
+    price_amount: Decimal
+    price_currency: str
+
+
+@dataclass
+class ServerDetail:
+    id: uuid.UUID
+    name: str
+    provider: str
+    ip4: str
+    domain: str | None
+    ssh_user: str
+    is_favorite: bool
+    next_expires_at: date | None
+    tags: list[str]
+    latest_billing: BillingBrief | None
+
+
+def server_detail_query(owner_telegram_id: int, server_id: uuid.UUID):
+    # Карточка собирается одним запросом: теги — массивом из коррелированного подзапроса,
+    # последняя оплата — через LATERAL по (server_id, paid_at, id), без декартова
+    # произведения тегов на оплаты.
+    tags = (
+        select(func.array_agg(aggregate_order_by(ServerTag.tag, ServerTag.tag)))
+        .where(ServerTag.server_id == Server.id)
+        .scalar_subquery()
+    )
+    latest = (
+        select(Billing.paid_at, Billing.expires_at, Billing.price_amount, Billing.price_currency)
+        .where(Billing.server_id == Server.id)
+        .order_by(Billing.paid_at.desc(), Billing.id.desc())
+        .limit(1)
+        .lateral("latest_billing")
+    )
+    return (
+        select(
+            Server.id,
+            Server.name,
+            Server.provider,
+            Server.ip4,
+            Server.domain,
+            Server.ssh_user,
+            Server.is_favorite,
+            Server.next_expires_at,
+            tags.label("tags"),
+            latest.c.paid_at,
+            latest.c.expires_at,
+            latest.c.price_amount,
+            latest.c.price_currency,
+        )
+        .outerjoin(latest, true())
+        .where(Server.id == server_id, Server.owner_telegram_id == owner_telegram_id)
+    )
+
+
+def encode_cursor(direction: CursorDirection, server_id: uuid.UUID) -> str:
+    token = base64.urlsafe_b64encode(server_id.bytes).decode("ascii").rstrip("=")
+    return f"{direction}{token}"
+
+
+def decode_cursor(cursor: str | None) -> tuple[CursorDirection, uuid.UUID] | None:
+    if not cursor or cursor[0] not in ("n", "p"):
+        return None
+    token = cursor[1:]
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        return cursor[0], uuid.UUID(bytes=raw)  # type: ignore[return-value]
+    except (binascii.Error, ValueError):
+        return None
 
 
 class ServerService:
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession], cipher: SecretCipher) -> None:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        cipher: SecretCipher,
+        views: ViewCache | None = None,
+    ) -> None:
         self._session_factory = session_factory
         self._cipher = cipher
+        self._views = views if views is not None else ViewCache()
 
     async def create_server(self, payload: ServerCreateSchema) -> Server:
         encrypted_secret = None
@@ -37,9 +140,11 @@ class ServerService:
             notes=payload.notes,
             tags=[ServerTag(tag=t) for t in payload.tags],
         )
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             session.add(server)
+            await self._views.publish(session, payload.owner_telegram_id)
             await session.commit()
+            self._views.bump(payload.owner_telegram_id)
             await session.refresh(server)
             return server
 
@@ -79,59 +184,189 @@ class ServerService:
             base = base.join(ServerTag).where(ServerTag.tag == tag.lower())
 
         if scope == "expiring_7":
-            sub = (
-                select(Billing.server_id, func.min(Billing.expires_at).label("nearest_expires"))
-                .where(Billing.expires_at >= func.current_date())
-                .group_by(Billing.server_id)
-                .subquery()
-            )
-            base = (
-                base.join(sub, sub.c.server_id == Server.id)
-                .where(func.date_part("day", sub.c.nearest_expires - func.current_date()) <= 7)
-                .where(func.date_part("day", sub.c.nearest_expires - func.current_date()) >= 0)
-            )
+            today = utc_today()
+            base = base.where(Server.next_expires_at >= today, Server.next_expires_at <= today + timedelta(days=7))
 
         count_query = select(func.count()).select_from(base.order_by(None).subquery())
 
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             total = int(await session.scalar(count_query) or 0)
             servers = await session.scalars(base.offset(offset).limit(page_size))
             result = list(servers.unique().all())
             return result, total
 
+    async def list_servers_page(
+        self,
+        owner_telegram_id: int,
+        cursor: str | None = None,
+        page_size: int = 5,
+        with_total: bool = False,
+        favorites_only: bool = False,
+    ) -> ServerPage:
+        base = select(Server).where(Server.owner_telegram_id == owner_telegram_id)
+        if favorites_only:
+            sort_key = (Server.name, Server.id)
+            base = base.where(Server.is_favorite)
+        else:
+            sort_key = (not_(Server.is_favorite), Server.name, Server.id)
+        decoded = decode_cursor(cursor)
+
+        async with session_scope(self._session_factory) as session:
+            anchor = None
+            if decoded is not None:
+                # В курсоре только id: имя до 100 символов не помещается в 64 байта callback_data.
+                # Ключ сортировки якоря достаём по первичному ключу; чужой или удалённый сервер
+                # не найдётся, и список начнётся с первой страницы.
+                anchor = (
+                    await session.execute(
+                        select(*sort_key).where(Server.id == decoded[1], Server.owner_telegram_id == owner_telegram_id)
+                    )
+                ).first()
+
+            if anchor is None:
+                direction: CursorDirection = "n"
+                query = base.order_by(*sort_key)
+            elif decoded[0] == "n":
+                direction = "n"
+                query = base.where(tuple_(*sort_key) > tuple_(*anchor)).order_by(*sort_key)
+            else:
+                direction = "p"
+                query = base.where(tuple_(*sort_key) < tuple_(*anchor)).order_by(*(key.desc() for key in sort_key))
+
+            rows = list(await session.scalars(query.limit(page_size + 1)))
+            has_more = len(rows) > page_size
+            items = rows[:page_size]
+            if direction == "p":
+                items.reverse()
+
+            total = None
+            if with_total and favorites_only:
+                total = int(await session.scalar(select(func.count()).select_from(base.subquery())) or 0)
+            elif with_total:
+                total = await self._estimate_server_count(session, owner_telegram_id)
+
+        if not items:
+            if anchor is not None:
+                return await self.list_servers_page(owner_telegram_id, None, page_size, with_total, favorites_only)
+            return ServerPage(items=[], next_cursor=None, prev_cursor=None, estimated_total=total)
+
+        if direction == "n":
+            next_cursor = encode_cursor("n", items[-1].id) if has_more else None
+            prev_cursor = encode_cursor("p", items[0].id) if anchor is not None else None
+        else:
+            next_cursor = encode_cursor("n", items[-1].id)
+            prev_cursor = encode_cursor("p", items[0].id) if has_more else None
+        return ServerPage(items=items, next_cursor=next_cursor, prev_cursor=prev_cursor, estimated_total=total)
+
+    async def search_servers(self, owner_telegram_id: int, search: str, limit: int = 5) -> list[Server]:
+        search = search.strip()
+        if not search:
+            return []
+        like = f"%{search}%"
+        score = func.greatest(
+            func.similarity(Server.name, search),
+            func.similarity(Server.ip4, search),
+            func.similarity(Server.provider, search),
+            func.word_similarity(search, Server.notes),
+        )
+        query = (
+            select(Server)
+            .where(
+                Server.owner_telegram_id == owner_telegram_id,
+                or_(
+                    Server.name.ilike(like),
+                    Server.ip4.ilike(like),
+                    Server.provider.ilike(like),
+                    Server.notes.ilike(like),
+                    Server.name.op("%")(search),
+                    Server.provider.op("%")(search),
+                    literal(search).op("<%")(Server.notes),
+                ),
+            )
+            .order_by(score.desc(), Server.name)
+            .limit(limit)
+        )
+        async with session_scope(self._session_factory) as session:
+            rows = await session.scalars(query)
+            return list(rows)
+
+    @staticmethod
+    async def _estimate_server_count(session: AsyncSession, owner_telegram_id: int) -> int:
+        # Оценка планировщика не зависит от размера таблицы; точный count
+        # выполняем только когда он заведомо дешёвый.
+        raw = await session.scalar(
+            text("EXPLAIN (FORMAT JSON) SELECT 1 FROM servers WHERE owner_telegram_id = :owner"),
+            {"owner": owner_telegram_id},
+        )
+        plan = json.loads(raw) if isinstance(raw, str) else raw
+        estimate = int(plan[0]["Plan"]["Plan Rows"])
+        if estimate > EXACT_COUNT_THRESHOLD:
+            return estimate
+        exact = await session.scalar(select(func.count()).where(Server.owner_telegram_id == owner_telegram_id))
+        return int(exact or 0)
+
     async def get_server(self, owner_telegram_id: int, server_id: str) -> Server | None:
         try:
             uid = uuid.UUID(server_id)
         except ValueError:
             return None
 
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             server = await session.scalar(
                 select(Server)
                 .where(Server.id == uid, Server.owner_telegram_id == owner_telegram_id)
-                .options(joinedload(Server.tags), joinedload(Server.billings))
+                .options(selectinload(Server.tags), selectinload(Server.billings))
             )
             return server
 
+    async def get_server_detail(self, owner_telegram_id: int, server_id: str) -> ServerDetail | None:
+        try:
+            uid = uuid.UUID(server_id)
+        except ValueError:
+            return None
+
+        async with session_scope(self._session_factory) as session:
+            row = (await session.execute(server_detail_query(owner_telegram_id, uid))).one_or_none()
+        if row is None:
+            return None
+
+        latest_billing = None
+        if row.paid_at is not None:
+            latest_billing = BillingBrief(row.paid_at, row.expires_at, row.price_amount, row.price_currency)
+        return ServerDetail(
+            id=row.id,
+            name=row.name,
+            provider=row.provider,
+            ip4=row.ip4,
+            domain=row.domain,
+            ssh_user=row.ssh_user,
+            is_favorite=row.is_favorite,
+            next_expires_at=row.next_expires_at,
+            tags=list(row.tags or []),
+            latest_billing=latest_billing,
+        )
+
     async def get_server_any_owner(self, server_id: str) -> Server | None:
         try:
             uid = uuid.UUID(server_id)
         except ValueError:
             return None
-        async with self._session_factory() as session:
-            return await session.scalar(select(Server).where(Server.id == uid).options(joinedload(Server.tags), joinedload(Server.billings)))
+        async with session_scope(self._session_factory) as session:
+            return await session.scalar(select(Server).where(Server.id == uid).options(selectinload(Server.tags), selectinload(Server.billings)))
 
     async def toggle_favorite(self, owner_telegram_id: int, server_id: str) -> Server | None:
         try:
             server_uuid = uuid.UUID(server_id)
         except ValueError:
             return None
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             server = await session.scalar(select(Server).where(Server.id == server_uuid, Server.owner_telegram_id == owner_telegram_id))
             if server is None:
                 return None
             server.is_favorite = not server.is_favorite
+            await self._views.publish(session, owner_telegram_id)
             await session.commit()
+            self._views.bump(owner_telegram_id)
             await session.refresh(server)
             return server
 
@@ -140,13 +375,16 @@ class ServerService:
             server_uuid = uuid.UUID(server_id)
         except ValueError:
             return None
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             server = await session.scalar(select(Server).where(Server.id == server_uuid, Server.owner_telegram_id == owner_telegram_id))
             if server is None:
                 return None
             name = server.name
+            await apply_to_spending_rollup(session, Billing.server_id == server_uuid, sign=-1)
             await session.delete(server)
+            await self._views.publish(session, owner_telegram_id)
             await session.commit()
+            self._views.bump(owner_telegram_id)
             return name
 
     async def reveal_secret(self, owner_telegram_id: int, server_id: str) -> str | None:
@@ -154,7 +392,7 @@ class ServerService:
             server_uuid = uuid.UUID(server_id)
         except ValueError:
             return None
-        async with self._session_factory() as session:
+        async with session_scope(self._session_factory) as session:
             server = await session.scalar(select(Server).where(Server.id == server_uuid, Server.owner_telegram_id == owner_telegram_id))
             if server is None or not server.secret_encrypted:
                 return None
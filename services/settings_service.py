@@ -1,33 +1,182 @@
 ﻿from __future__ import annotations
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+import asyncio
+import logging
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from typing import Annotated, Any, Generic, TypeVar
+
+from pydantic import Field, TypeAdapter, ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker
 
 from db.models import AppSetting
+from db.unit_of_work import on_commit, session_scope
 
+logger = logging.getLogger(__name__)
 
-class SettingsService:
-    SECRET_TTL_KEY = "secret_ttl_seconds"
+T = TypeVar("T")
+
+SETTINGS_CHANNEL = "app_settings_changed"
+LISTEN_RECONNECT_SECONDS = 5
+
+
+@dataclass(frozen=True)
+class SettingDefinition(Generic[T]):
+    key: str
+    adapter: TypeAdapter[T]
+
+    def parse(self, raw: str) -> T:
+        return self.adapter.validate_json(raw)
+
+    def validate(self, value: Any) -> T:
+        return self.adapter.validate_python(value)
+
+    def dump(self, value: T) -> str:
+        return self.adapter.dump_json(value).decode("utf-8")
 
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession], default_secret_ttl: int) -> None:
+
+SECRET_TTL = SettingDefinition("secret_ttl_seconds", TypeAdapter(Annotated[int, Field(ge=10, le=300)]))
+
+SETTINGS_REGISTRY: dict[str, SettingDefinition] = {item.key: item for item in (SECRET_TTL,)}
+
+
+class SettingsService:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        engine: AsyncEngine,
+        defaults: Mapping[str, Any],
+    ) -> None:
         self._session_factory = session_factory
-        self._default_secret_ttl = default_secret_ttl
+        self._engine = engine
+        self._defaults = {key: SETTINGS_REGISTRY[key].validate(value) for key, value in defaults.items()}
+        self._values: dict[str, Any] = {}
+        self._listen_connection: AsyncConnection | None = None
+        self._listen_driver: Any = None
+        self._tasks: set[asyncio.Task] = set()
+        self._stopped = False
+        self._subscribers: dict[str, Callable[[str | None], None]] = {}
 
-    async def get_secret_ttl(self) -> int:
-        async with self._session_factory() as session:
-            setting = await session.scalar(select(AppSetting).where(AppSetting.key == self.SECRET_TTL_KEY))
-            if setting is None:
-                return self._default_secret_ttl
-            try:
-                return int(setting.value)
-            except ValueError:
-                return self._default_secret_ttl
-
-    async def set_secret_ttl(self, ttl_seconds: int) -> None:
-        async with self._session_factory() as session:
-            setting = await session.scalar(select(AppSetting).where(AppSetting.key == self.SECRET_TTL_KEY))
-            if setting is None:
-                session.add(AppSetting(key=self.SECRET_TTL_KEY, value=str(ttl_seconds)))
-            else:
-                setting.value = str(ttl_seconds)
+    def get(self, definition: SettingDefinition[T]) -> T:
+        if definition.key in self._values:
+            return self._values[definition.key]
+        return self._defaults[definition.key]
+
+    def _store(self, key: str, raw: str | None) -> None:
+        definition = SETTINGS_REGISTRY.get(key)
+        if definition is None:
+            return
+        if raw is None:
+            self._values.pop(key, None)
+            return
+        try:
+            self._values[key] = definition.parse(raw)
+        except ValidationError:
+            logger.warning("Настройка %s: некорректное значение в БД, используется значение по умолчанию", key)
+            self._values.pop(key, None)
+
+    async def warm(self) -> None:
+        async with session_scope(self._session_factory) as session:
+            rows = (
+                await session.execute(
+                    select(AppSetting.key, AppSetting.value).where(AppSetting.key.in_(SETTINGS_REGISTRY.keys()))
+                )
+            ).all()
+        self._values.clear()
+        for key, raw in rows:
+            self._store(key, raw)
+
+    async def reload(self, key: str) -> None:
+        if key not in SETTINGS_REGISTRY:
+            return
+        async with session_scope(self._session_factory) as session:
+            raw = await session.scalar(select(AppSetting.value).where(AppSetting.key == key))
+        self._store(key, raw)
+
+    async def set(self, definition: SettingDefinition[T], value: Any) -> T:
+        typed = definition.validate(value)
+        statement = insert(AppSetting).values(key=definition.key, value=definition.dump(typed))
+        async with session_scope(self._session_factory) as session:
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[AppSetting.key],
+                    set_={"value": statement.excluded.value, "updated_at": func.now()},
+                )
+            )
+            # NOTIFY доставляется только после COMMIT — другие экземпляры не увидят незафиксированное значение.
+            await session.execute(select(func.pg_notify(SETTINGS_CHANNEL, definition.key)))
             await session.commit()
+
+        def remember() -> None:
+            self._values[definition.key] = typed
+
+        on_commit(remember)
+        return typed
+
+    def subscribe(self, prefix: str, callback: Callable[[str | None], None]) -> None:
+        # Канал настроек переиспользуется для других межпроцессных сигналов: уведомления
+        # с префиксом уходят подписчику без префикса, а после переподключения подписчик
+        # получает None — часть уведомлений могла потеряться.
+        self._subscribers[prefix] = callback
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _on_notify(self, _connection, _pid: int, _channel: str, payload: str) -> None:
+        for prefix, callback in self._subscribers.items():
+            if payload.startswith(prefix):
+                callback(payload.removeprefix(prefix))
+                return
+        self._spawn(self.reload(payload))
+
+    def _on_terminate(self, _connection) -> None:
+        if not self._stopped:
+            logger.warning("Настройки: LISTEN-соединение потеряно, переподключение")
+            self._listen_connection = None
+            self._listen_driver = None
+            self._spawn(self._reconnect())
+
+    async def _listen(self) -> None:
+        connection = await self._engine.connect()
+        raw = await connection.get_raw_connection()
+        driver = raw.driver_connection
+        await driver.add_listener(SETTINGS_CHANNEL, self._on_notify)
+        driver.add_termination_listener(self._on_terminate)
+        self._listen_connection = connection
+        self._listen_driver = driver
+
+    async def _reconnect(self) -> None:
+        while not self._stopped:
+            await asyncio.sleep(LISTEN_RECONNECT_SECONDS)
+            try:
+                await self._listen()
+                # Пока соединения не было, уведомления могли потеряться.
+                await self.warm()
+                for callback in self._subscribers.values():
+                    callback(None)
+                return
+            except Exception:  # noqa: BLE001
+                logger.exception("Настройки: не удалось переподключить LISTEN")
+
+    async def start(self) -> None:
+        await self.warm()
+        if self._engine.dialect.driver != "asyncpg":
+            logger.warning("Настройки: LISTEN/NOTIFY доступен только с asyncpg, межпроцессная инвалидация отключена")
+            return
+        await self._listen()
+
+    async def stop(self) -> None:
+        self._stopped = True
+        for task in list(self._tasks):
+            task.cancel()
+        if self._listen_connection is not None:
+            # Соединение вернётся в пул — слушатели снимаем, чтобы не получать чужие уведомления.
+            self._listen_driver.remove_termination_listener(self._on_terminate)
+            await self._listen_driver.remove_listener(SETTINGS_CHANNEL, self._on_notify)
+            await self._listen_connection.close()
+            self._listen_connection = None
+            self._listen_driver = None
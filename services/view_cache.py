@@ -0,0 +1,109 @@
+﻿from __future__ import annotations
+
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from datetime import date
+from typing import Any
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.unit_of_work import on_commit
+from services.cache import TTLCache
+from services.clock import utc_today
+from services.settings_service import SETTINGS_CHANNEL
+
+VIEW_CACHE_TTL_SECONDS = 600
+VIEWS_NOTIFY_PREFIX = "views:"
+
+
+@dataclass(frozen=True)
+class RenderedView:
+    text: str
+    reply_markup: Any = None
+
+
+@dataclass(frozen=True)
+class _Entry:
+    version: int
+    day: date | None
+    view: RenderedView
+
+
+class ViewCache:
+    # Отрисованные экраны владельца живут, пока не изменились его данные: любая запись
+    # в серверы, оплаты или мануалы поднимает версию владельца, и старые экраны
+    # перестают совпадать. Экраны, зависящие от текущей даты, живут до полуночи.
+    # Версии хранятся в памяти процесса; другим воркерам они рассылаются через
+    # LISTEN/NOTIFY канала настроек (broadcast=True).
+    def __init__(
+        self,
+        ttl_seconds: float = VIEW_CACHE_TTL_SECONDS,
+        max_size: int = 10_000,
+        today: Callable[[], date] = utc_today,
+        broadcast: bool = False,
+    ) -> None:
+        self._views: TTLCache[tuple[int, Hashable], _Entry] = TTLCache(ttl_seconds, max_size)
+        self._versions: dict[int, int] = {}
+        self._today = today
+        self._broadcast = broadcast
+
+    def version(self, owner_telegram_id: int) -> int:
+        return self._versions.get(owner_telegram_id, 0)
+
+    def bump(self, owner_telegram_id: int) -> None:
+        on_commit(lambda: self.bump_now(owner_telegram_id))
+
+    def bump_now(self, owner_telegram_id: int) -> None:
+        # Для записей, зафиксированных мимо транзакции апдейта: откат апдейта их не отменит.
+        self._versions[owner_telegram_id] = self.version(owner_telegram_id) + 1
+
+    def clear(self) -> None:
+        on_commit(self._views.clear)
+
+    async def publish(self, session: AsyncSession, owner_telegram_id: int | None) -> None:
+        # Вызывается до COMMIT: NOTIFY уйдёт вместе с транзакцией и пропадёт при её откате.
+        # None — сбросить экраны всех владельцев.
+        if not self._broadcast:
+            return
+        payload = VIEWS_NOTIFY_PREFIX + ("*" if owner_telegram_id is None else str(owner_telegram_id))
+        await session.execute(select(func.pg_notify(SETTINGS_CHANNEL, payload)))
+
+    def on_remote(self, payload: str | None) -> None:
+        # payload=None — уведомления могли потеряться, пока LISTEN-соединения не было.
+        if payload is None or payload == "*":
+            self._views.clear()
+            return
+        try:
+            owner_telegram_id = int(payload)
+        except ValueError:
+            return
+        self.bump_now(owner_telegram_id)
+
+    def get(self, owner_telegram_id: int, key: Hashable) -> RenderedView | None:
+        entry = self._views.get((owner_telegram_id, key))
+        if entry is None:
+            return None
+        if entry.version != self.version(owner_telegram_id) or (entry.day is not None and entry.day != self._today()):
+            self._views.invalidate((owner_telegram_id, key))
+            return None
+        return entry.view
+
+    async def get_or_render(
+        self,
+        owner_telegram_id: int,
+        key: Hashable,
+        render: Callable[[], Awaitable[RenderedView]],
+        daily: bool = False,
+    ) -> RenderedView:
+        cached = self.get(owner_telegram_id, key)
+        if cached is not None:
+            return cached
+
+        # Версию берём до чтения из БД: если запись успеет зафиксироваться во время
+        # отрисовки, экран сохранится под старой версией и сразу окажется устаревшим.
+        version = self.version(owner_telegram_id)
+        day = self._today() if daily else None
+        view = await render()
+        self._views.set((owner_telegram_id, key), _Entry(version, day, view))
+        return view
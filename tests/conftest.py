@@ -0,0 +1,115 @@
+﻿from collections.abc import Iterator
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from db.instrumentation import QueryStats, track_queries
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.calls: list[tuple] = []
+
+    async def __call__(self, *args, **kwargs) -> None:
+        self.calls.append((args, kwargs))
+
+
+class FakeResult:
+    def __init__(self, rows: list) -> None:
+        self._rows = rows
+        self.rowcount = len(rows)
+
+    def all(self) -> list:
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def scalar_one_or_none(self):
+        return self._rows[0] if self._rows else None
+
+
+class FakeSession:
+    def __init__(self, factory: "FakeSessionFactory") -> None:
+        self._factory = factory
+
+    async def __aenter__(self) -> "FakeSession":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+    async def execute(self, statement) -> FakeResult:
+        self._factory.statements.append(statement)
+        return FakeResult(self._factory.next_rows())
+
+    async def scalars(self, statement) -> FakeResult:
+        self._factory.statements.append(statement)
+        return FakeResult(self._factory.next_rows())
+
+    async def scalar(self, statement):
+        self._factory.statements.append(statement)
+        return self._factory.scalar
+
+    def add(self, instance) -> None:
+        self._factory.added.append(instance)
+
+    async def commit(self) -> None:
+        self._factory.commits += 1
+
+    async def rollback(self) -> None:
+        self._factory.rollbacks += 1
+
+
+class FakeSessionFactory:
+    # Сессии без БД: запросы запоминаются, ответы — rows для execute/scalars и scalar для scalar().
+    # Если задан results, каждый следующий execute/scalars забирает из него свой набор строк.
+    def __init__(self) -> None:
+        self.rows: list = []
+        self.results: list[list] = []
+        self.scalar = None
+        self.statements: list = []
+        self.added: list = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def next_rows(self) -> list:
+        return self.results.pop(0) if self.results else self.rows
+
+    @property
+    def queries(self) -> int:
+        return len(self.statements)
+
+    def sql(self, index: int = -1) -> str:
+        return str(self.statements[index].compile(dialect=postgresql.dialect()))
+
+    def __call__(self, **_kwargs) -> FakeSession:
+        return FakeSession(self)
+
+
+@pytest.fixture
+def recorder() -> type[Recorder]:
+    return Recorder
+
+
+@pytest.fixture
+def session_factory() -> FakeSessionFactory:
+    return FakeSessionFactory()
+
+
+@pytest.fixture
+def query_budget():
+    @contextmanager
+    def budget(max_queries: int, max_repeats: int | None = None) -> Iterator[QueryStats]:
+        with track_queries("test") as stats:
+            yield stats
+        assert stats.queries <= max_queries, f"Запросов {stats.queries}, бюджет {max_queries}"
+        if max_repeats is not None:
+            repeated = stats.repeated(max_repeats + 1)
+            assert not repeated, f"Повторяющиеся запросы (N+1): {repeated}"
+
+    return budget
@@ -0,0 +1,49 @@
+﻿from services.access_service import AccessService
+from services.cache import TTLCache
+
+
+def test_ttl_cache_expires_and_evicts(monkeypatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr("services.cache.time.monotonic", lambda: now[0])
+    cache: TTLCache[int, str] = TTLCache(ttl_seconds=10, max_size=2)
+
+    cache.set(1, "a")
+    cache.set(2, "b")
+    cache.set(3, "c")
+    assert cache.get(1) is None
+    assert cache.get(3) == "c"
+
+    now[0] += 11
+    assert cache.get(3) is None
+
+
+async def test_get_role_is_cached(session_factory) -> None:
+    session_factory.scalar = True
+    service = AccessService(session_factory)
+
+    for _ in range(5):
+        role = await service.get_role(42)
+        assert role.allowed and role.is_admin
+    assert await service.is_allowed(42)
+    assert session_factory.queries == 1
+
+
+async def test_whitelist_changes_invalidate_cached_role(session_factory) -> None:
+    service = AccessService(session_factory)
+
+    assert not (await service.get_role(7)).allowed
+    assert not (await service.get_role(7)).allowed
+    assert session_factory.queries == 1
+
+    await service.add_to_whitelist(7)
+    assert [user.telegram_id for user in session_factory.added] == [7]
+    session_factory.scalar = False
+    role = await service.get_role(7)
+    assert role.allowed and not role.is_admin
+    assert session_factory.queries == 3
+
+    session_factory.scalar = None
+    session_factory.rows = [1]
+    assert await service.remove_from_whitelist(7)
+    assert not (await service.get_role(7)).allowed
+    assert session_factory.queries == 5
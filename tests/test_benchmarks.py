@@ -0,0 +1,84 @@
+﻿from sqlalchemy import create_engine, text
+
+from benchmarks.dataset import DatasetSpec, generate
+from benchmarks.runner import BenchCase, BenchResult, build_report, compare, measure, percentile
+from db.instrumentation import instrument_engine
+from services.schemas import ServerCreateSchema
+
+SMALL = DatasetSpec(owners=5, servers=200, billings=1000, manuals=50, seed=7)
+
+
+def test_generator_is_deterministic() -> None:
+    first = generate(SMALL)
+    second = generate(SMALL)
+    assert first.fingerprint() == second.fingerprint()
+    assert first.servers[0]["id"] == second.servers[0]["id"]
+    assert generate(DatasetSpec(owners=5, servers=200, billings=1000, manuals=50, seed=8)).fingerprint() != first.fingerprint()
+
+
+def test_generator_shapes_match_spec_and_schemas() -> None:
+    dataset = generate(SMALL)
+    assert len(dataset.servers) == 200
+    assert len(dataset.billings) == 1000
+    assert len(dataset.manuals) == len(dataset.manual_tags) == 50
+
+    names = {(row["owner_telegram_id"], row["name"]) for row in dataset.servers}
+    assert len(names) == len(dataset.servers)
+    server_ids = {row["id"] for row in dataset.servers}
+    assert all(row["server_id"] in server_ids for row in dataset.billings)
+    assert all(row["expires_at"] > row["paid_at"] for row in dataset.billings)
+
+    for row in dataset.servers[:20]:
+        ServerCreateSchema(**{key: row[key] for key in ("owner_telegram_id", "name", "role", "provider", "ip4", "ssh_user")})
+
+    # У первого владельца заметно больше серверов, чем у последнего.
+    assert len(dataset.servers_of(dataset.owner_ids[0])) > len(dataset.servers_of(dataset.owner_ids[-1]))
+
+
+def test_scaled_spec_keeps_seed_and_owners() -> None:
+    scaled = DatasetSpec().scaled(0.01)
+    assert (scaled.servers, scaled.billings, scaled.manuals) == (100, 1000, 50)
+    assert (scaled.owners, scaled.seed) == (DatasetSpec().owners, DatasetSpec().seed)
+
+
+def test_percentile_uses_nearest_rank() -> None:
+    samples = [float(value) for value in range(1, 101)]
+    assert percentile(samples, 0.5) == 50.0
+    assert percentile(samples, 0.95) == 95.0
+    assert percentile([], 0.95) == 0.0
+
+
+async def test_measure_counts_queries_per_call() -> None:
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    async def two_queries() -> None:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+
+    result = await measure(BenchCase("sqlite.two_queries", two_queries, iterations=10), warmup=1)
+    assert result.iterations == 10
+    assert result.queries_per_call == 2
+    assert result.ops_per_sec > 0
+    assert result.p95_ms >= result.p50_ms
+
+
+def _report(**values) -> dict:
+    base = {"ops_per_sec": 100.0, "p50_ms": 5.0, "p95_ms": 10.0, "queries_per_call": 2.0}
+    return build_report([BenchResult(name="servers.get_server", iterations=50, **{**base, **values})], {"dataset": "x"})
+
+
+def test_compare_flags_regressions_beyond_tolerance() -> None:
+    baseline = _report()
+    assert compare(baseline, _report(ops_per_sec=85.0, p95_ms=11.5)) == []
+
+    regressions = compare(baseline, _report(ops_per_sec=70.0, p95_ms=13.0, queries_per_call=3.0))
+    assert {item.metric for item in regressions} == {"ops_per_sec", "p95_ms", "queries_per_call"}
+    assert "queries_per_call 2 -> 3" in next(item for item in regressions if item.metric == "queries_per_call").describe()
+
+
+def test_compare_ignores_cases_missing_from_baseline() -> None:
+    current = _report()
+    current["results"]["manuals.search_manuals"] = {**current["results"]["servers.get_server"], "ops_per_sec": 1.0}
+    assert compare(_report(), current) == []
@@ -1,6 +1,9 @@
-﻿from cryptography.fernet import Fernet
+﻿import uuid
+
+from cryptography.fernet import Fernet
 
 from crypto.secrets import SecretCipher
+from services.key_rotation_service import rotate_secrets, verify_secrets
 
 
 def test_encrypt_decrypt_roundtrip() -> None:
@@ -11,3 +14,33 @@ def test_encrypt_decrypt_roundtrip() -> None:
     encrypted = cipher.encrypt(secret)
     assert encrypted != secret
     assert cipher.decrypt(encrypted) == secret
+
+
+def test_multi_key_decrypts_old_and_encrypts_with_newest() -> None:
+    old_key = Fernet.generate_key().decode("utf-8")
+    new_key = Fernet.generate_key().decode("utf-8")
+    old_token = SecretCipher(old_key).encrypt("secret")
+
+    cipher = SecretCipher(f"{new_key}, {old_key}")
+
+    assert cipher.decrypt(old_token) == "secret"
+    assert not cipher.is_current(old_token)
+    assert cipher.is_current(cipher.encrypt("secret"))
+    assert SecretCipher(new_key).decrypt(cipher.rotate(old_token)) == "secret"
+
+
+def test_rotate_secrets_skips_current_and_reports_unknown() -> None:
+    old_key = Fernet.generate_key().decode("utf-8")
+    new_key = Fernet.generate_key().decode("utf-8")
+    cipher = SecretCipher(f"{new_key},{old_key}")
+    old_token = SecretCipher(old_key).encrypt("a")
+    current_token = cipher.encrypt("b")
+    foreign_token = SecretCipher(Fernet.generate_key().decode("utf-8")).encrypt("c")
+    ids = [uuid.uuid4() for _ in range(3)]
+
+    updates, failed = rotate_secrets(cipher, list(zip(ids, [old_token, current_token, foreign_token])))
+
+    assert [u["b_id"] for u in updates] == [ids[0]]
+    assert cipher.is_current(updates[0]["b_new"])
+    assert failed == [ids[2]]
+    assert verify_secrets(cipher, list(zip(ids, [old_token, current_token, foreign_token]))) == (1, [ids[2]])
@@ -0,0 +1,69 @@
+﻿import asyncio
+from datetime import datetime, timedelta, timezone
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessages
+
+from services.deletion_scheduler import DeletionScheduler
+
+
+class _FakeBot:
+    def __init__(self, flood_failures: int = 0) -> None:
+        self.flood_failures = flood_failures
+        self.deleted: list[tuple[int, list[int]]] = []
+
+    async def delete_messages(self, chat_id: int, message_ids: list[int]) -> bool:
+        if self.flood_failures:
+            self.flood_failures -= 1
+            raise TelegramRetryAfter(DeleteMessages(chat_id=chat_id, message_ids=message_ids), "Flood control", retry_after=0)
+        self.deleted.append((chat_id, list(message_ids)))
+        return True
+
+
+async def _wait_for(condition) -> None:
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+
+async def test_due_deletions_are_batched_per_chat(session_factory) -> None:
+    bot = _FakeBot()
+    scheduler = DeletionScheduler(bot, session_factory, batch_window_seconds=1.0)
+    await scheduler.start()
+
+    await scheduler.schedule(1, 10, ttl_seconds=0)
+    await scheduler.schedule(1, 11, ttl_seconds=0)
+    await scheduler.schedule(2, 20, ttl_seconds=0)
+    await _wait_for(lambda: scheduler.pending == 0 and len(bot.deleted) >= 2)
+    await scheduler.shutdown()
+
+    assert sorted(bot.deleted) == [(1, [10, 11]), (2, [20])]
+
+
+async def test_overdue_rows_are_replayed_on_start(session_factory) -> None:
+    past = datetime.now(timezone.utc) - timedelta(minutes=5)
+    session_factory.rows = [(5, 50, past), (5, 51, past)]
+    bot = _FakeBot()
+    scheduler = DeletionScheduler(bot, session_factory)
+
+    await scheduler.start()
+    await _wait_for(lambda: bool(bot.deleted))
+    await scheduler.shutdown()
+
+    assert bot.deleted == [(5, [50, 51])]
+
+
+async def test_shutdown_drains_future_deletions_and_retries_flood(session_factory) -> None:
+    bot = _FakeBot(flood_failures=1)
+    scheduler = DeletionScheduler(bot, session_factory)
+    await scheduler.start()
+    await scheduler.schedule(3, 30, ttl_seconds=3600)
+
+    await scheduler.shutdown()
+
+    assert bot.deleted == []
+    assert scheduler.pending == 1
+
+    await scheduler.shutdown()
+    assert bot.deleted == [(3, [30])]
@@ -0,0 +1,44 @@
+﻿import gzip
+import io
+import json
+
+import pytest
+
+from services.export_import_service import ExportWriter
+
+
+async def _write(fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as stream:
+        writer = ExportWriter(stream, fmt)
+        await writer.section("servers")
+        await writer.write("server", [{"name": "a"}, {"name": "b"}])
+        await writer.write("server", [{"name": "c"}])
+        await writer.section("billings")
+        await writer.section("manuals")
+        await writer.write("manual", [{"title": "Заметка"}])
+        await writer.close()
+    return gzip.decompress(buffer.getvalue())
+
+
+async def test_ndjson_export_is_one_record_per_line() -> None:
+    lines = (await _write("ndjson")).decode("utf-8").splitlines()
+
+    records = [json.loads(line) for line in lines]
+    assert [r["type"] for r in records] == ["server", "server", "server", "manual"]
+    assert records[-1]["title"] == "Заметка"
+
+
+async def test_json_export_groups_sections() -> None:
+    payload = json.loads(await _write("json"))
+
+    assert payload == {
+        "servers": [{"name": "a"}, {"name": "b"}, {"name": "c"}],
+        "billings": [],
+        "manuals": [{"title": "Заметка"}],
+    }
+
+
+def test_unknown_format_rejected() -> None:
+    with pytest.raises(ValueError):
+        ExportWriter(io.BytesIO(), "xml")
@@ -0,0 +1,123 @@
+﻿import random
+from collections import defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from dateutil.relativedelta import relativedelta
+
+from bot.handlers.billing_handlers import bill_forecast
+from services.forecast_service import RenewalInterval, build_book, parse_period, project_renewals
+from services.view_cache import ViewCache
+
+PERIODS = ["30d", "1m", "3m", "1y", "2w", "custom", " 90D ", "0d"]
+START = date(2025, 3, 10)
+
+
+def test_parse_period_formats() -> None:
+    assert parse_period("30d") == RenewalInterval(days=30)
+    assert parse_period(" 2W ") == RenewalInterval(days=14)
+    assert parse_period("1m") == RenewalInterval(months=1)
+    assert parse_period("1y") == RenewalInterval(months=12)
+    assert parse_period("45") == RenewalInterval(days=45)
+    assert parse_period("custom") is None
+    assert parse_period("0d") is None
+    assert parse_period(None) is None
+
+
+def _fleet(size: int, seed: int) -> list[tuple[date, date, int, str, str]]:
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(size):
+        expires_at = START + timedelta(days=rng.randint(-60, 240))
+        paid_at = expires_at - timedelta(days=rng.choice([0, 7, 30, 91, 365]))
+        rows.append((paid_at, expires_at, rng.randint(100, 500_000), rng.choice(["RUB", "EUR", "USD"]), rng.choice(PERIODS)))
+    return rows
+
+
+def _naive(rows, months: int) -> tuple[dict, list[int]]:
+    first = date(START.year, START.month, 1)
+    end = first + relativedelta(months=months)
+    totals: dict[tuple[str, int], int] = defaultdict(int)
+    renewals = [0] * months
+    for paid_at, expires_at, cents, currency, period in rows:
+        if expires_at < first or expires_at >= end:
+            continue
+        interval = parse_period(period) or RenewalInterval(days=max((expires_at - paid_at).days, 0))
+        step = 0
+        while True:
+            if interval.months:
+                renewal = expires_at + relativedelta(months=interval.months * step)
+            else:
+                renewal = expires_at + timedelta(days=interval.days * step)
+            if renewal >= end:
+                break
+            bucket = (renewal.year - first.year) * 12 + renewal.month - first.month
+            totals[(currency, bucket)] += cents
+            renewals[bucket] += 1
+            if not interval.months and not interval.days:
+                break
+            step += 1
+    return dict(totals), renewals
+
+
+def test_projection_matches_per_server_reference() -> None:
+    rows = _fleet(2000, seed=3)
+    forecast = project_renewals(build_book(*zip(*rows)), START, 12)
+
+    totals, renewals = _naive(rows, 12)
+    projected = {
+        (currency, column): int(forecast.totals[row, column])
+        for row, currency in enumerate(forecast.currencies)
+        for column in range(12)
+        if forecast.totals[row, column]
+    }
+    assert projected == totals
+    assert forecast.renewals.tolist() == renewals
+    assert forecast.months[0] == date(2025, 3, 1)
+    assert forecast.months[-1] == date(2026, 2, 1)
+
+
+def test_empty_book_projects_empty_months() -> None:
+    forecast = project_renewals(build_book((), (), (), (), ()), START, 3)
+    assert forecast.monthly() == [(date(2025, 3, 1), {}, 0), (date(2025, 4, 1), {}, 0), (date(2025, 5, 1), {}, 0)]
+    assert forecast.by_currency() == {}
+
+
+def test_day_number_columns_match_date_columns() -> None:
+    rows = _fleet(5000, seed=5)
+    epoch = date(1970, 1, 1)
+    # Как из БД: даты — номера дней, суммы — в копейках.
+    columns = (
+        [(row[0] - epoch).days for row in rows],
+        [(row[1] - epoch).days for row in rows],
+        [row[2] for row in rows],
+        [row[3] for row in rows],
+        [row[4] for row in rows],
+    )
+    forecast = project_renewals(build_book(*columns), START, 12)
+    expected = project_renewals(build_book(*zip(*rows)), START, 12)
+
+    assert forecast.currencies == expected.currencies
+    assert forecast.totals.tolist() == expected.totals.tolist()
+    assert forecast.renewals.tolist() == _naive(rows, 12)[1]
+
+
+class _Forecast:
+    async def forecast(self, owner_telegram_id: int, months: int):
+        rows = [(date(2025, 3, 1), date(2025, 3, 20), 150_000, "RUB", "1m"), (date(2025, 3, 1), date(2025, 4, 5), 999, "EUR", "1y")]
+        return project_renewals(build_book(*zip(*rows)), START, months)
+
+
+async def test_forecast_view_lists_months_and_totals(recorder) -> None:
+    query = SimpleNamespace(
+        data="bill:forecast",
+        message=SimpleNamespace(text="💳 Оплаты", reply_markup=None, edit_text=recorder()),
+        answer=recorder(),
+    )
+    await bill_forecast(query, SimpleNamespace(forecast=_Forecast(), views=ViewCache()), user_id=42)
+
+    (text,), _ = query.message.edit_text.calls[0]
+    lines = text.splitlines()
+    assert lines[2] == "03.2025: 1500.00 RUB (1 шт.)"
+    assert lines[3] == "04.2025: 9.99 EUR · 1500.00 RUB (2 шт.)"
+    assert lines[-1] == "Итого: 9.99 EUR · 9000.00 RUB"
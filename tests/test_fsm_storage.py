@@ -0,0 +1,174 @@
+﻿import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from fakeredis import FakeAsyncRedis
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql
+
+from bot.config import Settings
+from bot.fsm_storage import PostgresStorage, build_fsm_storage
+from db.models import FsmState
+from bot.handlers.manual_handlers import manual_add_confirm, manual_add_parse_single
+from bot.states.manual_states import AddManualStates
+
+
+class _JsonStorage(MemoryStorage):
+    # Как Postgres/Redis: данные сохраняются только через JSON.
+    async def set_data(self, key, data) -> None:
+        await super().set_data(key, json.loads(json.dumps(data)))
+
+
+class _Manuals:
+    def __init__(self) -> None:
+        self.created = []
+
+    async def create_manual(self, payload):
+        self.created.append(payload)
+        return SimpleNamespace(id=1)
+
+    async def get_manual(self, owner_telegram_id: int, manual_id: int):
+        return None
+
+
+MANUAL_TEXT = "Название: Перезапуск xray\nКатегория: troubleshoot\nТеги: xray\nТекст (markdown):\nsystemctl restart xray"
+
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+def _settings(**overrides) -> Settings:
+    return Settings(
+        BOT_TOKEN="42:TEST",
+        DATABASE_URL="postgresql+asyncpg://localhost/test",
+        BOT_MASTER_KEY="key",
+        ADMIN_TELEGRAM_ID=1,
+        **overrides,
+    )
+
+
+def _redis_storage() -> BaseStorage:
+    # Настоящая конфигурация RedisStorage, но вместо сервера — fakeredis в памяти процесса.
+    storage = build_fsm_storage(_settings(FSM_STORAGE="redis", FSM_REDIS_URL="redis://localhost:6379/0", FSM_STATE_TTL_SECONDS=900), None)
+    storage.redis = FakeAsyncRedis()
+    return storage
+
+
+def _context(storage: BaseStorage | None = None) -> FSMContext:
+    return FSMContext(storage=storage or _JsonStorage(), key=KEY)
+
+
+@pytest.mark.parametrize("make_storage", [_JsonStorage, _redis_storage], ids=["json", "redis"])
+async def test_manual_preview_survives_json_storage(make_storage, recorder) -> None:
+    state = _context(make_storage())
+    await state.set_state(AddManualStates.input)
+    user = SimpleNamespace(id=42)
+    message = SimpleNamespace(from_user=user, text=MANUAL_TEXT, answer=recorder())
+
+    await manual_add_parse_single(message, state)
+
+    assert await state.get_state() == AddManualStates.preview.state
+
+    manuals = _Manuals()
+    query = SimpleNamespace(
+        from_user=user,
+        message=SimpleNamespace(edit_text=recorder()),
+        answer=recorder(),
+    )
+    await manual_add_confirm(query, state, SimpleNamespace(manuals=manuals), is_admin=False)
+
+    assert [m.title for m in manuals.created] == ["Перезапуск xray"]
+    assert manuals.created[0].owner_telegram_id == 42
+    assert await state.get_state() is None
+
+
+async def test_confirm_without_preview_is_rejected(recorder) -> None:
+    state = _context()
+    manuals = _Manuals()
+    query = SimpleNamespace(from_user=SimpleNamespace(id=42), message=None, answer=recorder())
+
+    await manual_add_confirm(query, state, SimpleNamespace(manuals=manuals), is_admin=False)
+
+    assert manuals.created == []
+    assert query.answer.calls[0][1]["show_alert"] is True
+
+
+def test_postgres_storage_key_includes_destiny() -> None:
+    storage = PostgresStorage(session_factory=None, state_ttl_seconds=60)
+    key = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+    assert storage._key(key) == "fsm:2:3:default"
+
+
+def test_redis_storage_requires_url() -> None:
+    with pytest.raises(ValidationError):
+        _settings(FSM_STORAGE="redis")
+
+
+async def test_redis_storage_expires_state_and_data() -> None:
+    storage = _redis_storage()
+    await storage.set_state(KEY, AddManualStates.preview)
+    await storage.set_data(KEY, {"title": "Перезапуск xray"})
+
+    assert await storage.get_state(KEY) == AddManualStates.preview.state
+    assert await storage.get_data(KEY) == {"title": "Перезапуск xray"}
+    for part in ("state", "data"):
+        assert 0 < await storage.redis.ttl(f"fsm:42:42:default:{part}") <= 900
+
+
+def _sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+async def test_postgres_write_upserts_with_ttl_and_drops_empty_row(session_factory) -> None:
+    storage = PostgresStorage(session_factory, state_ttl_seconds=900)
+    before = datetime.now(timezone.utc)
+
+    await storage.set_state(KEY, AddManualStates.input)
+
+    upsert, cleanup = session_factory.statements
+    assert session_factory.commits == 1
+    assert "ON CONFLICT (key) DO UPDATE SET state = %(param_1)s::VARCHAR, expires_at = %(param_2)s::TIMESTAMP WITH TIME ZONE" in _sql(upsert)
+    params = upsert.compile().params
+    assert params["key"] == "fsm:42:42:default"
+    assert params["state"] == AddManualStates.input.state
+    for expires_at in (params["expires_at"], params["param_2"]):
+        assert timedelta(seconds=900) <= expires_at - before < timedelta(seconds=905)
+
+    # Сброс состояния без данных удаляет строку вместо хранения пустой записи.
+    assert _sql(cleanup) == (
+        "DELETE FROM fsm_states WHERE fsm_states.key = %(key_1)s::VARCHAR AND fsm_states.state IS NULL "
+        "AND fsm_states.data = %(data_1)s::JSONB"
+    )
+    assert cleanup.compile().params == {"key_1": "fsm:42:42:default", "data_1": {}}
+
+
+async def test_postgres_read_ignores_expired_rows(session_factory) -> None:
+    storage = PostgresStorage(session_factory, state_ttl_seconds=900)
+    session_factory.rows = [FsmState(key="fsm:42:42:default", state="s", data={"a": 1})]
+
+    assert await storage.get_state(KEY) == "s"
+    assert await storage.get_data(KEY) == {"a": 1}
+
+    session_factory.rows = []
+    assert await storage.get_data(KEY) == {}
+
+    read = session_factory.statements[0]
+    assert "WHERE fsm_states.key = %(key_1)s::VARCHAR AND fsm_states.expires_at > %(expires_at_1)s::TIMESTAMP WITH TIME ZONE" in _sql(read)
+    assert datetime.now(timezone.utc) - read.compile().params["expires_at_1"] < timedelta(seconds=5)
+
+
+async def test_postgres_eviction_batches_until_short_batch(session_factory) -> None:
+    storage = PostgresStorage(session_factory, state_ttl_seconds=900, eviction_batch_size=2)
+    session_factory.results = [["a", "b"], ["c", "d"], ["e"], ["never"]]
+
+    assert await storage.evict_expired() == 5
+    assert session_factory.queries == 3
+    assert session_factory.commits == 3
+    statement = _sql(session_factory.statements[0])
+    assert "WHERE fsm_states.expires_at <= %(expires_at_1)s::TIMESTAMP WITH TIME ZONE" in statement
+    assert "LIMIT %(param_1)s::INTEGER FOR UPDATE SKIP LOCKED)" in statement
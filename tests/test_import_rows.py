@@ -0,0 +1,101 @@
+﻿import gzip
+import json
+
+import pytest
+from sqlalchemy.exc import DataError
+
+from services.export_import_service import (
+    IMPORT_CHUNK_SIZE,
+    ExportImportService,
+    ImportRowError,
+    _server_rows,
+    read_import_rows,
+    validate_import_rows,
+)
+from services.view_cache import ViewCache
+
+SERVER = {
+    "name": "edge-1",
+    "role": "xray-edge",
+    "provider": "Hetzner",
+    "ip4": "10.0.0.1",
+    "ssh_user": "root",
+    "tags": ["eu"],
+}
+
+
+def test_ndjson_rows_are_grouped_by_type() -> None:
+    lines = [
+        json.dumps({"type": "server", **SERVER}),
+        json.dumps({"type": "billing", "server": "edge-1", "paid_at": "2025-01-01", "expires_at": "2025-02-01", "price_amount": "5"}),
+        "{broken",
+        json.dumps({"type": "invoice"}),
+    ]
+    payload = gzip.compress("\n".join(lines).encode("utf-8"))
+
+    rows, errors = read_import_rows("export.ndjson.gz", payload)
+
+    assert [r.data["name"] for r in rows["server"]] == ["edge-1"]
+    assert rows["billing"][0].data["server"] == "edge-1"
+    assert [e.source for e in errors] == ["строка 3", "строка 4"]
+
+
+def test_json_sections() -> None:
+    payload = json.dumps({"servers": [SERVER], "manuals": [{"title": "T", "body_markdown": "x"}]}).encode("utf-8")
+
+    rows, errors = read_import_rows("export.json", payload)
+
+    assert errors == []
+    assert rows["server"][0].source == "servers[0]"
+    assert rows["manual"][0].data["title"] == "T"
+
+
+def test_csv_splits_tags_and_drops_empty_cells() -> None:
+    payload = "name,role,provider,ip4,ssh_user,domain,tags\nedge-1,bridge,Aeza,10.0.0.2,root,,\"eu, fast\"\n".encode("utf-8")
+
+    rows, _ = read_import_rows("servers.csv", payload)
+
+    data = rows["server"][0].data
+    assert "domain" not in data
+    assert data["tags"] == ["eu", " fast"]
+
+
+def test_invalid_json_document_rejected() -> None:
+    with pytest.raises(ValueError):
+        read_import_rows("export.json", b"[1, 2")
+
+
+def test_batch_validation_reports_bad_rows_and_keeps_good_ones() -> None:
+    rows, _ = read_import_rows(
+        "export.json",
+        json.dumps({"servers": [SERVER, {**SERVER, "name": "edge-2", "ip4": "not-ip"}, {**SERVER, "name": "edge-3"}]}).encode(),
+    )
+    for row in rows["server"]:
+        row.data["owner_telegram_id"] = 42
+    errors: list[ImportRowError] = []
+
+    valid = validate_import_rows(_server_rows, rows["server"], errors)
+
+    assert [item.name for _, item in valid] == ["edge-1", "edge-3"]
+    assert [e.source for e in errors] == ["servers[1]"]
+    assert "ip4" in errors[0].message
+
+
+async def test_database_error_skips_only_its_chunk(session_factory) -> None:
+    lines = [json.dumps({**SERVER, "name": f"edge-{i}"}) for i in range(IMPORT_CHUNK_SIZE + 1)]
+    service = ExportImportService(None, None, session_factory, None, ViewCache())
+    calls = []
+
+    async def import_servers(session, telegram_id, chunk, report) -> None:
+        calls.append(len(chunk))
+        report.servers_created += len(chunk)
+        if len(calls) == 1:
+            raise DataError("INSERT INTO servers", {}, Exception("value too long"))
+
+    service._import_servers = import_servers
+    report = await service.import_bundle(42, "export.ndjson", "\n".join(lines).encode())
+
+    assert calls == [IMPORT_CHUNK_SIZE, 1]
+    assert report.servers_created == 1
+    assert [e.source for e in report.errors] == [f"строка 1 – строка {IMPORT_CHUNK_SIZE}"]
+    assert (session_factory.commits, session_factory.rollbacks) == (1, 1)
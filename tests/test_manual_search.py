@@ -0,0 +1,12 @@
+﻿from services.manual_service import build_prefix_tsquery
+
+
+def test_prefix_tsquery_strips_operators() -> None:
+    assert build_prefix_tsquery("Nginx  reload!") == "nginx:* & reload:*"
+    assert build_prefix_tsquery("a & b | !c") == "a:* & b:* & c:*"
+    assert build_prefix_tsquery("установка ноды") == "установка:* & ноды:*"
+
+
+def test_prefix_tsquery_empty() -> None:
+    assert build_prefix_tsquery("  ") is None
+    assert build_prefix_tsquery("&|!():*") is None
@@ -0,0 +1,108 @@
+﻿import pytest
+from aiogram import Bot, Dispatcher, F
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import CallbackQuery, Update
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.metrics_server import create_metrics_app
+from bot.middlewares.metrics import (
+    API_DURATION,
+    API_RETRY_AFTER,
+    HANDLER_DURATION,
+    HandlerMetricsMiddleware,
+    TelegramApiMetrics,
+)
+from services.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_quantiles_interpolate_within_bucket() -> None:
+    histogram = Histogram(buckets=(0.1, 0.2, 0.4))
+    for value in [0.05] * 50 + [0.15] * 45 + [0.3] * 5:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) == pytest.approx(0.1)
+    assert 0.1 < histogram.quantile(0.95) <= 0.2
+    assert 0.2 < histogram.quantile(0.99) <= 0.4
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_render_prometheus_is_cumulative() -> None:
+    metrics = MetricsRegistry()
+    metrics.observe("latency_seconds", 0.003, labels={"route": 'a"b'}, help_text="Задержка")
+    metrics.observe("latency_seconds", 0.3, labels={"route": 'a"b'})
+    metrics.inc("errors_total", labels={"kind": "x"})
+    metrics.gauge("pool_size", lambda: 5)
+
+    text = metrics.render_prometheus()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{route="a\\"b",le="0.005"} 1' in text
+    assert 'latency_seconds_bucket{route="a\\"b",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{route="a\\"b"} 2' in text
+    assert 'errors_total{kind="x"} 1.0' in text
+    assert "pool_size 5.0" in text
+
+
+def _callback_update(data: str) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": 1,
+            "callback_query": {
+                "id": "q1",
+                "chat_instance": "c",
+                "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+                "data": data,
+            },
+        }
+    )
+
+
+async def test_handler_middleware_labels_by_handler_and_callback_prefix() -> None:
+    metrics = MetricsRegistry()
+    dp = Dispatcher()
+    dp.callback_query.middleware(HandlerMetricsMiddleware(metrics))
+
+    @dp.callback_query(F.data.startswith("vps:card:"))
+    async def vps_card(query: CallbackQuery) -> None:
+        return None
+
+    bot = Bot(token="42:TEST")
+    for server_id in ("1", "2", "3"):
+        await dp.feed_update(bot, _callback_update(f"vps:card:{server_id}"))
+
+    [summary] = metrics.summaries(HANDLER_DURATION)
+    assert summary.count == 3
+    assert summary.labels == {"handler": "test_metrics.vps_card", "route": "vps:card"}
+
+
+async def test_api_middleware_times_calls_and_counts_retry_after() -> None:
+    metrics = MetricsRegistry()
+    middleware = TelegramApiMetrics(metrics)
+    bot = Bot(token="42:TEST")
+    method = SendMessage(chat_id=1, text="hi")
+
+    async def flood(_bot, called_method):
+        raise TelegramRetryAfter(method=called_method, message="Flood control", retry_after=3)
+
+    with pytest.raises(TelegramRetryAfter):
+        await middleware(flood, bot, method)
+
+    assert metrics.counter_value(API_RETRY_AFTER, {"method": "sendMessage"}) == 1
+    [summary] = metrics.summaries(API_DURATION)
+    assert summary.labels == {"method": "sendMessage"}
+    assert summary.count == 1
+
+
+async def test_metrics_endpoint_serves_prometheus_text() -> None:
+    metrics = MetricsRegistry()
+    metrics.gauge("db_pool_checked_out", lambda: 2)
+    client = TestClient(TestServer(create_metrics_app(metrics)))
+    await client.start_server()
+    try:
+        response = await client.get("/metrics")
+        assert response.status == 200
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert "db_pool_checked_out 2.0" in await response.text()
+    finally:
+        await client.close()
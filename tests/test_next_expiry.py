@@ -0,0 +1,61 @@
+﻿import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+from db.models import Billing, Server
+from services.billing_service import BillingService, refresh_next_expiry
+from services.clock import utc_today
+
+
+def _next_billing(column, today):
+    return (
+        select(column)
+        .where(Billing.server_id == Server.id, Billing.expires_at >= today)
+        .order_by(Billing.expires_at.asc(), Billing.id.asc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def _assert_recomputes_both_columns(statement) -> None:
+    # Обе колонки берутся из одной и той же ближайшей будущей оплаты.
+    values = {column.key: value for column, value in statement._values.items()}
+    assert values.keys() == {"next_billing_id", "next_expires_at"}
+    today = utc_today()
+    assert values["next_billing_id"].compare(_next_billing(Billing.id, today))
+    assert values["next_expires_at"].compare(_next_billing(Billing.expires_at, today))
+
+
+async def test_refresh_for_given_servers(session_factory) -> None:
+    server_ids = [uuid.uuid4(), uuid.uuid4()]
+    session_factory.rows = [1, 2]
+
+    assert await refresh_next_expiry(session_factory(), server_ids) == 2
+    assert await refresh_next_expiry(session_factory(), []) == 0
+    assert session_factory.queries == 1
+
+    statement = session_factory.statements[0]
+    _assert_recomputes_both_columns(statement)
+    assert statement.whereclause.compare(Server.id.in_(server_ids))
+
+
+async def test_refresh_without_ids_touches_only_stale_servers(session_factory) -> None:
+    await refresh_next_expiry(session_factory())
+
+    statement = session_factory.statements[0]
+    _assert_recomputes_both_columns(statement)
+    assert statement.whereclause.compare(Server.next_expires_at < utc_today())
+
+
+async def test_list_expiring_returns_nearest_billing_per_server(session_factory) -> None:
+    server = SimpleNamespace(name="edge-1")
+    billing = SimpleNamespace(expires_at=utc_today() + timedelta(days=3))
+    session_factory.rows = [(server, billing)]
+
+    assert await BillingService(session_factory).list_expiring(7, 14) == [(server, billing, 3)]
+
+    # Оплата берётся по next_billing_id, поэтому у сервера не больше одной строки.
+    (join,) = session_factory.statements[0].get_final_froms()
+    assert join.onclause.compare(Billing.id == Server.next_billing_id)
@@ -0,0 +1,130 @@
+﻿from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from services.billing_service import DueReminder, reminder_threshold
+from services.notification_sender import NotificationSender, build_digest_parts
+from services.reminder_service import ReminderService
+
+
+class _FakeBot:
+    def __init__(self, flood_failures: int = 0) -> None:
+        self.flood_failures = flood_failures
+        self.sent: list[tuple[int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        if self.flood_failures:
+            self.flood_failures -= 1
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), "Flood control", retry_after=0)
+        self.sent.append((chat_id, text))
+
+
+def test_digest_splits_by_limit() -> None:
+    lines = [f"line-{i:03d}" for i in range(50)]
+    parts = build_digest_parts("HEAD", lines, limit=100)
+    messages = [text for text, _ in parts]
+
+    assert len(messages) > 1
+    assert all(len(m) <= 100 and m.startswith("HEAD") for m in messages)
+    joined = "\n\n".join(m.removeprefix("HEAD\n\n") for m in messages)
+    assert joined.split("\n\n") == lines
+    assert [count for _, count in parts] == [m.count("line-") for m in messages]
+
+
+def test_digest_empty() -> None:
+    assert build_digest_parts("HEAD", []) == []
+
+
+async def test_sender_retries_after_flood_control() -> None:
+    bot = _FakeBot(flood_failures=2)
+    sender = NotificationSender(bot, concurrency=2, max_attempts=3)
+
+    results = await sender.send_each([(1, "a"), (2, "c"), (1, "b")])
+
+    assert results == [True, True, True]
+    assert sorted(bot.sent) == [(1, "a"), (1, "b"), (2, "c")]
+
+
+async def test_sender_gives_up_after_max_attempts() -> None:
+    bot = _FakeBot(flood_failures=5)
+    sender = NotificationSender(bot, max_attempts=2)
+
+    assert await sender.send(1, "a") is False
+    assert bot.sent == []
+
+
+def test_reminder_threshold_buckets_missed_days() -> None:
+    thresholds = [14, 7, 3, 1]
+    assert reminder_threshold(14, thresholds) == 14
+    assert reminder_threshold(8, thresholds) == 14
+    assert reminder_threshold(7, thresholds) == 7
+    assert reminder_threshold(6, thresholds) == 7
+    assert reminder_threshold(2, thresholds) == 3
+    assert reminder_threshold(0, thresholds) == 1
+
+
+class _Access:
+    async def list_whitelist(self):
+        return [SimpleNamespace(telegram_id=1, is_admin=True), SimpleNamespace(telegram_id=2, is_admin=True)]
+
+
+class _Billing:
+    async def stream_due_notifications(self, thresholds):
+        yield [DueReminder(10, "edge-1", "10.0.0.1", date(2025, 3, 10), 7, 7, Decimal("5.00"), "EUR")]
+
+
+class _Sender:
+    def __init__(self, results):
+        self.results = results
+        self.messages = []
+
+    async def send_each(self, messages):
+        self.messages = list(messages)
+        return self.results
+
+
+async def test_reminder_marks_sent_only_after_delivery(session_factory) -> None:
+    service = ReminderService(None, _Access(), _Billing(), 9, session_factory, engine=None)
+    service._sender = _Sender([True, False])
+    session_factory.results = [[(10, 7, 1), (10, 7, 2)]]
+
+    await service._deliver_reminders()
+
+    claim, mark_sent, release, prune = (session_factory.sql(i) for i in range(4))
+    # Захват не отмечает отправку и забирает заново только зависшие неотправленные записи.
+    assert "sent_at" not in claim.split("ON CONFLICT")[0]
+    assert (
+        "DO UPDATE SET claimed_at = now() WHERE reminder_deliveries.sent_at IS NULL "
+        "AND reminder_deliveries.claimed_at < %(claimed_at_1)s::TIMESTAMP WITH TIME ZONE"
+    ) in claim
+    assert mark_sent.startswith("UPDATE reminder_deliveries SET sent_at=now()")
+    assert session_factory.statements[1].compile().params["param_1"] == [(10, 7, 1)]
+    assert release.startswith("DELETE FROM reminder_deliveries")
+    assert session_factory.statements[2].compile().params["param_1"] == [(10, 7, 2)]
+    assert "reminder_deliveries.claimed_at < " in prune
+
+
+class _LongBilling:
+    async def stream_due_notifications(self, thresholds):
+        yield [
+            DueReminder(i, f"edge-{i}-{'x' * 40}", "10.0.0.1", date(2025, 3, 10), 7, 7, Decimal("5.00"), "EUR")
+            for i in range(1, 61)
+        ]
+
+
+async def test_failed_digest_part_releases_only_its_keys(session_factory) -> None:
+    service = ReminderService(None, _Access(), _LongBilling(), 9, session_factory, engine=None)
+    service._sender = _Sender([True, False])
+    keys = [(i, 7, 1) for i in range(1, 61)]
+    session_factory.results = [keys]
+
+    await service._deliver_reminders()
+
+    first, second = (text for _, text in service._sender.messages)
+    first_count = first.count("🖥")
+    assert first_count + second.count("🖥") == 60
+    assert session_factory.statements[1].compile().params["param_1"] == keys[:first_count]
+    assert session_factory.statements[2].compile().params["param_1"] == keys[first_count:]
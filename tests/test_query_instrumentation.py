@@ -0,0 +1,102 @@
+﻿import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bot.handlers.vps_handlers import PAGE_SIZE, vps_favorites
+from db.instrumentation import instrument_engine, track_queries
+from db.models import Server, ServerRole
+from services.server_service import ServerService
+from services.view_cache import ViewCache
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO items (id, name) VALUES (1, 'a'), (2, 'b'), (3, 'c')"))
+    yield engine
+    engine.dispose()
+
+
+def test_queries_are_attributed_to_current_context(engine) -> None:
+    with track_queries("list") as stats:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT id FROM items")).all()
+            conn.execute(text("SELECT name FROM items WHERE id = :id"), {"id": 1}).all()
+
+    assert stats.queries == 2
+    assert stats.connections == 1
+    assert stats.total_time > 0
+    assert stats.repeated() == []
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1")).all()
+    assert stats.queries == 2
+
+
+def test_repeated_statement_is_flagged(engine) -> None:
+    with track_queries() as stats:
+        with engine.connect() as conn:
+            for item_id in range(6):
+                conn.execute(text("SELECT name FROM items WHERE id = :id"), {"id": item_id}).all()
+
+    assert stats.repeated() == [("SELECT name FROM items WHERE id = ?", 6)]
+
+
+def test_query_budget_fails_when_exceeded(engine, query_budget) -> None:
+    with query_budget(max_queries=1):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1")).all()
+
+    with pytest.raises(AssertionError, match="N\\+1"):
+        with query_budget(max_queries=10, max_repeats=2):
+            with engine.connect() as conn:
+                for item_id in range(3):
+                    conn.execute(text("SELECT name FROM items WHERE id = :id"), {"id": item_id}).all()
+
+
+@pytest.fixture
+async def servers_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'servers.db'}")
+    async with engine.begin() as connection:
+        await connection.run_sync(Server.metadata.create_all, tables=[Server.__table__])
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "owner_telegram_id": 42,
+                "name": f"edge-{i:02d}",
+                "role": ServerRole.OTHER,
+                "ip4": f"10.0.0.{i}",
+                "ssh_user": "root",
+                "is_favorite": True,
+            }
+            for i in range(PAGE_SIZE * 2)
+        ]
+        await connection.execute(insert(Server), rows)
+    instrument_engine(engine)
+    yield engine
+    await engine.dispose()
+
+
+async def test_favorites_handler_pages_within_query_budget(servers_engine, query_budget, recorder) -> None:
+    factory = async_sessionmaker(servers_engine, expire_on_commit=False)
+    services = SimpleNamespace(servers=ServerService(factory, None), views=ViewCache())
+
+    async def tap(data: str):
+        message = SimpleNamespace(text=None, reply_markup=None, edit_text=recorder())
+        await vps_favorites(SimpleNamespace(data=data, message=message, answer=recorder()), services, user_id=42)
+        [(_, kwargs)] = message.edit_text.calls
+        return kwargs["reply_markup"]
+
+    # Первая страница: выборка и подсчёт; следующая — ещё поиск якоря по первичному ключу.
+    with query_budget(max_queries=2, max_repeats=1):
+        markup = await tap("vps:filter:favorites")
+    next_data = markup.inline_keyboard[-2][-1].callback_data
+    with query_budget(max_queries=3, max_repeats=1) as stats:
+        await tap(next_data)
+    assert stats.queries == 3
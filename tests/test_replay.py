@@ -0,0 +1,63 @@
+﻿from types import SimpleNamespace
+
+from aiogram import Bot
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import AnswerCallbackQuery, EditMessageText, SendMessage
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from benchmarks.replay import REPLAY_TOKEN, RecordingSession, manual_search, run_scenario
+from bot.main import build_dispatcher
+from bot.middlewares.metrics import HANDLER_DURATION
+from services.access_service import AccessRole
+from services.manual_service import ManualSearchHit
+from services.metrics import MetricsRegistry
+
+
+async def test_recording_session_answers_like_bot_api() -> None:
+    session = RecordingSession()
+    bot = Bot(token=REPLAY_TOKEN, session=session)
+    markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="ok", callback_data="x")]])
+
+    sent = await bot(SendMessage(chat_id=7, text="hello", reply_markup=markup))
+    assert isinstance(sent, Message)
+    assert session.messages[7][sent.message_id].reply_markup == markup
+
+    edited = await bot(EditMessageText(chat_id=7, message_id=sent.message_id, text="changed"))
+    assert edited.text == "changed"
+    assert edited.reply_markup is None
+    assert await bot(AnswerCallbackQuery(callback_query_id="1")) is True
+    assert [call.method for call in session.calls] == ["sendMessage", "editMessageText", "answerCallbackQuery"]
+
+
+class FakeAccess:
+    async def get_role(self, telegram_id: int) -> AccessRole:
+        return AccessRole(allowed=telegram_id != 666, is_admin=False)
+
+
+class FakeManuals:
+    def __init__(self) -> None:
+        self.queries: list[tuple[int, str]] = []
+
+    async def search_manuals(self, owner_telegram_id: int, text: str) -> list[ManualSearchHit]:
+        self.queries.append((owner_telegram_id, text))
+        return [ManualSearchHit(id=1, title="Nginx", snippet="reload \x02nginx\x03")]
+
+
+async def test_manual_search_scenario_runs_through_real_dispatcher() -> None:
+    manuals = FakeManuals()
+    services = SimpleNamespace(access=FakeAccess(), manuals=manuals, metrics=MetricsRegistry())
+    dp = build_dispatcher(services, MemoryStorage())
+    session = RecordingSession()
+    bot = Bot(token=REPLAY_TOKEN, session=session)
+
+    stats = await run_scenario(dp, bot, session, manual_search, [101, 102, 666], rounds=2)
+
+    summary = stats.summary()
+    assert summary["errors"] == 0
+    # Пользователь вне whitelist не получает меню, поэтому нажимать ему нечего: 2 апдейта за раунд вместо 3.
+    assert summary["updates"] == 2 * 3 * 2 + 2 * 2
+    assert sorted(manuals.queries) == [(101, "docker post"), (101, "nginx"), (102, "docker post"), (102, "nginx")]
+    assert summary["p95_ms"] >= summary["p50_ms"] > 0
+
+    routes = {item.labels["route"] for item in services.metrics.summaries(HANDLER_DURATION)}
+    assert {"manual:search", "SearchManualState:query"} <= routes
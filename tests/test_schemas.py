@@ -1,10 +1,11 @@
 ﻿from datetime import date
+from decimal import Decimal
 
 import pytest
 from pydantic import ValidationError
 
 from db.models import ServerRole, SecretType
-from services.schemas import BillingCreateSchema, ServerCreateSchema
+from services.schemas import BillingCreateSchema, ManualCreateSchema, ServerCreateSchema
 
 
 def test_server_schema_valid() -> None:
@@ -48,3 +49,18 @@ def test_billing_dates_validation() -> None:
             price_currency="RUB",
             period="1m",
         )
+
+
+def test_tags_and_price_fit_columns() -> None:
+    base = dict(owner_telegram_id=1, name="node-1", role=ServerRole.BRIDGE, provider="hetzner", ip4="1.1.1.1", ssh_user="root")
+    assert ServerCreateSchema(**base, tags=[f" {'A' * 50} ", "a" * 50]).tags == ["a" * 50]
+    with pytest.raises(ValidationError):
+        ServerCreateSchema(**base, tags=["a" * 51])
+    with pytest.raises(ValidationError):
+        ManualCreateSchema(owner_telegram_id=1, title="t", body_markdown="b", tags=["a" * 51])
+
+    billing = dict(server_id="00000000-0000-0000-0000-000000000001", paid_at=date(2026, 2, 1), expires_at=date(2026, 3, 1))
+    assert BillingCreateSchema(**billing, price_amount="9999999999,994").price_amount == Decimal("9999999999.99")
+    for amount in ("9999999999.995", "1e12", "NaN", "Infinity"):
+        with pytest.raises(ValidationError):
+            BillingCreateSchema(**billing, price_amount=amount)
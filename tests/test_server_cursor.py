@@ -0,0 +1,149 @@
+﻿import uuid
+
+from sqlalchemy import and_, not_, tuple_
+
+from db.models import Server
+from services.server_service import ServerService, decode_cursor, encode_cursor
+
+
+def test_cursor_roundtrip_fits_callback_data() -> None:
+    server_id = uuid.uuid4()
+    for direction in ("n", "p"):
+        cursor = encode_cursor(direction, server_id)
+        assert decode_cursor(cursor) == (direction, server_id)
+        assert len(f"vps:list:{cursor}".encode("utf-8")) <= 64
+
+
+def test_decode_cursor_rejects_legacy_and_garbage() -> None:
+    assert decode_cursor("") is None
+    assert decode_cursor(None) is None
+    assert decode_cursor("2") is None
+    assert decode_cursor("n!!") is None
+    assert decode_cursor("nAAAA") is None
+
+
+def _same(actual, expected) -> bool:
+    actual, expected = list(actual), list(expected)
+    return len(actual) == len(expected) and all(a.compare(e.expression) for a, e in zip(actual, expected))
+
+
+async def test_favorites_page_filters_and_seeks_from_anchor(session_factory) -> None:
+    anchor_id = uuid.uuid4()
+    rows = [Server(id=uuid.uuid4(), name="edge-2"), Server(id=uuid.uuid4(), name="edge-3")]
+    session_factory.results = [[("edge-1", anchor_id)], rows]
+    service = ServerService(session_factory, None)
+
+    page = await service.list_servers_page(42, encode_cursor("n", anchor_id), page_size=1, favorites_only=True)
+
+    anchor, query = session_factory.statements
+    # Якорь ищется только среди серверов владельца, и ключ сортировки в избранном — без is_favorite.
+    assert _same(anchor.selected_columns, [Server.name, Server.id])
+    assert _same(anchor.whereclause.clauses, [Server.id == anchor_id, Server.owner_telegram_id == 42])
+    # Фильтр по голой колонке совпадает с условием частичного индекса ix_servers_owner_favorites.
+    assert query.whereclause.compare(
+        and_(
+            Server.owner_telegram_id == 42,
+            Server.is_favorite,
+            tuple_(Server.name, Server.id) > tuple_("edge-1", anchor_id),
+        )
+    )
+    assert _same(query._order_by_clauses, [Server.name, Server.id])
+    assert query.compile().params["param_3"] == 2
+
+    assert page.items == rows[:1]
+    assert decode_cursor(page.next_cursor) == ("n", rows[0].id)
+    assert decode_cursor(page.prev_cursor) == ("p", rows[0].id)
+
+
+async def test_favorites_page_backwards_uses_descending_keyset(session_factory) -> None:
+    anchor_id = uuid.uuid4()
+    session_factory.results = [[("edge-5", anchor_id)], [Server(id=uuid.uuid4(), name="edge-4")]]
+
+    await ServerService(session_factory, None).list_servers_page(42, encode_cursor("p", anchor_id), favorites_only=True)
+
+    query = session_factory.statements[1]
+    assert query.whereclause.clauses[-1].compare(tuple_(Server.name, Server.id) < tuple_("edge-5", anchor_id))
+    assert _same(query._order_by_clauses, [Server.name.desc(), Server.id.desc()])
+
+
+SORT_KEY = (not_(Server.is_favorite), Server.name, Server.id)
+
+
+def _servers(*names: str) -> list[Server]:
+    return [Server(id=uuid.uuid4(), name=name, is_favorite=False) for name in names]
+
+
+async def test_first_page_has_no_keyset_and_no_prev(session_factory) -> None:
+    rows = _servers("a", "b", "c")
+    session_factory.results = [rows]
+
+    page = await ServerService(session_factory, None).list_servers_page(42, None, page_size=2)
+
+    (query,) = session_factory.statements
+    assert query.whereclause.compare(Server.owner_telegram_id == 42)
+    assert _same(query._order_by_clauses, SORT_KEY)
+    assert query.compile().params["param_1"] == 3
+    assert page.items == rows[:2]
+    assert decode_cursor(page.next_cursor) == ("n", rows[1].id)
+    assert page.prev_cursor is None
+
+
+async def test_next_page_seeks_after_anchor(session_factory) -> None:
+    anchor_id = uuid.uuid4()
+    rows = _servers("c", "d")
+    session_factory.results = [[(False, "b", anchor_id)], rows]
+
+    page = await ServerService(session_factory, None).list_servers_page(42, encode_cursor("n", anchor_id), page_size=2)
+
+    anchor, query = session_factory.statements
+    assert _same(anchor.selected_columns, SORT_KEY)
+    assert _same(anchor.whereclause.clauses, [Server.id == anchor_id, Server.owner_telegram_id == 42])
+    assert query.whereclause.compare(
+        and_(Server.owner_telegram_id == 42, tuple_(*SORT_KEY) > tuple_(False, "b", anchor_id))
+    )
+    assert _same(query._order_by_clauses, SORT_KEY)
+    assert page.items == rows
+    assert page.next_cursor is None
+    assert decode_cursor(page.prev_cursor) == ("p", rows[0].id)
+
+
+async def test_prev_page_seeks_backwards_and_restores_order(session_factory) -> None:
+    anchor_id = uuid.uuid4()
+    # Назад строки приходят в обратном порядке: ближайшая к якорю первой.
+    rows = _servers("d", "c", "b")
+    session_factory.results = [[(False, "e", anchor_id)], rows]
+
+    page = await ServerService(session_factory, None).list_servers_page(42, encode_cursor("p", anchor_id), page_size=2)
+
+    query = session_factory.statements[1]
+    assert query.whereclause.clauses[-1].compare(tuple_(*SORT_KEY) < tuple_(False, "e", anchor_id))
+    assert _same(query._order_by_clauses, [key.desc() for key in SORT_KEY])
+    assert [server.name for server in page.items] == ["c", "d"]
+    assert decode_cursor(page.next_cursor) == ("n", rows[0].id)
+    assert decode_cursor(page.prev_cursor) == ("p", rows[1].id)
+
+
+async def test_missing_anchor_falls_back_to_first_page(session_factory) -> None:
+    rows = _servers("a")
+    session_factory.results = [[], rows]
+
+    page = await ServerService(session_factory, None).list_servers_page(42, encode_cursor("n", uuid.uuid4()))
+
+    query = session_factory.statements[1]
+    assert query.whereclause.compare(Server.owner_telegram_id == 42)
+    assert _same(query._order_by_clauses, SORT_KEY)
+    assert page.items == rows
+    assert page.next_cursor is None and page.prev_cursor is None
+
+
+async def test_empty_page_after_anchor_restarts_from_first_page(session_factory) -> None:
+    anchor_id = uuid.uuid4()
+    rows = _servers("a")
+    session_factory.results = [[(False, "z", anchor_id)], [], rows]
+
+    page = await ServerService(session_factory, None).list_servers_page(42, encode_cursor("n", anchor_id))
+
+    assert session_factory.queries == 3
+    assert session_factory.statements[2].whereclause.compare(Server.owner_telegram_id == 42)
+    assert page.items == rows
+    assert page.prev_cursor is None
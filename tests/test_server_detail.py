@@ -0,0 +1,60 @@
+﻿import uuid
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from bot.handlers.vps_handlers import vps_delete_cancel
+from services.server_service import BillingBrief, ServerDetail, server_detail_query
+
+
+class _Servers:
+    def __init__(self, detail: ServerDetail | None) -> None:
+        self.detail = detail
+        self.calls: list[tuple[int, str]] = []
+
+    async def get_server_detail(self, owner_telegram_id: int, server_id: str) -> ServerDetail | None:
+        self.calls.append((owner_telegram_id, server_id))
+        return self.detail
+
+
+def test_detail_query_is_single_statement_without_billing_join_fanout() -> None:
+    sql = str(server_detail_query(42, uuid.uuid4()).compile(dialect=postgresql.dialect()))
+    assert sql.count("SELECT") == 3
+    assert "LEFT OUTER JOIN LATERAL" in sql
+    assert "array_agg(server_tags.tag ORDER BY server_tags.tag)" in sql
+    assert "ORDER BY billings.paid_at DESC, billings.id DESC" in sql
+    assert "LIMIT" in sql
+
+
+async def test_delete_cancel_renders_card_from_projection_only(recorder) -> None:
+    server_id = uuid.uuid4()
+    detail = ServerDetail(
+        id=server_id,
+        name="web<1>",
+        provider="hetzner",
+        ip4="192.0.2.1",
+        domain=None,
+        ssh_user="root",
+        is_favorite=False,
+        next_expires_at=date(2025, 2, 1),
+        tags=["prod"],
+        latest_billing=BillingBrief(date(2025, 1, 1), date(2025, 2, 1), Decimal("10.00"), "EUR"),
+    )
+    servers = _Servers(detail)
+    query = SimpleNamespace(
+        data=f"vps:delete_cancel:{server_id}",
+        message=SimpleNamespace(edit_text=recorder()),
+        answer=recorder(),
+    )
+
+    # Сервиса оплат нет: карточке хватает одной проекции.
+    await vps_delete_cancel(query, SimpleNamespace(servers=servers), user_id=42)
+
+    assert servers.calls == [(42, str(server_id))]
+    (text,), _ = query.message.edit_text.calls[0]
+    assert "web&lt;1&gt;" in text
+    assert "10.00 EUR" in text
+    assert "01.02.2025" in text
+    assert query.answer.calls == [(("Отменено",), {})]
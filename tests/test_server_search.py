@@ -0,0 +1,39 @@
+﻿from sqlalchemy.sql.operators import custom_op, desc_op, ilike_op
+
+from db.models import Server
+from services.server_service import ServerService
+
+
+async def test_search_matches_substring_or_trigram_and_ranks_by_similarity(session_factory) -> None:
+    service = ServerService(session_factory, None)
+
+    assert await service.search_servers(42, " edge ", limit=3) == []
+
+    statement = session_factory.statements[0]
+    owner, matches = statement.whereclause.clauses
+    assert owner.compare(Server.owner_telegram_id == 42)
+
+    # Подстрока (ILIKE) и триграммы (%, <%) в одном OR — оба варианта покрыты GIN-индексами pg_trgm.
+    predicates = matches.element.clauses
+    substring = [(p.left.key, p.right.value) for p in predicates if p.operator is ilike_op]
+    assert substring == [(key, "%edge%") for key in ("name", "ip4", "provider", "notes")]
+    trigram = [p for p in predicates if isinstance(p.operator, custom_op)]
+    assert len(substring) + len(trigram) == len(predicates)
+    assert [(p.operator.opstring, p.left.key, p.right.value) for p in trigram[:2]] == [
+        ("%", "name", "edge"),
+        ("%", "provider", "edge"),
+    ]
+    word = trigram[2]
+    assert (word.operator.opstring, word.left.value, word.right.key) == ("<%", "edge", "notes")
+
+    score, name = statement._order_by_clauses
+    assert score.modifier is desc_op
+    assert score.element.name == "greatest"
+    assert [f.name for f in score.element.clauses] == ["similarity"] * 3 + ["word_similarity"]
+    assert name.compare(Server.name.expression)
+    assert session_factory.statements[0].compile().params["param_2"] == 3
+
+
+async def test_blank_search_skips_database(session_factory) -> None:
+    assert await ServerService(session_factory, None).search_servers(42, "   ") == []
+    assert session_factory.queries == 0
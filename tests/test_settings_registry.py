@@ -0,0 +1,40 @@
+﻿import pytest
+from pydantic import ValidationError
+
+from services.settings_service import SECRET_TTL, SettingsService
+
+
+def _service(session_factory) -> SettingsService:
+    return SettingsService(session_factory, engine=None, defaults={SECRET_TTL.key: 45})
+
+
+async def test_warm_cache_serves_reads_without_db(session_factory) -> None:
+    session_factory.rows = [(SECRET_TTL.key, "90")]
+    service = _service(session_factory)
+
+    await service.warm()
+    for _ in range(10):
+        assert service.get(SECRET_TTL) == 90
+    assert session_factory.queries == 1
+
+
+async def test_reload_after_notification_and_default_fallback(session_factory) -> None:
+    service = _service(session_factory)
+    await service.warm()
+    assert service.get(SECRET_TTL) == 45
+
+    session_factory.scalar = "120"
+    await service.reload(SECRET_TTL.key)
+    assert service.get(SECRET_TTL) == 120
+
+    session_factory.scalar = "9999"
+    await service.reload(SECRET_TTL.key)
+    assert service.get(SECRET_TTL) == 45
+
+
+async def test_invalid_value_rejected_before_write(session_factory) -> None:
+    service = _service(session_factory)
+
+    with pytest.raises(ValidationError):
+        await service.set(SECRET_TTL, "5")
+    assert session_factory.queries == 0
@@ -0,0 +1,85 @@
+﻿from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from bot.handlers.billing_handlers import bill_breakdown, bill_trend
+from db.models import Billing
+from services.billing_service import BillingService, apply_to_spending_rollup, month_start, shift_month
+from services.view_cache import ViewCache
+
+
+def test_month_arithmetic_crosses_years() -> None:
+    assert month_start(date(2025, 3, 31)) == date(2025, 3, 1)
+    assert shift_month(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert shift_month(date(2025, 1, 1), -11) == date(2024, 2, 1)
+    assert shift_month(date(2024, 12, 1), 1) == date(2025, 1, 1)
+
+
+async def test_rollup_delta_is_one_upsert_and_prunes_only_on_subtract(session_factory) -> None:
+    session_factory.rows = [7]
+    session = session_factory()
+    await apply_to_spending_rollup(session, Billing.id == 1)
+    assert session_factory.queries == 1
+    upsert = session_factory.sql(0)
+    assert upsert.startswith("INSERT INTO spending_rollups")
+    assert "GROUP BY" in upsert
+    assert "total = (spending_rollups.total + excluded.total)" in upsert
+
+    await apply_to_spending_rollup(session, Billing.id == 1, sign=-1)
+    assert session_factory.sql().startswith("DELETE FROM spending_rollups")
+    assert "spending_rollups.billings_count <= " in session_factory.sql()
+
+
+async def test_trend_reads_rollup_and_fills_empty_months(session_factory) -> None:
+    session_factory.rows = [(date(2025, 3, 1), "EUR", Decimal("10.00")), (date(2025, 3, 1), "RUB", Decimal("500.00"))]
+    service = BillingService(session_factory)
+
+    trend = await service.spending_trend(42, months=3, target_date=date(2025, 3, 15))
+
+    assert [month for month, _ in trend] == [date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)]
+    assert trend[0][1] == {}
+    assert trend[2][1] == {"EUR": Decimal("10.00"), "RUB": Decimal("500.00")}
+    assert session_factory.queries == 1
+    statement = session_factory.sql(0)
+    assert "FROM spending_rollups" in statement
+    assert "billings" not in statement
+
+
+class _Billing:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def spending_trend(self, owner_telegram_id: int, months: int):
+        self.calls += 1
+        return [(date(2025, 2, 1), {}), (date(2025, 3, 1), {"RUB": Decimal("500.00"), "EUR": Decimal("10.00")})]
+
+    async def spending_breakdown(self, owner_telegram_id: int, dimension: str, months: int):
+        self.calls += 1
+        return [("<hetzner>", "EUR", Decimal("10.00")), ("", "RUB", Decimal("500.00"))]
+
+
+def _query(data: str, recorder) -> SimpleNamespace:
+    return SimpleNamespace(
+        data=data,
+        message=SimpleNamespace(text="💳 Оплаты", reply_markup=None, edit_text=recorder()),
+        answer=recorder(),
+    )
+
+
+async def test_billing_menu_views_render_rollup_rows(recorder) -> None:
+    billing = _Billing()
+    services = SimpleNamespace(billing=billing, views=ViewCache())
+
+    query = _query("bill:trend", recorder)
+    await bill_trend(query, services, user_id=42)
+    (text,), _ = query.message.edit_text.calls[0]
+    assert "02.2025: —" in text
+    assert "03.2025: 10.00 EUR · 500.00 RUB" in text
+
+    query = _query("bill:by:provider", recorder)
+    await bill_breakdown(query, services, user_id=42)
+    (text,), _ = query.message.edit_text.calls[0]
+    assert text.splitlines()[2:] == ["💱 EUR", "  &lt;hetzner&gt;: 10.00", "💱 RUB", "  —: 500.00"]
+
+    await bill_trend(_query("bill:trend", recorder), services, user_id=42)
+    assert billing.calls == 2
@@ -0,0 +1,214 @@
+﻿import asyncio
+
+import pytest
+from aiogram.dispatcher.event.handler import HandlerObject
+from sqlalchemy import Column, Integer, MetaData, Table, event, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bot.middlewares.unit_of_work import UnitOfWorkMiddleware
+from db.unit_of_work import current_unit_of_work, on_commit, session_scope, unit_of_work
+
+
+class _Transaction:
+    def __init__(self, log: list[str]) -> None:
+        self._log = log
+        self.is_active = True
+
+    async def commit(self) -> None:
+        self._log.append("commit")
+        self.is_active = False
+
+    async def rollback(self) -> None:
+        self._log.append("rollback")
+        self.is_active = False
+
+
+class _Connection:
+    def __init__(self, log: list[str]) -> None:
+        self._log = log
+
+    async def begin(self) -> _Transaction:
+        self._log.append("begin")
+        return _Transaction(self._log)
+
+    async def close(self) -> None:
+        self._log.append("close")
+
+
+class _Engine:
+    def __init__(self) -> None:
+        self.log: list[str] = []
+        self.connections: list[_Connection] = []
+
+    async def connect(self) -> _Connection:
+        self.log.append("connect")
+        connection = _Connection(self.log)
+        self.connections.append(connection)
+        return connection
+
+
+class _Session:
+    def __init__(self, kwargs: dict) -> None:
+        self.kwargs = kwargs
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+
+class _SessionFactory:
+    def __init__(self) -> None:
+        self.calls: list[dict] = []
+
+    def __call__(self, **kwargs) -> _Session:
+        self.calls.append(kwargs)
+        return _Session(kwargs)
+
+
+async def test_session_scope_without_unit_of_work_opens_own_session() -> None:
+    factory = _SessionFactory()
+    async with session_scope(factory) as session:
+        assert session.kwargs == {}
+    assert current_unit_of_work() is None
+
+
+async def test_service_calls_share_one_connection_and_commit_once() -> None:
+    engine, factory = _Engine(), _SessionFactory()
+    async with unit_of_work(engine):
+        for _ in range(4):
+            async with session_scope(factory):
+                pass
+
+    assert engine.log == ["connect", "begin", "commit", "close"]
+    assert all(call == {"bind": engine.connections[0], "join_transaction_mode": "create_savepoint"} for call in factory.calls)
+    assert len(factory.calls) == 4
+
+
+async def test_unit_of_work_is_lazy_and_rolls_back_on_error() -> None:
+    engine, factory = _Engine(), _SessionFactory()
+    async with unit_of_work(engine):
+        pass
+    assert engine.log == []
+
+    with pytest.raises(RuntimeError):
+        async with unit_of_work(engine):
+            async with session_scope(factory):
+                pass
+            raise RuntimeError
+    assert engine.log == ["connect", "begin", "rollback", "close"]
+
+
+async def test_tasks_outliving_update_do_not_join_closed_unit_of_work() -> None:
+    engine, factory = _Engine(), _SessionFactory()
+    release = asyncio.Event()
+
+    async def background() -> dict:
+        await release.wait()
+        async with session_scope(factory) as session:
+            return session.kwargs
+
+    async with unit_of_work(engine):
+        task = asyncio.create_task(background())
+    release.set()
+    assert await task == {}
+    assert engine.log == []
+
+
+async def test_middleware_wraps_handler_in_unit_of_work() -> None:
+    engine, factory = _Engine(), _SessionFactory()
+
+    async def handler(event, data):
+        assert current_unit_of_work() is not None
+        async with session_scope(factory):
+            pass
+        return "ok"
+
+    assert await UnitOfWorkMiddleware(engine)(handler, object(), {}) == "ok"
+    assert engine.log == ["connect", "begin", "commit", "close"]
+
+
+async def test_on_commit_callbacks_wait_for_commit_and_drop_on_rollback() -> None:
+    engine, factory = _Engine(), _SessionFactory()
+    fired: list[str] = []
+
+    on_commit(lambda: fired.append("immediate"))
+    async with unit_of_work(engine):
+        async with session_scope(factory):
+            on_commit(lambda: fired.append("committed"))
+        assert fired == ["immediate"]
+    assert fired == ["immediate", "committed"]
+
+    with pytest.raises(RuntimeError):
+        async with unit_of_work(engine):
+            on_commit(lambda: fired.append("rolled back"))
+            raise RuntimeError
+    assert fired == ["immediate", "committed"]
+
+
+async def test_handler_flag_skips_unit_of_work() -> None:
+    engine, factory = _Engine(), _SessionFactory()
+
+    async def handler(event, data):
+        assert current_unit_of_work() is None
+        async with session_scope(factory) as session:
+            return session.kwargs
+
+    data = {"handler": HandlerObject(callback=handler, flags={"unit_of_work": False})}
+    assert await UnitOfWorkMiddleware(engine)(handler, object(), data) == {}
+    assert engine.log == []
+
+
+@pytest.fixture
+async def sqlite_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'uow.db'}")
+
+    # pysqlite сам управляет BEGIN и ломает SAVEPOINT — транзакции открываем явно,
+    # как это делает PostgreSQL-драйвер.
+    @event.listens_for(engine.sync_engine, "connect")
+    def _autocommit_driver(dbapi_connection, _record) -> None:
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _explicit_begin(connection) -> None:
+        connection.exec_driver_sql("BEGIN")
+
+    async with engine.begin() as connection:
+        await connection.run_sync(_metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+_metadata = MetaData()
+_items = Table("items", _metadata, Column("id", Integer, primary_key=True))
+
+
+async def _count(engine) -> int:
+    async with engine.connect() as connection:
+        return await connection.scalar(select(func.count()).select_from(_items))
+
+
+async def test_service_commit_releases_only_savepoint_and_failure_keeps_transaction(sqlite_engine) -> None:
+    factory = async_sessionmaker(sqlite_engine, expire_on_commit=False)
+
+    async with unit_of_work(sqlite_engine) as uow:
+        async with session_scope(factory) as session:
+            await session.execute(insert(_items).values(id=1))
+            await session.commit()
+        # commit() сервиса освободил SAVEPOINT: внешняя транзакция жива, снаружи строки не видно.
+        assert uow._transaction.is_active
+        assert await _count(sqlite_engine) == 0
+
+        with pytest.raises(IntegrityError):
+            async with session_scope(factory) as session:
+                await session.execute(insert(_items).values(id=1))
+                await session.commit()
+
+        async with session_scope(factory) as session:
+            await session.execute(insert(_items).values(id=2))
+            await session.commit()
+
+    async with sqlite_engine.connect() as connection:
+        assert (await connection.scalars(select(_items.c.id).order_by(_items.c.id))).all() == [1, 2]
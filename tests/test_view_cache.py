@@ -0,0 +1,133 @@
+﻿from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.handlers.manual_handlers import manual_categories
+from bot.utils import show_view
+from db.models import ManualCategory
+from db.unit_of_work import unit_of_work
+from services.settings_service import SETTINGS_CHANNEL, SettingsService
+from services.view_cache import VIEWS_NOTIFY_PREFIX, RenderedView, ViewCache
+
+
+class _Renderer:
+    def __init__(self) -> None:
+        self.renders = 0
+
+    async def __call__(self) -> RenderedView:
+        self.renders += 1
+        return RenderedView(f"render {self.renders}")
+
+
+async def test_views_are_reused_until_owner_writes() -> None:
+    views, render = ViewCache(), _Renderer()
+
+    assert (await views.get_or_render(1, "vps:list:", render)).text == "render 1"
+    assert (await views.get_or_render(1, "vps:list:", render)).text == "render 1"
+    assert (await views.get_or_render(2, "vps:list:", render)).text == "render 2"
+
+    views.bump(1)
+    assert (await views.get_or_render(1, "vps:list:", render)).text == "render 3"
+    assert (await views.get_or_render(2, "vps:list:", render)).text == "render 2"
+
+
+async def test_bump_now_survives_failed_unit_of_work() -> None:
+    views, render = ViewCache(), _Renderer()
+    await views.get_or_render(1, "vps:list:", render)
+
+    with pytest.raises(RuntimeError):
+        async with unit_of_work(engine=None):
+            views.bump(2)
+            views.bump_now(1)
+            raise RuntimeError
+
+    assert views.version(1) == 1
+    assert views.version(2) == 0
+    assert views.get(1, "vps:list:") is None
+
+
+async def test_owner_bumps_are_broadcast_to_other_workers(session_factory) -> None:
+    writer, reader = ViewCache(broadcast=True), ViewCache()
+    settings = SettingsService(session_factory=None, engine=None, defaults={})
+    settings.subscribe(VIEWS_NOTIFY_PREFIX, reader.on_remote)
+    render = _Renderer()
+    await reader.get_or_render(1, "vps:list:", render)
+    await reader.get_or_render(2, "vps:list:", render)
+
+    session = session_factory()
+    await writer.publish(session, 1)
+    await writer.publish(session, None)
+    first, everyone = session_factory.statements
+    assert list(first.compile().params.values()) == [SETTINGS_CHANNEL, "views:1"]
+    assert list(everyone.compile().params.values()) == [SETTINGS_CHANNEL, "views:*"]
+
+    settings._on_notify(None, 0, SETTINGS_CHANNEL, "views:1")
+    assert reader.version(1) == 1 and reader.get(1, "vps:list:") is None
+    assert reader.get(2, "vps:list:") is not None
+
+    settings._on_notify(None, 0, SETTINGS_CHANNEL, "views:*")
+    assert reader.get(2, "vps:list:") is None
+
+
+async def test_daily_views_expire_at_midnight() -> None:
+    today = [date(2025, 1, 1)]
+    views, render = ViewCache(today=lambda: today[0]), _Renderer()
+
+    await views.get_or_render(1, "bill:summary", render, daily=True)
+    await views.get_or_render(1, "manual:categories", render)
+    today[0] = date(2025, 1, 2)
+
+    assert (await views.get_or_render(1, "bill:summary", render, daily=True)).text == "render 3"
+    assert (await views.get_or_render(1, "manual:categories", render)).text == "render 2"
+
+
+async def test_write_during_render_does_not_leave_stale_view() -> None:
+    views = ViewCache()
+
+    async def racing_render() -> RenderedView:
+        # Запись зафиксировалась, пока экран читался из БД.
+        views.bump(1)
+        return RenderedView("stale")
+
+    assert (await views.get_or_render(1, "vps:list:", racing_render)).text == "stale"
+    assert views.get(1, "vps:list:") is None
+
+
+async def test_show_view_skips_identical_edit(recorder) -> None:
+    markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="⬅ Назад", callback_data="menu:vps")]])
+    view = RenderedView("🖥 a&lt;b&gt;\nПусто", markup)
+    message = SimpleNamespace(text="🖥 a<b>\nПусто", reply_markup=markup.model_copy(deep=True), edit_text=recorder())
+
+    await show_view(message, view)
+    assert message.edit_text.calls == []
+
+    message.reply_markup = None
+    await show_view(message, view)
+    assert message.edit_text.calls == [((view.text,), {"reply_markup": markup})]
+
+
+class _Manuals:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def list_categories(self, owner_telegram_id: int):
+        self.calls += 1
+        return [(ManualCategory.INSTALL, 2)]
+
+
+async def test_repeated_tap_hits_neither_db_nor_bot_api(recorder) -> None:
+    manuals = _Manuals()
+    services = SimpleNamespace(manuals=manuals, views=ViewCache())
+    message = SimpleNamespace(text="📚 База знаний", reply_markup=None, edit_text=recorder())
+    query = SimpleNamespace(data="manual:categories", message=message, answer=recorder())
+
+    await manual_categories(query, services, user_id=42)
+    (_, kwargs), = message.edit_text.calls
+    message.text, message.reply_markup = "Категории:", kwargs["reply_markup"]
+
+    await manual_categories(query, services, user_id=42)
+    assert manuals.calls == 1
+    assert len(message.edit_text.calls) == 1
+    assert len(query.answer.calls) == 2
@@ -0,0 +1,77 @@
+﻿import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+from pydantic import ValidationError
+
+from bot.config import DB_POOL_RESERVE, Settings
+from bot.webhook import create_webhook_app
+from db.session import create_engine
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "ping",
+    },
+}
+
+
+def _settings() -> Settings:
+    return Settings(
+        BOT_TOKEN="42:TEST",
+        DATABASE_URL="postgresql+asyncpg://localhost/test",
+        BOT_MASTER_KEY="key",
+        ADMIN_TELEGRAM_ID=1,
+        BOT_RUN_MODE="webhook",
+        WEBHOOK_SECRET="s3cret",
+        WEBHOOK_MAX_CONCURRENCY=2,
+    )
+
+
+async def test_webhook_feeds_update_and_checks_secret() -> None:
+    settings = _settings()
+    received: list[str] = []
+    dp = Dispatcher()
+
+    @dp.message()
+    async def echo(message: Message) -> None:
+        received.append(message.text or "")
+
+    bot = Bot(token=settings.bot_token)
+    client = TestClient(TestServer(create_webhook_app(dp, bot, settings)))
+    await client.start_server()
+    try:
+        denied = await client.post(settings.webhook_path, json=UPDATE)
+        assert denied.status == 401
+
+        accepted = await client.post(
+            settings.webhook_path,
+            json=UPDATE,
+            headers={"X-Telegram-Bot-Api-Secret-Token": settings.webhook_secret},
+        )
+        assert accepted.status == 200
+        for _ in range(50):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+        assert received == ["ping"]
+    finally:
+        await client.close()
+
+
+def test_db_pool_must_cover_webhook_concurrency() -> None:
+    base = _settings().model_dump(by_alias=True)
+    with pytest.raises(ValidationError):
+        Settings(**{**base, "WEBHOOK_MAX_CONCURRENCY": 50, "DB_POOL_SIZE": 30, "DB_MAX_OVERFLOW": 20})
+    settings = Settings(
+        **{**base, "WEBHOOK_MAX_CONCURRENCY": 50, "DB_POOL_SIZE": 30, "DB_MAX_OVERFLOW": 20 + DB_POOL_RESERVE}
+    )
+
+    pool = create_engine(settings).sync_engine.pool
+    assert (pool.size(), pool._max_overflow) == (30, 20 + DB_POOL_RESERVE)